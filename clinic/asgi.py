@@ -5,6 +5,14 @@ It exposes the ASGI callable as a module-level variable named ``application``.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
+
+Deployment profile (async views such as main, section_stats and dc_all_detail
+run their independent queries concurrently):
+
+    SERVER_MODE=asgi DB_ENGINE=postgresql uvicorn clinic.asgi:application --workers 4
+
+SERVER_MODE=asgi turns off persistent connections, uses the psycopg connection
+pool on PostgreSQL and enables CONCURRENT_QUERIES there.
 """
 
 import os
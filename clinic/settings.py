@@ -10,7 +10,9 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
 from pathlib import Path
+from django.core.exceptions import ImproperlyConfigured
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -42,6 +44,9 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'section.static.StaticFilesMiddleware',
+    'section.performance.PerformanceMiddleware',
+    'section.querycheck.QueryDetectorMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -54,7 +59,8 @@ ROOT_URLCONF = 'clinic.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # همون بک اند جنگو، به علاوه ثبت زمان رندر برای section.performance
+        'BACKEND': 'section.performance.TimedDjangoTemplates',
         'DIRS': [BASE_DIR / "templates"],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -62,6 +68,7 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'section.context_processors.data_version',
             ],
         },
     },
@@ -73,14 +80,139 @@ WSGI_APPLICATION = 'clinic.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+# پروفایل اجرا: SERVER_MODE=wsgi (پیش فرض) یا asgi برای اجرا با uvicorn/daphne روی clinic.asgi:application
+# در asgi اتصال ماندگار بین درخواست ها خاموشه (توصیه جنگو) و به جاش روی PostgreSQL از pool اتصال استفاده میشه
+SERVER_MODE = os.environ.get('SERVER_MODE', 'wsgi')
+ASGI_PROFILE = SERVER_MODE == 'asgi'
+DB_CONN_MAX_AGE = int(os.environ.get('DB_CONN_MAX_AGE', 0 if ASGI_PROFILE else 60))
+
+# DB_ENGINE=sqlite (پیش فرض) یا postgresql؛ اتصال ها بین درخواست ها نگه داشته میشن و قبل از استفاده دوباره بررسی میشن
+DB_ENGINE = os.environ.get('DB_ENGINE', 'sqlite')
+
+if DB_ENGINE == 'postgresql':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ.get('DB_NAME', 'clinic'),
+            'USER': os.environ.get('DB_USER', 'clinic'),
+            'PASSWORD': os.environ.get('DB_PASSWORD', ''),
+            'HOST': os.environ.get('DB_HOST', 'localhost'),
+            'PORT': os.environ.get('DB_PORT', '5432'),
+            'CONN_MAX_AGE': DB_CONN_MAX_AGE,
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {
+                'connect_timeout': int(os.environ.get('DB_CONNECT_TIMEOUT', 5)),
+            },
+        }
     }
+    if ASGI_PROFILE:
+        DATABASES['default']['OPTIONS']['pool'] = {
+            'min_size': int(os.environ.get('DB_POOL_MIN', 2)),
+            'max_size': int(os.environ.get('DB_POOL_MAX', 20)),
+        }
+elif DB_ENGINE == 'sqlite':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.environ.get('DB_NAME', BASE_DIR / 'db.sqlite3'),
+            'CONN_MAX_AGE': DB_CONN_MAX_AGE,
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {
+                # ثانیه های انتظار برای قفل نوشتن قبل از خطای database is locked
+                'timeout': int(os.environ.get('DB_TIMEOUT', 20)),
+            },
+        }
+    }
+else:
+    raise ImproperlyConfigured(f'DB_ENGINE نامعتبر: {DB_ENGINE}')
+
+# اجرای همزمان کوئری های مستقل در ویو های async (section.concurrency)؛ روی SQLite سودی نداره چون نوشتن و GIL سریالی هستن
+CONCURRENT_QUERIES = os.environ.get('CONCURRENT_QUERIES', '1' if ASGI_PROFILE and DB_ENGINE == 'postgresql' else '') == '1'
+CONCURRENT_QUERY_WORKERS = int(os.environ.get('CONCURRENT_QUERY_WORKERS', 8))
+
+# پروفایل همزمانی SQLite (SQLITE_TUNING=1): WAL تا خواندن ها پشت تراکنش های طولانی ورود اکسل نمونن
+# این pragma ها با سیگنال connection_created روی هر اتصال جدید اجرا میشن
+SQLITE_TUNING = os.environ.get('SQLITE_TUNING', '') == '1'
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'mmap_size': int(os.environ.get('SQLITE_MMAP_SIZE', 256 * 1024 * 1024)),
+    # عدد منفی یعنی کیلوبایت
+    'cache_size': -int(os.environ.get('SQLITE_CACHE_KB', 64 * 1024)),
+    'temp_store': 'MEMORY',
+    'busy_timeout': int(os.environ.get('DB_TIMEOUT', 20)) * 1000,
 }
 
 
+# بک اند تحلیل های چندگانه: 'orm' (پیش فرض) یا 'pandas' برای محاسبه برداری روی داده های کش شده گروه
+ANALYTICS_BACKEND = os.environ.get('ANALYTICS_BACKEND', 'orm')
+
+# صفحه بندی کلیدی (بدون OFFSET و COUNT) برای لیست پرونده ها و بیماران، برای گروه های خیلی بزرگ
+KEYSET_PAGINATION = os.environ.get('KEYSET_PAGINATION', '') == '1'
+
+# کش: CACHE_BACKEND=locmem (پیش فرض، جدا برای هر پروسه)، file (مشترک بین worker ها در CACHE_LOCATION)
+# یا مسیر کامل هر بک اند کش جنگو مثل django.core.cache.backends.redis.RedisCache
+CACHE_BACKEND = os.environ.get('CACHE_BACKEND', 'locmem')
+CACHE_BACKENDS = {
+    'locmem': ('django.core.cache.backends.locmem.LocMemCache', 'clinic'),
+    'file': ('django.core.cache.backends.filebased.FileBasedCache', os.path.join(BASE_DIR, 'cache')),
+}
+CACHE_BACKEND_PATH, CACHE_DEFAULT_LOCATION = CACHE_BACKENDS.get(CACHE_BACKEND, (CACHE_BACKEND, ''))
+
+CACHES = {
+    'default': {
+        'BACKEND': CACHE_BACKEND_PATH,
+        'LOCATION': os.environ.get('CACHE_LOCATION', CACHE_DEFAULT_LOCATION),
+        'TIMEOUT': int(os.environ.get('CACHE_TIMEOUT', 60 * 60)),
+        'KEY_PREFIX': 'clinic',
+    }
+}
+if CACHE_BACKEND in CACHE_BACKENDS:
+    CACHES['default']['OPTIONS'] = {'MAX_ENTRIES': int(os.environ.get('CACHE_MAX_ENTRIES', 5000))}
+
+# مدت کش بلوک های {% cache %} قالب ها (ثانیه)؛ کلید ها شامل نسخه داده گروه هستن و با هر تغییر داده عوض میشن
+FRAGMENT_CACHE_TIMEOUT = int(os.environ.get('FRAGMENT_CACHE_TIMEOUT', 60 * 60))
+
+
+# اندازه گیری درخواست ها (section.performance): درصد نمونه برداری، آستانه درخواست کند و اندازه گیری حافظه (tracemalloc، پرهزینه)
+# هدر Server-Timing زمان ها رو به هر کاربری نشون میده، پس بدون DEBUG خاموشه و با PERFORMANCE_SAMPLE_RATE (مثلا 0.01) روشن میشه
+PERFORMANCE_SAMPLE_RATE = float(os.environ.get('PERFORMANCE_SAMPLE_RATE', 1 if DEBUG else 0))
+PERFORMANCE_SLOW_MS = int(os.environ.get('PERFORMANCE_SLOW_MS', 1000))
+PERFORMANCE_TRACE_MEMORY = os.environ.get('PERFORMANCE_TRACE_MEMORY', '') == '1'
+
+# متریک های Prometheus در /metrics (section.metrics)
+# METRICS_DIR: پوشه مشترک worker ها برای جمع متریک همه پروسه ها (هنگام راه اندازی خالی بشه)؛ بدون اون فقط همون پروسه
+# METRICS_TOKEN: توکن Bearer برای scrape بدون ورود؛ بدون اون فقط کاربر staff
+METRICS_ENABLED = os.environ.get('METRICS_ENABLED', '1') == '1'
+METRICS_DIR = os.environ.get('METRICS_DIR', '')
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+
+# پیدا کردن N+1 و کوئری کند (section.querycheck) در توسعه و تست؛ QUERY_DETECTOR خالی (خاموش)، warn یا raise
+# برای کل تست ها: QUERY_DETECTOR=raise python manage.py test
+QUERY_DETECTOR = os.environ.get('QUERY_DETECTOR', '')
+QUERY_REPEAT_THRESHOLD = int(os.environ.get('QUERY_REPEAT_THRESHOLD', 10))
+SLOW_QUERY_MS = int(os.environ.get('SLOW_QUERY_MS', 100))
+QUERY_STACK_DEPTH = 5
+TEST_RUNNER = 'section.querycheck.DetectorTestRunner'
+
+# لاگ ها به جای print روی خروجی استاندارد؛ پیش فرض فقط درخواست های کند (WARNING) از section.performance
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'plain': {'format': '{asctime} {levelname} {name} {message}', 'style': '{'},
+    },
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler', 'formatter': 'plain'},
+    },
+    'loggers': {
+        'section': {
+            'handlers': ['console'],
+            'level': os.environ.get('LOG_LEVEL', 'WARNING'),
+        },
+    },
+}
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -115,18 +247,36 @@ USE_TZ = True
 # Static files (CSS, JavaScript, Images)
 # https://docs.djangoproject.com/en/5.2/howto/static-files/
 
-import os
-
 STATIC_URL = '/static/'
 MEDIA_URL = '/media/'
 
-if DEBUG:
-    STATICFILES_DIRS = [os.path.join(BASE_DIR, 'staticfiles')]
-else:
+# منبع فایل ها در هر دو حالت staticfiles هست تا collectstatic در production هم خروجی static رو بسازه
+STATICFILES_DIRS = [os.path.join(BASE_DIR, 'staticfiles')]
+if not DEBUG:
     STATIC_ROOT = os.path.join(BASE_DIR, 'static')
 
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# STATIC_PIPELINE=1: نام های هش دار با manifest و نسخه .gz فایل های متنی در collectstatic
+# فایل های هش دار با کش یک ساله و بقیه با STATIC_MAX_AGE ثانیه توسط section.static.StaticFilesMiddleware سرو میشن
+STATIC_PIPELINE = os.environ.get('STATIC_PIPELINE', '') == '1'
+STATIC_MAX_AGE = int(os.environ.get('STATIC_MAX_AGE', 60 * 60))
+STORAGES = {
+    'default': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+    },
+    'staticfiles': {
+        'BACKEND': (
+            'section.static.CompressedManifestStaticFilesStorage' if STATIC_PIPELINE
+            else 'django.contrib.staticfiles.storage.StaticFilesStorage'
+        ),
+    },
+}
+
+# ارسال فایل های media به وب سرور: '' (خود جنگو)، x-sendfile (آپاچی) یا x-accel-redirect (nginx با مسیر internal)
+MEDIA_SENDFILE = os.environ.get('MEDIA_SENDFILE', '')
+MEDIA_ACCEL_PREFIX = os.environ.get('MEDIA_ACCEL_PREFIX', '/protected-media/')
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
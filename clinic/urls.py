@@ -16,12 +16,11 @@ Including another URLconf
 """
 from django.contrib import admin
 from django.urls import path, re_path, include
-from django.conf import settings
-from django.views.static import serve
+from section.static import serve_media
 
+# فایل های استاتیک توسط section.static.StaticFilesMiddleware سرو میشن
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('', include('section.urls')),
-    re_path(r'^media/(?P<path>.*)$', serve,{'document_root': settings.MEDIA_ROOT}),
-    re_path(r'^static/(?P<path>.*)$', serve,{'document_root': settings.STATIC_ROOT}),
+    re_path(r'^media/(?P<path>.*)$', serve_media),
 ]
\ No newline at end of file
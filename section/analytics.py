@@ -0,0 +1,357 @@
+import datetime
+from collections import defaultdict
+from django.db.models import Count, Min, Q
+from .models import Doctor, SectionCase, RoomCase, DC
+from .jalali import to_gregorian, persian_month
+
+# سرویس های تحلیلی مشترک بین ویو ها
+# به جای کوئری جداگانه برای هر اتاق و هر پزشک، شمارش ها با یک کوئری تجمیعی انجام میشه
+
+def date_range(start, end):
+    # تبدیل بازه شمسی به میلادی، اگه یکی از دو تاریخ نامعتبر باشه فیلتری اعمال نمیشه
+    start_date = to_gregorian(start) if start else None
+    end_date = to_gregorian(end) if end else None
+    if not (start_date and end_date):
+        return None, None
+    if start_date > end_date:
+        start_date, end_date = end_date, start_date
+    return start_date, end_date
+
+def room_cases_in_range(group, rooms=None, start=None, end=None):
+    cases = RoomCase.objects.filter(group=group)
+    if rooms is not None:
+        cases = cases.filter(room__in=rooms)
+
+    start_date, end_date = date_range(start, end)
+    if start_date and end_date:
+        cases = cases.filter(operation__range=(start_date, end_date))
+    return cases
+
+def room_pivot(group, rooms=None, start=None, end=None):
+    # جدول محوری (اتاق × پزشک × نوع عمل) با یک کوئری تجمیعی
+    cases = room_cases_in_range(group, rooms, start, end)
+
+    pivot = defaultdict(lambda: {
+        'total': 0,
+        'operation_types': defaultdict(int),
+        'doctors': defaultdict(lambda: defaultdict(int)),
+        'patients_count': 0,
+    })
+
+    rows = cases.order_by().values('room', 'doctor', 'operation_type').annotate(count=Count('id'))
+    for row in rows:
+        entry = pivot[row['room']]
+        entry['total'] += row['count']
+        entry['operation_types'][row['operation_type']] += row['count']
+        entry['doctors'][row['doctor']][row['operation_type']] += row['count']
+
+    patients = cases.order_by().values('room').annotate(count=Count('patient', distinct=True))
+    for row in patients:
+        pivot[row['room']]['patients_count'] = row['count']
+
+    return pivot
+
+def room_analysis(group, rooms, start=None, end=None):
+    rooms = list(rooms)
+    pivot = room_pivot(group, rooms, start, end)
+
+    # پزشکان متصل به هر اتاق با یک کوئری روی جدول واسط
+    room_doctors = defaultdict(list)
+    links = Doctor.rooms.through.objects.filter(room__in=rooms).order_by('doctor_id')
+    for room_id, doctor_id, full_name in links.values_list('room_id', 'doctor_id', 'doctor__full_name'):
+        room_doctors[room_id].append((doctor_id, full_name))
+
+    results = {}
+    for room in rooms:
+        entry = pivot.get(room.id) or pivot.default_factory()
+        types = entry['operation_types']
+        results[room.id] = {
+            'room': room,
+            'doctors_count': len(entry['doctors']),
+            'linked_doctors_count': len(room_doctors[room.id]),
+            'patients_count': entry['patients_count'],
+            'filtered_room_cases_count': entry['total'],
+            'filtered_big_room_cases_count': types.get('3', 0),
+            'filtered_medium_room_cases_count': types.get('2', 0),
+            'filtered_small_room_cases_count': types.get('1', 0),
+            'doctor_cases': {
+                full_name: sum(entry['doctors'][doctor_id].values()) if doctor_id in entry['doctors'] else 0
+                for doctor_id, full_name in room_doctors[room.id]
+            },
+        }
+    return results
+
+def surgeon_leaderboard(cases, limit=5, operation_type=None):
+    # شمارش، مرتب سازی و محدود کردن تعداد در خود دیتابیس انجام میشه
+    # در تساوی، پزشکی که پرونده قدیمی تری داره جلو تره
+    if operation_type:
+        cases = cases.filter(operation_type=operation_type)
+    rows = (
+        cases.order_by()
+        .values('doctor', 'doctor__full_name')
+        .annotate(count=Count('id'), first_case=Min('id'))
+        .order_by('-count', 'first_case')[:limit]
+    )
+    return [
+        {'doctor': row['doctor'], 'full_name': row['doctor__full_name'], 'count': row['count']}
+        for row in rows
+    ]
+
+def surgeon_leaderboards(cases, limit=5):
+    # پرکارترین جراحان در کل و به تفکیک نوع عمل (کوچک، متوسط، بزرگ)
+    boards = {'all': surgeon_leaderboard(cases, limit)}
+    for code, name in RoomCase.operation_type_choices:
+        boards[code] = surgeon_leaderboard(cases, limit, operation_type=code)
+    return boards
+
+DEFECT_Q = (
+    Q(defect_sheet__isnull=False) | Q(defect_sheet2__isnull=False) |
+    Q(defect_sheet3__isnull=False) | Q(defect_sheet4__isnull=False) |
+    Q(defect_sheet5__isnull=False) | Q(defect_sheet6__isnull=False) |
+    Q(defect_sheet7__isnull=False) | Q(defect_sheet8__isnull=False) |
+    Q(defect_sheet9__isnull=False) | Q(defect_sheet10__isnull=False)
+)
+
+def month_axis(months):
+    # همه ماه های بین اولین و آخرین ماه، تا نمودار جای خالی نداشته باشه
+    if not months:
+        return []
+    (year, month), last = min(months), max(months)
+    axis = []
+    while (year, month) <= last:
+        axis.append((year, month))
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+    return axis
+
+def monthly_trend(group, section=None, room=None, doctor=None, start=None, end=None):
+    # روند ماهانه (شمسی): هر جدول با یک کوئری group by روی ستون تاریخ میلادی شمرده میشه
+    # و تاریخ ها در پایتون به ماه شمسی تجمیع میشن
+    start_date, end_date = date_range(start, end)
+
+    def scoped(queryset, date_field, **filters):
+        queryset = queryset.filter(group=group, **{f'{date_field}__isnull': False}, **filters)
+        if start_date and end_date:
+            queryset = queryset.filter(**{f'{date_field}__range': (start_date, end_date)})
+        return queryset.order_by().values(date_field)
+
+    series = {}
+    months = set()
+
+    def add(name, date, value):
+        month = persian_month(date)
+        months.add(month)
+        series.setdefault(name, defaultdict(int))[month] += value
+
+    # پرونده های بخش فقط به بخش و پزشک مربوطن، پرونده های اتاق عمل فقط به اتاق و پزشک
+    case_filters = {}
+    if section is not None:
+        case_filters['section'] = section
+    if doctor is not None:
+        case_filters['doctor'] = doctor
+
+    if room is None:
+        rows = scoped(SectionCase.objects, 'admission', **case_filters).annotate(
+            cases=Count('id'),
+            defects=Count('id', filter=DEFECT_Q),
+            not_arrived=Count('id', filter=Q(delivery_date='nan')),
+        )
+        for row in rows:
+            add('admissions', row['admission'], row['cases'])
+            add('defects', row['admission'], row['defects'])
+            add('not_arrived', row['admission'], row['not_arrived'])
+
+        dc_filters = {}
+        if section is not None:
+            dc_filters['hospitalization_section'] = section
+        if doctor is not None:
+            dc_filters['doctor'] = doctor
+        for row in scoped(DC.objects, 'death', **dc_filters).annotate(count=Count('id')):
+            add('deaths', row['death'], row['count'])
+
+    if section is None:
+        room_filters = {}
+        if room is not None:
+            room_filters['room'] = room
+        if doctor is not None:
+            room_filters['doctor'] = doctor
+        rows = scoped(RoomCase.objects, 'operation', **room_filters).values('operation', 'operation_type').annotate(count=Count('id'))
+        for row in rows:
+            add('operations', row['operation'], row['count'])
+            add(f'operations_{row["operation_type"]}', row['operation'], row['count'])
+
+    axis = month_axis(months)
+    data = {'months': [f'{year}/{month:02d}' for year, month in axis]}
+
+    if room is None:
+        for name in ('admissions', 'defects', 'not_arrived', 'deaths'):
+            data[name] = [series.get(name, {}).get(month, 0) for month in axis]
+        data['defect_rate'] = [
+            round(defects / cases * 100, 1) if cases else 0
+            for defects, cases in zip(data['defects'], data['admissions'])
+        ]
+
+    if section is None:
+        data['operations'] = [series.get('operations', {}).get(month, 0) for month in axis]
+        data['operation_types'] = {
+            key: [series.get(f'operations_{key}', {}).get(month, 0) for month in axis]
+            for key in ('1', '2', '3')
+        }
+
+    return data
+
+INSURANCES = {
+    'social_security': 'تامین اجتماعی',
+    'medical_services': 'خدمات درمانی',
+    'armed_forces': 'نیرو های مسلح',
+    'free': 'آزاد',
+}
+
+DEFECT_SHEET_FIELDS = ['defect_sheet'] + [f'defect_sheet{i}' for i in range(2, 11)]
+DEFECT_TYPE_FIELDS = ['defect_type'] + [f'defect_type{i}' for i in range(2, 11)]
+
+def detail_tabs(group, section=None, doctor=None, start=None, end=None):
+    # کوئری های lazy تب های صفحه جزئیات بخش و پزشک
+    # هر تب جدا در دیتابیس صفحه بندی میشه و فقط ردیف های همون صفحه خونده میشن
+    start_date, end_date = date_range(start, end)
+    cases = SectionCase.objects.filter(group=group)
+    deaths = DC.objects.filter(group=group)
+    if section is not None:
+        cases = cases.filter(section=section)
+        deaths = deaths.filter(hospitalization_section=section)
+    if doctor is not None:
+        cases = cases.filter(doctor=doctor)
+        deaths = deaths.filter(doctor=doctor)
+    if start_date and end_date:
+        cases = cases.filter(admission__range=(start_date, end_date))
+        deaths = deaths.filter(admission__range=(start_date, end_date))
+
+    cases = cases.select_related('section', 'doctor', 'representative_doctor', 'patient').order_by('id')
+    deaths = deaths.select_related('doctor', 'hospitalization_section', 'patient').order_by('id')
+    return {
+        'sc': cases,
+        'dc': deaths,
+        'nc': cases.filter(delivery_date='nan'),
+        'defc': cases.filter(DEFECT_Q),
+    }
+
+def tab_counts(tabs):
+    # تعداد ردیف های همه تب ها و کارت های بیمه با دو کوئری aggregate
+    counts = tabs['sc'].order_by().aggregate(
+        sc=Count('id'),
+        nc=Count('id', filter=Q(delivery_date='nan')),
+        defc=Count('id', filter=DEFECT_Q),
+        doctors=Count('doctor', distinct=True),
+        patients=Count('patient', distinct=True),
+        **{key: Count('id', filter=Q(insurance__contains=keyword)) for key, keyword in INSURANCES.items()},
+    )
+    counts['dc'] = tabs['dc'].order_by().count()
+    return counts
+
+def stay_averages(cases):
+    # میانگین روز های بستری و تحویل پرونده؛ فقط ستون های تاریخ خونده میشن نه کل پرونده
+    arrive_days, stay_days = [], []
+    rows = cases.order_by().values_list('admission_date', 'discharge_date', 'delivery_date')
+    for admission_date, discharge_date, delivery_date in rows.iterator():
+        admission = to_gregorian(admission_date)
+        discharge = to_gregorian(discharge_date)
+        delivery = to_gregorian(delivery_date)
+        if discharge and delivery:
+            arrive_days.append((delivery - discharge).days)
+        if discharge and admission:
+            stay_days.append((discharge - admission).days)
+
+    average_arrive = round(sum(arrive_days) / len(arrive_days), 0) if arrive_days else '0'
+    average_stay = round(sum(stay_days) / len(stay_days), 0) if stay_days else '0'
+    return average_arrive, average_stay
+
+def death_averages(deaths):
+    # میانگین روز های تحویل پرونده (فوت تا تحویل) و بستری (پذیرش تا فوت) فوت شدگان
+    arrive_days, stay_days = [], []
+    rows = deaths.order_by().values_list('admission', 'death', 'delivery_date')
+    for admission, death, delivery_date in rows.iterator():
+        delivery = to_gregorian(delivery_date)
+        if death and delivery:
+            arrive_days.append((delivery - death).days)
+        if admission and death:
+            stay_days.append((death - admission).days)
+
+    average_arrive = round(sum(arrive_days) / len(arrive_days), 0) if arrive_days else '0'
+    average_stay = round(sum(stay_days) / len(stay_days), 0) if stay_days else '0'
+    return average_arrive, average_stay
+
+def defect_distribution(cases):
+    # پراکندگی برگ نقص و نوع نقص پرونده ها
+    sheet_counts = defaultdict(int)
+    type_counts = defaultdict(int)
+    rows = cases.order_by().values_list(*DEFECT_SHEET_FIELDS, *DEFECT_TYPE_FIELDS)
+    for row in rows.iterator():
+        sheets, types = row[:len(DEFECT_SHEET_FIELDS)], row[len(DEFECT_SHEET_FIELDS):]
+        for code, name in SectionCase.defect_sheet_choices:
+            if code in sheets:
+                sheet_counts[name] += 1
+        for code, name in SectionCase.defect_type_choices:
+            if any(value and code in value for value in types):
+                type_counts[name] += 1
+
+    return (
+        {name: sheet_counts[name] for code, name in SectionCase.defect_sheet_choices},
+        {name: type_counts[name] for code, name in SectionCase.defect_type_choices},
+    )
+
+def death_demographics(deaths):
+    # پراکندگی سنی و جنسیتی فوت شدگان
+    age_counts = {'less_20': 0, 'more_20_less_40': 0, 'more_40_less_60': 0, 'more_60_less_80': 0, 'more_80': 0}
+    gender_counts = {'men': 0, 'women': 0}
+    for age, gender in deaths.order_by().values_list('age', 'gender').iterator():
+        age = int(''.join(filter(str.isdigit, age or '0')) or 0)
+        if age < 20:
+            age_counts['less_20'] += 1
+        elif age < 40:
+            age_counts['more_20_less_40'] += 1
+        elif age < 60:
+            age_counts['more_40_less_60'] += 1
+        elif age < 80:
+            age_counts['more_60_less_80'] += 1
+        else:
+            age_counts['more_80'] += 1
+        gender_counts['men' if gender == '1' else 'women'] += 1
+    return age_counts, gender_counts
+
+def patient_timeline(group, patient):
+    # پرونده های بخش، اتاق عمل و فوت یک بیمار با تعداد ثابت کوئری، مستقل از تعداد پرونده ها
+    section_cases = SectionCase.objects.filter(group=group, patient=patient)
+    room_cases = RoomCase.objects.filter(group=group, patient=patient)
+    dc_cases = DC.objects.filter(group=group, patient=patient)
+
+    # پزشکان بیمار با یک کوئری UNION، که تکراری ها رو خود دیتابیس حذف میکنه
+    doctors = (
+        section_cases.order_by().values_list('doctor', 'doctor__full_name')
+        .union(
+            room_cases.order_by().values_list('doctor', 'doctor__full_name'),
+            dc_cases.order_by().values_list('doctor', 'doctor__full_name'),
+        )
+        .order_by('doctor__full_name')
+    )
+
+    section_cases = list(section_cases.select_related('doctor', 'section').order_by('admission', 'id'))
+    room_cases = list(room_cases.select_related('doctor', 'room').order_by('operation', 'id'))
+    dc_cases = list(dc_cases.select_related('doctor', 'hospitalization_section', 'patient').order_by('death', 'id'))
+
+    # پذیرش ها، عمل ها و فوت به ترتیب زمانی؛ تاریخ های نامعتبر آخر لیست میان
+    events = (
+        [{'kind': 'admission', 'date': case.admission, 'jalali_date': case.admission_date, 'place': case.section, 'case': case}
+         for case in section_cases] +
+        [{'kind': 'operation', 'date': case.operation, 'jalali_date': case.operation_date, 'place': case.room, 'case': case}
+         for case in room_cases] +
+        [{'kind': 'death', 'date': case.death, 'jalali_date': case.death_date, 'place': case.hospitalization_section, 'case': case}
+         for case in dc_cases]
+    )
+    events.sort(key=lambda event: (event['date'] is None, event['date'] or datetime.date.min))
+
+    return {
+        'section_cases': section_cases,
+        'room_cases': room_cases,
+        'dc_cases': dc_cases,
+        'events': events,
+        'doctors': [{'id': doctor_id, 'full_name': full_name} for doctor_id, full_name in doctors],
+    }
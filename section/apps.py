@@ -5,3 +5,11 @@ class SectionConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'section'
     verbose_name = 'درمانگاه'
+
+    def ready(self):
+        from . import metrics, performance, querycheck, signals, sqlite
+        signals.connect()
+        sqlite.connect()
+        performance.connect()
+        metrics.connect()
+        querycheck.connect()
@@ -0,0 +1,62 @@
+import hashlib
+import threading
+from collections import Counter
+from django.core.cache import cache
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+
+# لایه کش مشترک داشبورد، تحلیل ها و جستجو
+# هر کلید شامل گروه، نام ویو، نسخه داده گروه و پارامتر های نرمال شده درخواسته
+# نسخه داده (Group.data_version) با ورود اکسل، ویرایش و حذف بالا میره، پس کلید های قبلی خودبخود کنار میرن
+
+MISSING = object()
+
+_lock = threading.Lock()
+_hits = Counter()
+_misses = Counter()
+
+def group_version(group):
+    return group.data_version
+
+def normalize_params(params):
+    # ترتیب پارامتر ها و مقادیر خالی روی کلید اثر نداره؛ QueryDict یا dict
+    pairs = params.lists() if hasattr(params, 'lists') else params.items()
+    items = []
+    for name, values in pairs:
+        if not isinstance(values, (list, tuple)):
+            values = [values]
+        values = sorted(str(value) for value in values if value not in (None, ''))
+        if values:
+            items.append(f'{name}={",".join(values)}')
+    return '&'.join(sorted(items))
+
+def make_key(group, view, params=None, parts=()):
+    # پارامتر ها ممکنه فارسی یا طولانی باشن، پس بخش متغیر کلید هش میشه
+    variable = '|'.join([*(str(part) for part in parts), normalize_params(params or {})])
+    digest = hashlib.md5(variable.encode()).hexdigest()
+    return f'{view}:{group.pk}:{group_version(group)}:{digest}'
+
+def record(view, hit):
+    with _lock:
+        (_hits if hit else _misses)[view] += 1
+
+def get_or_set(group, view, compute, params=None, parts=(), timeout=DEFAULT_TIMEOUT):
+    key = make_key(group, view, params, parts)
+    value = cache.get(key, MISSING)
+    record(view, value is not MISSING)
+    if value is MISSING:
+        value = compute()
+        cache.set(key, value, timeout)
+    return value
+
+def stats():
+    # شمارنده های همین پروسه؛ {ویو: {'hits': ..., 'misses': ...}}
+    with _lock:
+        return {
+            view: {'hits': _hits[view], 'misses': _misses[view]}
+            for view in sorted(set(_hits) | set(_misses))
+        }
+
+def reset_stats():
+    with _lock:
+        _hits.clear()
+        _misses.clear()
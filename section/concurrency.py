@@ -0,0 +1,41 @@
+import asyncio
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+
+# اجرای همزمان کوئری های مستقل ویو های async
+# با CONCURRENT_QUERIES هر کوئری در یک thread جدا و با اتصال دیتابیس خودش اجرا میشه و زمان صفحه به کندترین کوئری نزدیک میشه
+# بدون اون (پیش فرض و برای SQLite) همه پشت سر هم روی thread اصلی اجرا میشن، با همون نتیجه
+
+_executor = None
+
+def executor():
+    global _executor
+    if _executor is None:
+        # تعداد thread ها سقف اتصال های اضافه هر پروسه به دیتابیسه
+        _executor = ThreadPoolExecutor(max_workers=settings.CONCURRENT_QUERY_WORKERS, thread_name_prefix='query')
+    return _executor
+
+def _in_worker(func):
+    def run():
+        close_old_connections()
+        try:
+            return func()
+        finally:
+            close_old_connections()
+    return run
+
+async def gather(**queries):
+    # هر مقدار یک تابع بدون ورودی که کار ORM انجام میده؛ خروجی دیکشنری نتیجه ها با همون نام ها
+    if settings.CONCURRENT_QUERIES:
+        loop = asyncio.get_running_loop()
+        # context هر کار کپی میشه تا اندازه گیری درخواست (section.performance) کوئری های thread ها رو هم ببینه
+        pending = [
+            loop.run_in_executor(executor(), contextvars.copy_context().run, _in_worker(func))
+            for func in queries.values()
+        ]
+    else:
+        pending = [sync_to_async(func)() for func in queries.values()]
+    return dict(zip(queries, await asyncio.gather(*pending)))
@@ -0,0 +1,10 @@
+from django.conf import settings
+
+
+def data_version(request):
+    # نسخه داده گروه کاربر برای کلید بلوک های {% cache %} قالب ها
+    group = getattr(request.user, 'group', None) if hasattr(request, 'user') else None
+    return {
+        'data_version': group.data_version if group else 0,
+        'fragment_cache_timeout': settings.FRAGMENT_CACHE_TIMEOUT,
+    }
@@ -1,6 +1,7 @@
 from django import forms
 from django.contrib.auth import get_user_model
 from django.contrib.auth.forms import UserCreationForm
+from django.urls import reverse
 from .models import Excel, Expertise, Section, Room, Doctor, SectionCase
 
 CustomUser = get_user_model()
@@ -90,32 +91,77 @@ class SectionCaseForm(forms.ModelForm):
 class ConfirmDeleteForm(forms.Form):
     confirm = forms.BooleanField(label="تایید نهایی")
 
-class MultiSectionForm(forms.Form):
-    sections = forms.ModelMultipleChoiceField(
-        queryset=Section.objects.all(),
+class GroupModelMultipleChoiceField(forms.ModelMultipleChoiceField):
+    # اعتبارسنجی فقط با شناسه ها: به جای لود کل رکورد ها، فقط pk های موجود در گروه خونده میشن
+    def _check_values(self, value):
+        try:
+            value = frozenset(int(pk) for pk in value)
+        except (TypeError, ValueError):
+            raise forms.ValidationError(self.error_messages['invalid_pk_value'], code='invalid_pk_value', params={'pk': value})
+
+        found = set(self.queryset.filter(pk__in=value).values_list('pk', flat=True))
+        for pk in value - found:
+            raise forms.ValidationError(self.error_messages['invalid_choice'], code='invalid_choice', params={'value': pk})
+        return self.queryset.filter(pk__in=found)
+
+class GroupMultiForm(forms.Form):
+    # فرم انتخاب چندتایی محدود به گروه کاربر
+    # اگه تعداد گزینه ها از آستانه بیشتر باشه، فقط گزینه های انتخاب شده رندر میشن و بقیه با autocomplete لود میشن
+    choice_field = None
+    autocomplete_kind = None
+    incremental_threshold = 200
+
+    start = forms.CharField(label="تاریخ شروع", required=False)
+    end = forms.CharField(label="تاریخ پایان", required=False)
+
+    def __init__(self, *args, group=None, incremental=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        field = self.fields[self.choice_field]
+        field.queryset = field.queryset.model.objects.filter(group=group).order_by('id')
+
+        if incremental is None:
+            incremental = field.queryset.count() > self.incremental_threshold
+        self.incremental = incremental
+
+        if incremental:
+            name = self.add_prefix(self.choice_field)
+            selected = field.widget.value_from_datadict(self.data, self.files, name) if self.is_bound else []
+            selected = [pk for pk in selected or [] if str(pk).isdigit()]
+            field.widget = forms.SelectMultiple(attrs={
+                'class': 'form-control',
+                'data-autocomplete': reverse('autocomplete', args=[self.autocomplete_kind]),
+            })
+            field.widget.choices = [(obj.pk, str(obj)) for obj in field.queryset.filter(pk__in=selected)]
+
+class MultiSectionForm(GroupMultiForm):
+    choice_field = 'sections'
+    autocomplete_kind = 'section'
+
+    sections = GroupModelMultipleChoiceField(
+        queryset=Section.objects.none(),
         widget=forms.CheckboxSelectMultiple(attrs={'class': 'checkbox-multiple'}),
         required=True,
         label="بخش‌ها"
     )
-    start = forms.CharField(label="تاریخ شروع", required=False)
-    end = forms.CharField(label="تاریخ پایان", required=False)
 
-class MultiRoomForm(forms.Form):
-    rooms = forms.ModelMultipleChoiceField(
-        queryset=Room.objects.all(),
+class MultiRoomForm(GroupMultiForm):
+    choice_field = 'rooms'
+    autocomplete_kind = 'room'
+
+    rooms = GroupModelMultipleChoiceField(
+        queryset=Room.objects.none(),
         widget=forms.CheckboxSelectMultiple(attrs={'class': 'checkbox-multiple'}),
         required=True,
         label="اتاق عمل ها"
     )
-    start = forms.CharField(label="تاریخ شروع", required=False)
-    end = forms.CharField(label="تاریخ پایان", required=False)
 
-class MultiDoctorForm(forms.Form):
-    doctors = forms.ModelMultipleChoiceField(
-        queryset=Doctor.objects.all(),
+class MultiDoctorForm(GroupMultiForm):
+    choice_field = 'doctors'
+    autocomplete_kind = 'doctor'
+
+    doctors = GroupModelMultipleChoiceField(
+        queryset=Doctor.objects.none(),
         widget=forms.CheckboxSelectMultiple(attrs={'class': 'checkbox-multiple'}),
         required=True,
         label="پزشکان"
     )
-    start = forms.CharField(label="تاریخ شروع", required=False)
-    end = forms.CharField(label="تاریخ پایان", required=False)
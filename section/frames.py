@@ -0,0 +1,429 @@
+import threading
+import numpy as np
+import pandas as pd
+from .models import Doctor, SectionCase, RoomCase, DC
+from .jalali import to_gregorian
+
+# بک اند ستونی تحلیل ها با pandas
+# داده های هر گروه یک بار با values_list خونده میشن و تا تغییر نسخه داده گروه در حافظه پروسس می مونن
+# همه آمار های ویو های جزئیات به صورت برداری (ماسک و groupby) محاسبه میشن
+
+defect_sheet_choices = SectionCase.defect_sheet_choices
+defect_type_choices = SectionCase.defect_type_choices
+
+DEFECT_SHEET_FIELDS = ['defect_sheet'] + [f'defect_sheet{i}' for i in range(2, 11)]
+DEFECT_TYPE_FIELDS = ['defect_type'] + [f'defect_type{i}' for i in range(2, 11)]
+
+INSURANCE_KEYWORDS = {
+    'social_security': 'تامین اجتماعی',
+    'medical_services': 'خدمات درمانی',
+    'armed_forces': 'نیرو های مسلح',
+    'free': 'آزاد',
+}
+
+AGE_BUCKETS = [
+    ('less_20', 0, 20),
+    ('more_20_less_40', 20, 40),
+    ('more_40_less_60', 40, 60),
+    ('more_60_less_80', 60, 80),
+    ('more_80', 80, np.inf),
+]
+
+# ارقام فارسی و عربی در ستون سن هم مثل ارقام لاتین خونده میشن
+DIGITS = str.maketrans('۰۱۲۳۴۵۶۷۸۹٠١٢٣٤٥٦٧٨٩', '01234567890123456789')
+
+_cache = {}
+_lock = threading.Lock()
+
+class GroupFrames:
+    def __init__(self, version, section_cases, room_cases, dc_cases):
+        self.version = version
+        self.section_cases = section_cases
+        self.room_cases = room_cases
+        self.dc_cases = dc_cases
+
+def to_datetime64(values):
+    # تبدیل شمسی به میلادی فقط روی مقادیر یکتا انجام میشه و نتیجه با کد ها پخش میشه
+    codes, uniques = pd.factorize(pd.Series(values, dtype=object))
+    converted = pd.to_datetime(pd.Series([to_gregorian(value) for value in uniques], dtype=object)).to_numpy('datetime64[ns]')
+    if not len(converted):
+        return np.full(len(codes), np.datetime64('NaT'), dtype='datetime64[ns]')
+    return np.where(codes >= 0, converted[np.maximum(codes, 0)], np.datetime64('NaT'))
+
+def _records(queryset, columns):
+    return pd.DataFrame.from_records(list(queryset.order_by().values_list(*columns)), columns=columns)
+
+def _multiselect(values):
+    return pd.Series([','.join(v) if isinstance(v, list) else (v or '') for v in values], dtype='category')
+
+def _load_section_cases(group):
+    columns = [
+        'id', 'section_id', 'doctor_id', 'patient_id', 'insurance',
+        'admission_date', 'discharge_date', 'delivery_date',
+        *DEFECT_SHEET_FIELDS, *DEFECT_TYPE_FIELDS,
+    ]
+    df = _records(SectionCase.objects.filter(group=group), columns)
+
+    frame = pd.DataFrame({
+        'id': df['id'].astype('int64'),
+        'section': df['section_id'].astype('int64'),
+        'doctor': df['doctor_id'].astype('int64'),
+        'patient': df['patient_id'].astype('int64'),
+        'insurance': df['insurance'].fillna('').astype('category'),
+        'admission': to_datetime64(df['admission_date']),
+        'discharge': to_datetime64(df['discharge_date']),
+        'delivery': to_datetime64(df['delivery_date']),
+        # رشته اصلی تاریخ ها برای شرط های مبتنی بر مقدار خام (مثل 'nan') نگه داشته میشه
+        'discharge_raw': df['discharge_date'].fillna('').astype(bool),
+        'delivery_raw': df['delivery_date'].fillna('').astype(bool),
+        'not_arrived': (df['delivery_date'] == 'nan').to_numpy(),
+    })
+    for field in DEFECT_SHEET_FIELDS:
+        frame[field] = pd.to_numeric(df[field], errors='coerce').fillna(0).astype('int8')
+    for field in DEFECT_TYPE_FIELDS:
+        frame[field] = _multiselect(df[field])
+    return frame
+
+def _load_room_cases(group):
+    columns = ['id', 'room_id', 'doctor_id', 'patient_id', 'operation_type', 'operation_date']
+    df = _records(RoomCase.objects.filter(group=group), columns)
+    return pd.DataFrame({
+        'id': df['id'].astype('int64'),
+        'room': df['room_id'].astype('int64'),
+        'doctor': df['doctor_id'].astype('int64'),
+        'patient': df['patient_id'].astype('int64'),
+        'operation_type': df['operation_type'].astype('category'),
+        'operation': to_datetime64(df['operation_date']),
+    })
+
+def _load_dc_cases(group):
+    columns = [
+        'id', 'doctor_id', 'hospitalization_section_id', 'patient_id',
+        'admission_date', 'death_date', 'delivery_date', 'age', 'gender',
+    ]
+    df = _records(DC.objects.filter(group=group), columns)
+    return pd.DataFrame({
+        'id': df['id'].astype('int64'),
+        'doctor': df['doctor_id'].astype('int64'),
+        'section': df['hospitalization_section_id'].astype('int64'),
+        'patient': df['patient_id'].astype('int64'),
+        'admission': to_datetime64(df['admission_date']),
+        'death': to_datetime64(df['death_date']),
+        'delivery': to_datetime64(df['delivery_date']),
+        'age': pd.to_numeric(
+            df['age'].fillna('').astype(str).str.translate(DIGITS).str.replace(r'[^0-9]', '', regex=True),
+            errors='coerce',
+        ),
+        'gender': df['gender'].astype('category'),
+    })
+
+def load_frames(group):
+    version = group.current_data_version()
+    cached = _cache.get(group.pk)
+    if cached is not None and cached.version == version:
+        return cached
+
+    with _lock:
+        cached = _cache.get(group.pk)
+        if cached is not None and cached.version == version:
+            return cached
+
+        frames = GroupFrames(
+            version,
+            _load_section_cases(group),
+            _load_room_cases(group),
+            _load_dc_cases(group),
+        )
+        _cache[group.pk] = frames
+        return frames
+
+def clear_frames(group=None):
+    if group is None:
+        _cache.clear()
+    else:
+        _cache.pop(group.pk, None)
+
+# ماسک ها و شمارنده های مشترک
+
+def parse_range(start, end, swap=True):
+    start_date = to_gregorian(start) if start else None
+    end_date = to_gregorian(end) if end else None
+    if not (start_date and end_date):
+        return None, None
+    if swap and start_date > end_date:
+        start_date, end_date = end_date, start_date
+    return np.datetime64(start_date), np.datetime64(end_date)
+
+def range_mask(dates, start_date, end_date, keep_unknown=False):
+    if start_date is None:
+        return np.ones(len(dates), dtype=bool)
+    mask = (dates >= start_date) & (dates <= end_date)
+    if keep_unknown:
+        mask |= pd.isna(dates)
+    return np.asarray(mask, dtype=bool)
+
+def has_defect(cases, fields=DEFECT_SHEET_FIELDS):
+    return (cases[fields].to_numpy() != 0).any(axis=1)
+
+def defect_counts(cases):
+    sheets = cases[DEFECT_SHEET_FIELDS].to_numpy()
+    return {
+        name: int((sheets == int(code)).any(axis=1).sum())
+        for code, name in defect_sheet_choices
+    }
+
+def defect_type_counts(cases):
+    counts = {}
+    for code, name in defect_type_choices:
+        # معادل عضویت کد در لیست مقادیر انتخاب شده
+        pattern = rf'(?:^|,){code}(?:,|$)'
+        mask = np.zeros(len(cases), dtype=bool)
+        for field in DEFECT_TYPE_FIELDS:
+            mask |= cases[field].astype(str).str.contains(pattern, regex=True).to_numpy()
+        counts[name] = int(mask.sum())
+    return counts
+
+def insurance_counts(cases):
+    insurance = cases['insurance'].astype(str)
+    return {
+        key: int(insurance.str.contains(keyword, regex=False).sum())
+        for key, keyword in INSURANCE_KEYWORDS.items()
+    }
+
+def average_days(start_dates, end_dates, default=0):
+    days = (end_dates - start_dates).dropna().dt.days
+    return round(days.mean(), 0) if len(days) else default
+
+def age_gender_counts(dc_cases, unknown_age=None):
+    # سن نامعتبر یا خالی: بدون unknown_age پرونده حساب نمیشه (مثل تحلیل بخش)، وگرنه با همون سن شمرده میشه (مثل صفحه فوت‌شدگان)
+    if unknown_age is None:
+        dc_cases = dc_cases[dc_cases['age'].notna()]
+        ages = dc_cases['age'].to_numpy()
+    else:
+        ages = dc_cases['age'].fillna(unknown_age).to_numpy()
+    age_counts = {
+        key: int(((ages >= low) & (ages < high)).sum())
+        for key, low, high in AGE_BUCKETS
+    }
+    men = int((dc_cases['gender'] == '1').sum())
+    gender_counts = {'men': men, 'women': len(dc_cases) - men}
+    return age_counts, gender_counts
+
+# آمار هر موجودیت با همان کلید های خروجی تحلیل های ORM
+
+def section_metrics(frames, section, start=None, end=None):
+    start_date, end_date = parse_range(start, end, swap=False)
+
+    section_cases = frames.section_cases
+    cases = section_cases[
+        (section_cases['section'] == section.id).to_numpy()
+        & range_mask(section_cases['admission'], start_date, end_date)
+    ]
+    dc_cases = frames.dc_cases
+    dcs = dc_cases[
+        (dc_cases['section'] == section.id).to_numpy()
+        & range_mask(dc_cases['admission'], start_date, end_date)
+    ]
+
+    # اگه تبدیل تاریخ ترخیص یا تحویل شکست بخوره، مدت اقامت اون پرونده هم حساب نمیشه
+    arrive_failed = (
+        cases['discharge_raw'] & cases['delivery_raw']
+        & (cases['discharge'].isna() | cases['delivery'].isna())
+    )
+    arrive_cases = cases[cases['discharge_raw'] & cases['delivery_raw'] & ~arrive_failed]
+    stay_cases = cases[~arrive_failed]
+
+    insurance = insurance_counts(cases)
+    age_counts, gender_counts = age_gender_counts(dcs)
+
+    doctors = Doctor.objects.filter(sections=section).values_list('id', 'full_name')
+    per_doctor = cases.groupby('doctor').size()
+    per_doctor_defects = cases[has_defect(cases, DEFECT_SHEET_FIELDS[:2])].groupby('doctor').size()
+
+    return {
+        'section': section,
+        'doctors_count': int(cases['doctor'].nunique()),
+        'patients_count': int(cases['patient'].nunique()),
+        'filtered_section_cases_count': len(cases),
+        'filtered_dc_section_cases_count': len(dcs),
+        'filtered_not_arrived_cases_count': int(cases['not_arrived'].sum()),
+        'filtered_defect_cases_count': int(has_defect(cases).sum()),
+        'filtered_social_security_cases_count': insurance['social_security'],
+        'filtered_medical_services_cases_count': insurance['medical_services'],
+        'filtered_armed_forces_cases_count': insurance['armed_forces'],
+        'filtered_free_cases_count': insurance['free'],
+        'average_arrive_daies': average_days(arrive_cases['discharge'], arrive_cases['delivery']),
+        'average_stay_daies': average_days(stay_cases['admission'], stay_cases['discharge']),
+        'defect_counts': defect_counts(cases),
+        'defect_type_counts': defect_type_counts(cases),
+        'doctor_cases': {name: int(per_doctor.get(pk, 0)) for pk, name in doctors},
+        'doctor_defects': {name: int(per_doctor_defects.get(pk, 0)) for pk, name in doctors},
+        'age_counts': age_counts,
+        'gender_counts': gender_counts,
+    }
+
+def doctor_metrics(frames, doctor, start=None, end=None):
+    start_date, end_date = parse_range(start, end)
+
+    # مثل تحلیل ORM، پرونده هایی که تاریخ قابل تبدیل ندارن داخل بازه حساب میشن
+    def in_range(cases, field):
+        return cases[range_mask(cases[field], start_date, end_date, keep_unknown=True)]
+
+    section_cases = frames.section_cases
+    all_cases = section_cases[(section_cases['doctor'] == doctor.id).to_numpy()]
+    cases = in_range(all_cases, 'admission')
+    all_defects = in_range(section_cases[has_defect(section_cases)], 'admission')
+    defects = cases[has_defect(cases)]
+
+    room_cases = in_range(frames.room_cases[(frames.room_cases['doctor'] == doctor.id).to_numpy()], 'operation')
+    dcs = in_range(frames.dc_cases[(frames.dc_cases['doctor'] == doctor.id).to_numpy()], 'admission')
+    operation_types = room_cases['operation_type'].value_counts()
+
+    insurance = insurance_counts(cases)
+    age_counts, gender_counts = age_gender_counts(dcs)
+    patients = np.union1d(cases['patient'].to_numpy(), room_cases['patient'].to_numpy())
+
+    return {
+        'doctor': doctor,
+        'patients_count': len(patients),
+        'filtered_section_cases_count': len(cases),
+        'filtered_dc_section_cases_count': len(dcs),
+        'filtered_not_arrived_cases_count': int(cases['not_arrived'].sum()),
+        'filtered_defect_cases_count': len(defects),
+        'filtered_social_security_cases_count': insurance['social_security'],
+        'filtered_medical_services_cases_count': insurance['medical_services'],
+        'filtered_armed_forces_cases_count': insurance['armed_forces'],
+        'filtered_free_cases_count': insurance['free'],
+        'filtered_room_cases_count': len(room_cases),
+        'filtered_big_room_cases_count': int(operation_types.get('3', 0)),
+        'filtered_medium_room_cases_count': int(operation_types.get('2', 0)),
+        'filtered_small_room_cases_count': int(operation_types.get('1', 0)),
+        'average_arrive_days': average_days(cases['discharge'], cases['delivery']),
+        'average_stay_days': average_days(cases['admission'], cases['discharge']),
+        'defect_counts': defect_counts(all_cases),
+        'defect_type_counts': defect_type_counts(all_cases),
+        'percent_defect_cases': (len(defects) * 100) // len(all_defects) if len(all_defects) else 0,
+        'age_counts': age_counts,
+        'gender_counts': gender_counts,
+    }
+
+def room_metrics(frames, rooms, start=None, end=None):
+    start_date, end_date = parse_range(start, end)
+    room_cases = frames.room_cases
+    cases = room_cases[range_mask(room_cases['operation'], start_date, end_date)]
+
+    rooms = list(rooms)
+    links = Doctor.rooms.through.objects.filter(room__in=rooms).order_by('doctor_id').values_list(
+        'room_id', 'doctor_id', 'doctor__full_name'
+    )
+    room_doctors = {}
+    for room_id, doctor_id, full_name in links:
+        room_doctors.setdefault(room_id, []).append((doctor_id, full_name))
+
+    results = {}
+    for room in rooms:
+        room_cases = cases[(cases['room'] == room.id).to_numpy()]
+        operation_types = room_cases['operation_type'].value_counts()
+        per_doctor = room_cases.groupby('doctor').size()
+        results[room.id] = {
+            'room': room,
+            'doctors_count': int(room_cases['doctor'].nunique()),
+            'linked_doctors_count': len(room_doctors.get(room.id, [])),
+            'patients_count': int(room_cases['patient'].nunique()),
+            'filtered_room_cases_count': len(room_cases),
+            'filtered_big_room_cases_count': int(operation_types.get('3', 0)),
+            'filtered_medium_room_cases_count': int(operation_types.get('2', 0)),
+            'filtered_small_room_cases_count': int(operation_types.get('1', 0)),
+            'doctor_cases': {
+                name: int(per_doctor.get(pk, 0)) for pk, name in room_doctors.get(room.id, [])
+            },
+        }
+    return results
+
+def dc_metrics(frames, start=None, end=None):
+    dc_cases = frames.dc_cases
+    start_date, end_date = parse_range(start, end)
+    dcs = dc_cases[range_mask(dc_cases['admission'], start_date, end_date)]
+    age_counts, gender_counts = age_gender_counts(dcs, unknown_age=0)
+
+    return {
+        'dc_cases_count': len(dcs),
+        'dc_doctors_count': int(dcs['doctor'].nunique()),
+        'dc_patients_count': int(dcs['patient'].nunique()),
+        'average_arrive_daies': average_days(dcs['death'], dcs['delivery'], default='0'),
+        'average_stay_daies': average_days(dcs['admission'], dcs['death'], default='0'),
+        'age_counts': age_counts,
+        'gender_counts': gender_counts,
+    }
+
+def defect_metrics(frames, section=None, doctor=None, start=None, end=None):
+    section_cases = frames.section_cases
+    mask = range_mask(section_cases['admission'], *parse_range(start, end))
+    if section:
+        mask &= (section_cases['section'] == int(section)).to_numpy()
+    if doctor:
+        mask &= (section_cases['doctor'] == int(doctor)).to_numpy()
+    cases = section_cases[mask]
+
+    counts = defect_counts(cases)
+    type_counts = defect_type_counts(cases)
+    total_cases = int(has_defect(cases).sum()) or 1
+
+    return {
+        'defect_counts': counts,
+        'defect_type_counts': type_counts,
+        'defect_percents': {name: round((count / total_cases) * 100, 0) for name, count in counts.items()},
+        'defect_type_percents': {name: round((count / total_cases) * 100, 0) for name, count in type_counts.items()},
+    }
+
+# توزیع مدت اقامت و تاخیر تحویل پرونده (میانه، صدک ها و هیستوگرام با بازه های ثابت)
+
+STAY_BINS = [0, 1, 2, 3, 4, 5, 7, 10, 14, 21, 30]
+ARRIVE_BINS = [0, 3, 7, 14, 21, 30, 45, 60, 90, 120, 180]
+PERCENTILES = {'median': 50, 'p75': 75, 'p90': 90, 'p99': 99}
+
+def histogram(days, edges):
+    # بازه اول مقادیر منفی (خطای ثبت) و بازه آخر مقادیر بیشتر از آخرین مرز
+    labels = ['<0']
+    for low, high in zip(edges, edges[1:]):
+        labels.append(str(low) if high - low == 1 else f'{low}-{high - 1}')
+    labels.append(f'{edges[-1]}+')
+
+    indexes = np.searchsorted(edges, days, side='right')
+    counts = np.bincount(indexes, minlength=len(edges) + 1)
+    return {'labels': labels, 'counts': counts.tolist()}
+
+def distribution(days, edges):
+    days = np.asarray(days, dtype=float)
+    result = {'count': len(days), 'mean': None, **{key: None for key in PERCENTILES}}
+    if len(days):
+        result['mean'] = round(float(days.mean()), 1)
+        values = np.percentile(days, list(PERCENTILES.values()))
+        result.update({key: round(float(value), 1) for key, value in zip(PERCENTILES, values)})
+    result['histogram'] = histogram(days, edges)
+    return result
+
+def day_distributions(frames, kind='section', section=None, doctor=None, start=None, end=None):
+    if kind == 'dc':
+        cases = frames.dc_cases
+        stay_start, stay_end, arrive_start, arrive_end = 'admission', 'death', 'death', 'delivery'
+    else:
+        cases = frames.section_cases
+        stay_start, stay_end, arrive_start, arrive_end = 'admission', 'discharge', 'discharge', 'delivery'
+
+    mask = range_mask(cases['admission'], *parse_range(start, end))
+    if section:
+        mask &= (cases['section'] == int(section)).to_numpy()
+    if doctor:
+        mask &= (cases['doctor'] == int(doctor)).to_numpy()
+    cases = cases[mask]
+
+    stay_days = (cases[stay_end] - cases[stay_start]).dropna().dt.days
+    arrive_days = (cases[arrive_end] - cases[arrive_start]).dropna().dt.days
+
+    return {
+        'kind': 'dc' if kind == 'dc' else 'section',
+        'cases_count': len(cases),
+        'stay': distribution(stay_days, STAY_BINS),
+        'arrive': distribution(arrive_days, ARRIVE_BINS),
+    }
@@ -0,0 +1,102 @@
+from collections import defaultdict
+from django.db import transaction
+from .models import Patient, SectionCase, RoomCase, DC
+from .text import patient_keys
+
+# تطبیق هویت بیمار بین شیت های بخش، اتاق عمل و فوت
+# شیت اتاق عمل شناسه و نام بیمار رو کنار هم داره و شیت های بخش و فوت فقط نام رو
+# هر بیمار یک کلید هویت یکتا در گروه داره: id:<شناسه> اگه شناسه داشته باشه، وگرنه name:<نام نرمال شده>
+
+CASE_MODELS = (SectionCase, RoomCase, DC)
+
+def find_patient(group, full_name):
+    # اول با کلید هویت و بعد با نام نرمال شده، هر دو از روی ایندکس
+    identity_key, name_key = patient_keys(full_name)
+    if not name_key and not identity_key.startswith('id:'):
+        return None
+
+    patient = Patient.objects.filter(group=group, identity_key=identity_key).first()
+    if patient is not None:
+        return patient
+
+    if identity_key.startswith('id:'):
+        # بیماری که قبلا فقط با نام (از شیت بخش یا فوت) ثبت شده
+        return Patient.objects.filter(group=group, identity_key=f'name:{name_key}').first()
+
+    # فقط نام داریم: اگه دقیقا یک بیمار با این نام باشه همونه، چند تا یعنی ابهام
+    candidates = list(Patient.objects.filter(group=group, name_key=name_key)[:2])
+    return candidates[0] if len(candidates) == 1 else None
+
+def resolve_patient(group, full_name):
+    # جایگزین get_or_create روی نام؛ خروجی (بیمار، ساخته شد)
+    patient = find_patient(group, full_name)
+    if patient is None:
+        return Patient.objects.create(group=group, full_name=full_name), True
+
+    identity_key, name_key = patient_keys(full_name)
+    if identity_key.startswith('id:') and patient.identity_key.startswith('name:'):
+        # بیمار بدون شناسه حالا شناسه پیدا کرده
+        patient.full_name = full_name
+        patient.save()
+    return patient, False
+
+def merge_patients(keep, duplicates):
+    # پرونده ها و بخش ها و اتاق های تکراری ها به بیمار اصلی منتقل و تکراری ها حذف میشن
+    ids = [patient.pk for patient in duplicates if patient.pk != keep.pk]
+    if not ids:
+        return 0
+
+    with transaction.atomic():
+        for model in CASE_MODELS:
+            model.objects.filter(patient_id__in=ids).update(patient=keep)
+
+        for field, target in (('sections', 'section_id'), ('rooms', 'room_id')):
+            through = getattr(Patient, field).through
+            targets = set(through.objects.filter(patient_id__in=ids).values_list(target, flat=True))
+            through.objects.bulk_create(
+                [through(patient_id=keep.pk, **{target: pk}) for pk in targets],
+                ignore_conflicts=True,
+            )
+            through.objects.filter(patient_id__in=ids).delete()
+
+        Patient.objects.filter(pk__in=ids).delete()
+    return len(ids)
+
+def duplicate_sets(group):
+    # خروجی: (بیمار اصلی، تکراری ها)
+    # اول بیمارانی که کلید هویت یکسان دارن (ثبت شده قبل از کلید هویت، مثلا فقط با تفاوت ی/ي یا فاصله)
+    # و بعد بیماران بدون شناسه ای که نامشون دقیقا با یک بیمار شناسه دار یکیه
+    patients = list(
+        Patient.objects.filter(group=group)
+        .only('id', 'group_id', 'full_name', 'identity_key', 'name_key').order_by('id')
+    )
+    by_pk = {patient.pk: patient for patient in patients}
+    first_by_key = {}
+    duplicates = defaultdict(list)
+    for patient in patients:
+        first = first_by_key.setdefault(patient.identity_key, patient)
+        if first is not patient:
+            duplicates[first.pk].append(patient)
+
+    by_name = defaultdict(list)
+    for patient in first_by_key.values():
+        by_name[patient.name_key].append(patient)
+    for named in by_name.values():
+        with_id = [patient for patient in named if patient.identity_key.startswith('id:')]
+        without_id = [patient for patient in named if patient.identity_key.startswith('name:')]
+        if len(with_id) == 1 and without_id:
+            for patient in without_id:
+                duplicates[with_id[0].pk] += [patient, *duplicates.pop(patient.pk, [])]
+
+    for pk in sorted(duplicates):
+        yield by_pk[pk], duplicates[pk]
+
+def merge_duplicates(group, dry_run=False):
+    # خروجی: لیست (بیمار اصلی، تعداد ادغام شده)
+    merged = []
+    for keep, duplicates in list(duplicate_sets(group)):
+        count = len(duplicates) if dry_run else merge_patients(keep, duplicates)
+        merged.append((keep, count))
+    if merged and not dry_run:
+        group.bump_data_version()
+    return merged
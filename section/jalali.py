@@ -1,5 +1,6 @@
 import re
 import datetime
+from functools import lru_cache
 
 class Gregorian:
 
@@ -150,4 +151,20 @@ class Persian:
         return date_format.format(self.gregorian_year, self.gregorian_month, self.gregorian_day)
 
     def gregorian_datetime(self):
-        return datetime.date(self.gregorian_year, self.gregorian_month, self.gregorian_day)
\ No newline at end of file
+        return datetime.date(self.gregorian_year, self.gregorian_month, self.gregorian_day)
+
+
+# تبدیل رشته تاریخ شمسی به تاریخ میلادی، برای مقادیر نامعتبر (مثل 'nan') None برمیگرده
+@lru_cache(maxsize=8192)
+def to_gregorian(date_str):
+    try:
+        return Persian(date_str).gregorian_datetime() if isinstance(date_str, str) else None
+    except:
+        return None
+
+
+# سال و ماه شمسی یک تاریخ میلادی
+@lru_cache(maxsize=8192)
+def persian_month(date):
+    year, month, day = Gregorian(date).persian_tuple()
+    return year, month
@@ -0,0 +1,94 @@
+import multiprocessing
+import time
+from asgiref.sync import async_to_sync
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections, transaction
+from django.test import RequestFactory, override_settings
+from section.models import Group, CustomUser, SectionCase
+from section.sqlite import current_pragmas
+from section.views import main
+
+
+def read(user, seconds, results):
+    request = RequestFactory().get('/')
+    request.user = user
+    latencies = []
+    try:
+        deadline = time.perf_counter() + seconds
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            async_to_sync(main)(request)
+            latencies.append(time.perf_counter() - started)
+        results.put(('read', latencies))
+    except Exception as e:
+        results.put(('error', f'{type(e).__name__}: {e}'))
+    finally:
+        connection.close()
+
+def write(template, seconds, batch, results):
+    # مثل ورود اکسل: ساخت پرونده ها ردیف به ردیف در تراکنش های پشت سر هم
+    written = 0
+    try:
+        deadline = time.perf_counter() + seconds
+        while time.perf_counter() < deadline:
+            with transaction.atomic():
+                for i in range(batch):
+                    template.pk = None
+                    template.number = f'benchmark-{written}'
+                    template.save()
+                    written += 1
+        results.put(('write', written))
+    except Exception as e:
+        results.put(('error', f'{type(e).__name__}: {e}'))
+    finally:
+        connection.close()
+
+
+class Command(BaseCommand):
+    help = 'سنجش تعداد خواندن صفحه اصلی در ثانیه، همزمان با یک ورود اکسل شبیه سازی شده (با و بدون SQLITE_TUNING=1 اجرا کنید)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--group', type=int, help='شناسه گروه (پیش فرض: اولین گروه)')
+        parser.add_argument('--seconds', type=float, default=10)
+        parser.add_argument('--readers', type=int, default=4)
+        parser.add_argument('--batch', type=int, default=200, help='تعداد ردیف هر تراکنش نوشتن')
+
+    def handle(self, *args, **options):
+        groups = Group.objects.all()
+        group = groups.filter(pk=options['group']).first() if options['group'] else groups.first()
+        user = CustomUser.objects.filter(group=group, is_manager=True).first() if group else None
+        template = SectionCase.objects.filter(group=group).first() if group else None
+        if user is None or template is None:
+            raise CommandError('گروهی با کاربر مسئول و پرونده بخش پیدا نشد.')
+
+        self.stdout.write(f'{connection.vendor}: {current_pragmas() if connection.vendor == "sqlite" else ""}')
+        seconds, batch = options['seconds'], options['batch']
+
+        # هر خواننده و نویسنده یک پروسه جدا مثل worker های gunicorn، با اتصال دیتابیس خودش
+        context = multiprocessing.get_context('fork')
+        results = context.Queue()
+        connections.close_all()
+        # کش قالب خاموش میشه تا هر خواندن واقعا به دیتابیس بره
+        with override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}}):
+            processes = [context.Process(target=read, args=(user, seconds, results)) for i in range(options['readers'])]
+            processes.append(context.Process(target=write, args=(template, seconds, batch, results)))
+            for process in processes:
+                process.start()
+            outcomes = [results.get() for process in processes]
+            for process in processes:
+                process.join()
+
+        latencies = sorted(value for kind, values in outcomes if kind == 'read' for value in values)
+        written = sum(values for kind, values in outcomes if kind == 'write')
+        errors = [values for kind, values in outcomes if kind == 'error']
+
+        SectionCase.objects.filter(group=group, number__startswith='benchmark-').delete()
+        group.bump_data_version()
+
+        for error in errors:
+            self.stdout.write(self.style.ERROR(error))
+        if latencies:
+            self.stdout.write(f'reads: {len(latencies)} ({len(latencies) / seconds:.1f}/s)')
+            self.stdout.write(f'read latency avg: {sum(latencies) / len(latencies) * 1000:.1f}ms')
+            self.stdout.write(f'read latency p95: {latencies[int(len(latencies) * 0.95)] * 1000:.1f}ms')
+        self.stdout.write(f'rows written: {written} ({written / seconds:.1f}/s)')
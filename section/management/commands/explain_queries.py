@@ -0,0 +1,88 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+from section.analytics import date_range
+from section.models import Group, Section, Room, Doctor, Patient, SectionCase, RoomCase, DC
+
+
+class Command(BaseCommand):
+    help = 'نمایش برنامه اجرای (EXPLAIN QUERY PLAN) کوئری های پرتکرار و بررسی استفاده از ایندکس ها'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--group', type=int, help='شناسه گروه (پیش فرض: اولین گروه)')
+        parser.add_argument('--start', default='1402/01/01', help='شروع بازه شمسی')
+        parser.add_argument('--end', default='1402/12/29', help='پایان بازه شمسی')
+
+    def hot_queries(self, group, start, end):
+        # همون شکل کوئری هایی که ویو ها و سرویس های تحلیلی اجرا میکنن
+        section = Section.objects.filter(group=group).first()
+        room = Room.objects.filter(group=group).first()
+        doctor = Doctor.objects.filter(group=group).first()
+        start_date, end_date = date_range(start, end)
+
+        section_cases = SectionCase.objects.filter(group=group)
+        room_cases = RoomCase.objects.filter(group=group)
+        dc_cases = DC.objects.filter(group=group)
+
+        return [
+            ('section cases of a section in range',
+             section_cases.filter(section=section, admission__range=(start_date, end_date))),
+            ('section cases of a doctor in range',
+             section_cases.filter(doctor=doctor, admission__range=(start_date, end_date))),
+            ('section cases in range',
+             section_cases.filter(admission__range=(start_date, end_date))),
+            ('section case by number',
+             section_cases.filter(number='1')),
+            ('room cases of a room in range',
+             room_cases.filter(room=room, operation__range=(start_date, end_date))),
+            ('room cases of a doctor in range',
+             room_cases.filter(doctor=doctor, operation__range=(start_date, end_date))),
+            ('room case by number',
+             room_cases.filter(number='1')),
+            ('surgeon leaderboard',
+             room_cases.order_by().values('doctor').annotate(count=Count('id')).order_by('-count')[:5]),
+            ('deaths of a section in range',
+             dc_cases.filter(hospitalization_section=section, death__range=(start_date, end_date))),
+            ('deaths of a doctor in range',
+             dc_cases.filter(doctor=doctor, death__range=(start_date, end_date))),
+            ('doctor by name',
+             Doctor.objects.filter(group=group, full_name=getattr(doctor, 'full_name', ''))),
+            ('patient by name',
+             Patient.objects.filter(group=group, full_name='')),
+            ('patient by identity key',
+             Patient.objects.filter(group=group, identity_key='')),
+            ('patient by normalized name',
+             Patient.objects.filter(group=group, name_key='')),
+            ('section by name',
+             Section.objects.filter(group=group, name=getattr(section, 'name', ''))),
+            ('room by name',
+             Room.objects.filter(group=group, name=getattr(room, 'name', ''))),
+        ]
+
+    def handle(self, *args, **options):
+        groups = Group.objects.all()
+        group = groups.filter(pk=options['group']).first() if options['group'] else groups.first()
+        if group is None:
+            raise CommandError('گروهی پیدا نشد.')
+
+        full_scans = 0
+        for title, queryset in self.hot_queries(group, options['start'], options['end']):
+            plan = queryset.explain()
+            self.stdout.write(self.style.MIGRATE_HEADING(title))
+            self.stdout.write(plan)
+
+            # در SQLite خط SCAN بدون INDEX یعنی کل جدول خونده میشه
+            if connection.vendor == 'sqlite':
+                scans = [
+                    line for line in plan.splitlines()
+                    if 'SCAN' in line and 'INDEX' not in line and 'TEMP B-TREE' not in line
+                ]
+                if scans:
+                    full_scans += 1
+                    self.stdout.write(self.style.WARNING('full table scan'))
+                else:
+                    self.stdout.write(self.style.SUCCESS('index used'))
+            self.stdout.write('')
+
+        if full_scans:
+            self.stdout.write(self.style.WARNING(f'{full_scans} queries scan a whole table'))
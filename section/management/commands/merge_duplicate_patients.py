@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+from section.identity import merge_duplicates
+from section.models import Group
+
+
+class Command(BaseCommand):
+    help = 'ادغام بیماران تکراری (ثبت شده با نام و با شناسه) و انتقال دسته ای پرونده هاشون به بیمار اصلی'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--group', type=int, help='شناسه گروه (پیش فرض: همه گروه ها)')
+        parser.add_argument('--dry-run', action='store_true', help='فقط نمایش تکراری ها بدون تغییر')
+
+    def handle(self, *args, **options):
+        groups = Group.objects.all()
+        if options['group']:
+            groups = groups.filter(pk=options['group'])
+
+        for group in groups:
+            merged = merge_duplicates(group, dry_run=options['dry_run'])
+            for keep, count in merged:
+                self.stdout.write(f'{keep.full_name}: {count}')
+            self.stdout.write(f'{group}: {sum(count for keep, count in merged)}')
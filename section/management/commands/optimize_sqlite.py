@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+from django.db import connection
+from section.sqlite import current_pragmas, optimize
+
+
+class Command(BaseCommand):
+    help = 'به روز کردن آمار برنامه ریز کوئری SQLite (PRAGMA optimize و در صورت نیاز ANALYZE کامل)؛ برای اجرای دوره ای'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--analyze', action='store_true', help='اجرای ANALYZE کامل روی همه جدول ها')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            self.stdout.write(self.style.WARNING('فقط برای SQLite'))
+            return
+
+        optimize(analyze=options['analyze'])
+        for name, value in current_pragmas().items():
+            self.stdout.write(f'{name}: {value}')
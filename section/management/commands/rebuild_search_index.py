@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+from section.models import Group, SearchEntry
+from section.search import rebuild_index
+
+
+class Command(BaseCommand):
+    help = 'ساخت دوباره ایندکس جستجوی بیماران، پزشکان، بخش ها، اتاق ها و شماره پرونده ها'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--group', type=int, help='شناسه گروه (پیش فرض: همه گروه ها)')
+
+    def handle(self, *args, **options):
+        groups = Group.objects.all()
+        if options['group']:
+            groups = groups.filter(pk=options['group'])
+
+        for group in groups:
+            rebuild_index(group)
+            count = SearchEntry.objects.filter(group=group).count()
+            self.stdout.write(f'{group}: {count}')
@@ -0,0 +1,237 @@
+import atexit
+import glob
+import json
+import os
+import threading
+import time
+from functools import wraps
+from django.conf import settings
+from django.db.models import Count
+from django.db.models.signals import post_save
+from . import cache as group_cache
+from .models import Expertise, Section, Room, Doctor, Patient, SectionCase, RoomCase, DC
+
+# متریک های برنامه با فرمت متنی Prometheus برای /metrics، بدون سرویس جدا
+# هر پروسه متریک هاش رو در حافظه نگه میداره؛ با METRICS_DIR هر پروسه (worker های gunicorn) یک فایل
+# در اون پوشه مینویسه و /metrics مجموع همه فایل ها رو برمیگردونه
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+FLUSH_INTERVAL = 1
+
+HELP = {
+    'clinic_http_requests_total': ('counter', 'تعداد درخواست ها بر اساس نام ویو، متد و وضعیت'),
+    'clinic_http_request_duration_seconds': ('histogram', 'زمان پاسخ درخواست ها بر اساس نام ویو'),
+    'clinic_db_queries_total': ('counter', 'تعداد کوئری های دیتابیس بر اساس نام ویو'),
+    'clinic_db_query_duration_seconds_total': ('counter', 'مجموع زمان کوئری های دیتابیس بر اساس نام ویو'),
+    'clinic_cache_requests_total': ('counter', 'دفعات خواندن کش گروه (section.cache) بر اساس ویو و نتیجه'),
+    'clinic_cache_hit_ratio': ('gauge', 'نسبت hit به کل خواندن های کش گروه'),
+    'clinic_import_duration_seconds': ('histogram', 'زمان کار های ورود اکسل'),
+    'clinic_import_rows_total': ('counter', 'تعداد پرونده های ساخته شده در ورود اکسل'),
+    'clinic_import_rows_per_second': ('gauge', 'سرعت آخرین ورود اکسل (پرونده در ثانیه)'),
+    'clinic_rows': ('gauge', 'تعداد فعلی ردیف ها بر اساس مدل و گروه'),
+}
+
+# مدل هایی که تعداد ردیف هاشون گزارش میشه و پرونده هایی که در ورود اکسل شمرده میشن
+COUNTED_MODELS = (Expertise, Section, Room, Doctor, Patient, SectionCase, RoomCase, DC)
+IMPORTED_MODELS = (SectionCase, RoomCase, DC)
+
+_lock = threading.Lock()
+_counters = {}
+_histograms = {}
+_gauges = {}
+_last_flush = 0.0
+_import = threading.local()
+
+def _key(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+def inc(name, labels, amount=1):
+    with _lock:
+        key = _key(name, labels)
+        _counters[key] = _counters.get(key, 0) + amount
+    maybe_flush()
+
+def observe(name, labels, value):
+    with _lock:
+        key = _key(name, labels)
+        histogram = _histograms.setdefault(key, [[0] * len(BUCKETS), 0.0, 0])
+        for i, bound in enumerate(BUCKETS):
+            if value <= bound:
+                histogram[0][i] += 1
+        histogram[1] += value
+        histogram[2] += 1
+    maybe_flush()
+
+def set_gauge(name, labels, value):
+    with _lock:
+        _gauges[_key(name, labels)] = [value, time.time()]
+    maybe_flush()
+
+def observe_request(view, method, status, duration, queries, query_time):
+    # از PerformanceMiddleware برای همه درخواست ها صدا زده میشه
+    view = view or 'unknown'
+    inc('clinic_http_requests_total', {'view': view, 'method': method, 'status': str(status)})
+    observe('clinic_http_request_duration_seconds', {'view': view}, duration)
+    inc('clinic_db_queries_total', {'view': view}, queries)
+    inc('clinic_db_query_duration_seconds_total', {'view': view}, query_time)
+
+
+def count_imported(sender, instance, created, **kwargs):
+    if created and getattr(_import, 'rows', None) is not None:
+        _import.rows += 1
+
+def connect():
+    for model in IMPORTED_MODELS:
+        post_save.connect(count_imported, sender=model, dispatch_uid=f'metrics_import_{model.__name__}')
+
+def import_job(pipeline):
+    # زمان و تعداد پرونده های ساخته شده یک ورود اکسل موفق (POST با redirect)
+    def decorator(view_func):
+        @wraps(view_func)
+        def _wrapped_view(request, *args, **kwargs):
+            if request.method != 'POST' or getattr(_import, 'rows', None) is not None:
+                return view_func(request, *args, **kwargs)
+            _import.rows = 0
+            started = time.perf_counter()
+            try:
+                response = view_func(request, *args, **kwargs)
+            finally:
+                rows, _import.rows = _import.rows, None
+            if response.status_code == 302:
+                duration = time.perf_counter() - started
+                labels = {'pipeline': pipeline}
+                observe('clinic_import_duration_seconds', labels, duration)
+                inc('clinic_import_rows_total', labels, rows)
+                set_gauge('clinic_import_rows_per_second', labels, rows / duration if duration else 0)
+            return response
+        return _wrapped_view
+    return decorator
+
+
+def snapshot():
+    # وضعیت همین پروسه؛ آمار کش گروه از section.cache خونده میشه
+    with _lock:
+        counters = [[name, dict(labels), value] for (name, labels), value in _counters.items()]
+        histograms = [[name, dict(labels), list(buckets), total, count] for (name, labels), (buckets, total, count) in _histograms.items()]
+        gauges = [[name, dict(labels), *value] for (name, labels), value in _gauges.items()]
+    for view, counts in group_cache.stats().items():
+        for result, value in (('hit', counts['hits']), ('miss', counts['misses'])):
+            counters.append(['clinic_cache_requests_total', {'view': view, 'result': result}, value])
+    return {'counters': counters, 'histograms': histograms, 'gauges': gauges}
+
+def process_file():
+    return os.path.join(settings.METRICS_DIR, f'metrics-{os.getpid()}.json')
+
+def flush():
+    global _last_flush
+    if not settings.METRICS_DIR:
+        return
+    _last_flush = time.monotonic()
+    path = process_file()
+    temporary = f'{path}.tmp'
+    with open(temporary, 'w') as file:
+        json.dump(snapshot(), file)
+    # جایگزینی اتمی، تا /metrics در پروسه دیگه هیچوقت فایل نیمه نوشته نخونه
+    os.replace(temporary, path)
+
+def maybe_flush():
+    if settings.METRICS_DIR and time.monotonic() - _last_flush >= FLUSH_INTERVAL:
+        flush()
+
+@atexit.register
+def flush_on_exit():
+    # آخرین شمارنده های worker ای که بسته میشه از دست نره
+    if settings.configured:
+        flush()
+
+def collect():
+    # مجموع همه پروسه ها: شمارنده ها و هیستوگرام ها جمع میشن و از gauge ها جدیدترین مقدار میمونه
+    snapshots = [snapshot()]
+    if settings.METRICS_DIR:
+        own = process_file()
+        for path in glob.glob(os.path.join(settings.METRICS_DIR, 'metrics-*.json')):
+            if path == own:
+                continue
+            try:
+                with open(path) as file:
+                    snapshots.append(json.load(file))
+            except (OSError, ValueError):
+                continue
+
+    counters, histograms, gauges = {}, {}, {}
+    for data in snapshots:
+        for name, labels, value in data['counters']:
+            key = _key(name, labels)
+            counters[key] = counters.get(key, 0) + value
+        for name, labels, buckets, total, count in data['histograms']:
+            merged = histograms.setdefault(_key(name, labels), [[0] * len(BUCKETS), 0.0, 0])
+            merged[0] = [a + b for a, b in zip(merged[0], buckets)]
+            merged[1] += total
+            merged[2] += count
+        for name, labels, value, updated in data['gauges']:
+            key = _key(name, labels)
+            if key not in gauges or gauges[key][1] < updated:
+                gauges[key] = [value, updated]
+    gauges = {key: value for key, (value, updated) in gauges.items()}
+
+    requests = {}
+    for (name, labels), value in counters.items():
+        if name == 'clinic_cache_requests_total':
+            labels = dict(labels)
+            requests.setdefault(labels['view'], {'hit': 0, 'miss': 0})[labels['result']] += value
+    for view, counts in requests.items():
+        total = counts['hit'] + counts['miss']
+        gauges[_key('clinic_cache_hit_ratio', {'view': view})] = counts['hit'] / total if total else 0
+
+    for model in COUNTED_MODELS:
+        for row in model.objects.values('group').annotate(rows=Count('pk')).order_by():
+            gauges[_key('clinic_rows', {'model': model.__name__, 'group': str(row['group'])})] = row['rows']
+
+    return counters, histograms, gauges
+
+
+def escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def format_labels(labels, extra=()):
+    pairs = [*labels, *extra]
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{escape(value)}"' for name, value in pairs) + '}'
+
+def format_value(value):
+    if isinstance(value, float):
+        return repr(value)
+    return str(value)
+
+def render():
+    # خروجی text/plain; version=0.0.4
+    counters, histograms, gauges = collect()
+    # {نام متریک: [(برچسب ها، خط ها)]}؛ خط های هر هیستوگرام به ترتیب le کنار هم میمونن
+    series = {}
+    for (name, labels), value in [*counters.items(), *gauges.items()]:
+        series.setdefault(name, []).append((labels, [f'{name}{format_labels(labels)} {format_value(value)}']))
+    for (name, labels), (buckets, total, count) in histograms.items():
+        lines = [
+            f'{name}_bucket{format_labels(labels, [("le", bound)])} {value}'
+            for bound, value in zip(BUCKETS, buckets)
+        ]
+        lines.append(f'{name}_bucket{format_labels(labels, [("le", "+Inf")])} {count}')
+        lines.append(f'{name}_sum{format_labels(labels)} {format_value(total)}')
+        lines.append(f'{name}_count{format_labels(labels)} {count}')
+        series.setdefault(name, []).append((labels, lines))
+
+    output = []
+    for name in sorted(series):
+        kind, description = HELP[name]
+        output.append(f'# HELP {name} {description}')
+        output.append(f'# TYPE {name} {kind}')
+        for labels, lines in sorted(series[name]):
+            output.extend(lines)
+    return '\n'.join(output) + '\n'
+
+def reset():
+    with _lock:
+        _counters.clear()
+        _histograms.clear()
+        _gauges.clear()
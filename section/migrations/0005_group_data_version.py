@@ -0,0 +1,18 @@
+# Generated by Django 5.2.2 on 2026-10-19 10:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('section', '0004_sectioncase_defect_sheet10_sectioncase_defect_sheet3_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='group',
+            name='data_version',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='نسخه داده'),
+        ),
+    ]
@@ -0,0 +1,60 @@
+# Generated by Django 5.2.2 on 2026-10-19 10:39
+
+from django.db import migrations, models
+from section.jalali import to_gregorian
+
+
+FIELDS = {
+    'SectionCase': [('admission_date', 'admission')],
+    'RoomCase': [('operation_date', 'operation')],
+    'DC': [('admission_date', 'admission'), ('death_date', 'death')],
+}
+
+
+def fill_gregorian_dates(apps, schema_editor):
+    for model_name, pairs in FIELDS.items():
+        model = apps.get_model('section', model_name)
+        source_fields = [source for source, target in pairs]
+        target_fields = [target for source, target in pairs]
+
+        batch = []
+        for case in model.objects.only('id', *source_fields).iterator(chunk_size=2000):
+            for source, target in pairs:
+                setattr(case, target, to_gregorian(getattr(case, source)))
+            batch.append(case)
+            if len(batch) >= 2000:
+                model.objects.bulk_update(batch, target_fields)
+                batch = []
+        if batch:
+            model.objects.bulk_update(batch, target_fields)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('section', '0005_group_data_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dc',
+            name='admission',
+            field=models.DateField(blank=True, db_index=True, editable=False, null=True, verbose_name='تاریخ پذیرش (میلادی)'),
+        ),
+        migrations.AddField(
+            model_name='dc',
+            name='death',
+            field=models.DateField(blank=True, db_index=True, editable=False, null=True, verbose_name='تاریخ فوت (میلادی)'),
+        ),
+        migrations.AddField(
+            model_name='roomcase',
+            name='operation',
+            field=models.DateField(blank=True, db_index=True, editable=False, null=True, verbose_name='تاریخ عمل (میلادی)'),
+        ),
+        migrations.AddField(
+            model_name='sectioncase',
+            name='admission',
+            field=models.DateField(blank=True, db_index=True, editable=False, null=True, verbose_name='تاریخ پذیرش (میلادی)'),
+        ),
+        migrations.RunPython(fill_gregorian_dates, migrations.RunPython.noop),
+    ]
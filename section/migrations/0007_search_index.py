@@ -0,0 +1,81 @@
+# Generated by Django 5.2.2 on 2026-10-19 10:45
+
+import django.db.models.deletion
+from django.db import migrations, models
+from section.search import normalize, index_grams
+
+
+SOURCES = {
+    'patient': ('Patient', 'full_name'),
+    'doctor': ('Doctor', 'full_name'),
+    'section': ('Section', 'name'),
+    'room': ('Room', 'name'),
+    'section_case': ('SectionCase', 'number'),
+    'room_case': ('RoomCase', 'number'),
+}
+
+
+def build_search_index(apps, schema_editor):
+    SearchEntry = apps.get_model('section', 'SearchEntry')
+    SearchGram = apps.get_model('section', 'SearchGram')
+
+    for kind, (model_name, field) in SOURCES.items():
+        model = apps.get_model('section', model_name)
+        rows = model.objects.values_list('pk', 'group_id', field).iterator(chunk_size=2000)
+        entries = [
+            SearchEntry(group_id=group_id, kind=kind, object_id=pk, text=normalize(value))
+            for pk, group_id, value in rows if normalize(value)
+        ]
+        entries = SearchEntry.objects.bulk_create(entries, batch_size=2000)
+        SearchGram.objects.bulk_create([
+            SearchGram(entry_id=entry.pk, group_id=entry.group_id, kind=kind, gram=gram)
+            for entry in entries
+            for gram in index_grams(entry.text)
+        ], batch_size=2000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('section', '0006_case_gregorian_dates'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(max_length=20, verbose_name='نوع')),
+                ('object_id', models.PositiveBigIntegerField(verbose_name='شناسه')),
+                ('text', models.CharField(max_length=500, verbose_name='متن نرمال شده')),
+                ('group', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='search_entry_group', to='section.group', verbose_name='گروه')),
+            ],
+            options={
+                'verbose_name': 'ایندکس جستجو',
+                'verbose_name_plural': 'ایندکس های جستجو',
+            },
+        ),
+        migrations.CreateModel(
+            name='SearchGram',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(max_length=20, verbose_name='نوع')),
+                ('gram', models.CharField(max_length=3, verbose_name='سه حرفی')),
+                ('entry', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='grams', to='section.searchentry', verbose_name='ایندکس')),
+                ('group', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='search_gram_group', to='section.group', verbose_name='گروه')),
+            ],
+            options={
+                'verbose_name': 'سه حرفی جستجو',
+                'verbose_name_plural': 'سه حرفی های جستجو',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='searchentry',
+            constraint=models.UniqueConstraint(fields=('kind', 'object_id'), name='search_entry_unique_object'),
+        ),
+        migrations.AddIndex(
+            model_name='searchgram',
+            index=models.Index(fields=['group', 'kind', 'gram'], name='search_gram_lookup'),
+        ),
+        migrations.RunPython(build_search_index, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,77 @@
+# Generated by Django 5.2.2 on 2026-10-19 10:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('section', '0007_search_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='dc',
+            index=models.Index(fields=['group', 'hospitalization_section', 'death'], name='dc_group_section'),
+        ),
+        migrations.AddIndex(
+            model_name='dc',
+            index=models.Index(fields=['group', 'doctor', 'death'], name='dc_group_doctor'),
+        ),
+        migrations.AddIndex(
+            model_name='dc',
+            index=models.Index(fields=['group', 'number'], name='dc_group_number'),
+        ),
+        migrations.AddIndex(
+            model_name='dc',
+            index=models.Index(fields=['group', 'death'], name='dc_group_death'),
+        ),
+        migrations.AddIndex(
+            model_name='doctor',
+            index=models.Index(fields=['group', 'full_name'], name='doctor_group_name'),
+        ),
+        migrations.AddIndex(
+            model_name='patient',
+            index=models.Index(fields=['group', 'full_name'], name='patient_group_name'),
+        ),
+        migrations.AddIndex(
+            model_name='room',
+            index=models.Index(fields=['group', 'name'], name='room_group_name'),
+        ),
+        migrations.AddIndex(
+            model_name='roomcase',
+            index=models.Index(fields=['group', 'room', 'operation'], name='roomcase_group_room'),
+        ),
+        migrations.AddIndex(
+            model_name='roomcase',
+            index=models.Index(fields=['group', 'doctor', 'operation'], name='roomcase_group_doctor'),
+        ),
+        migrations.AddIndex(
+            model_name='roomcase',
+            index=models.Index(fields=['group', 'number'], name='roomcase_group_number'),
+        ),
+        migrations.AddIndex(
+            model_name='roomcase',
+            index=models.Index(fields=['group', 'operation'], name='roomcase_group_operation'),
+        ),
+        migrations.AddIndex(
+            model_name='section',
+            index=models.Index(fields=['group', 'name'], name='section_group_name'),
+        ),
+        migrations.AddIndex(
+            model_name='sectioncase',
+            index=models.Index(fields=['group', 'section', 'admission'], name='sectioncase_group_section'),
+        ),
+        migrations.AddIndex(
+            model_name='sectioncase',
+            index=models.Index(fields=['group', 'doctor', 'admission'], name='sectioncase_group_doctor'),
+        ),
+        migrations.AddIndex(
+            model_name='sectioncase',
+            index=models.Index(fields=['group', 'number'], name='sectioncase_group_number'),
+        ),
+        migrations.AddIndex(
+            model_name='sectioncase',
+            index=models.Index(fields=['group', 'admission'], name='sectioncase_group_admission'),
+        ),
+    ]
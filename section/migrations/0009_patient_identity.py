@@ -0,0 +1,45 @@
+# Generated by Django 5.2.2 on 2026-10-19 11:20
+
+from django.db import migrations, models
+from section.text import patient_keys
+
+
+def fill_identity_keys(apps, schema_editor):
+    # فقط پر کردن کلید ها؛ بیماران با کلید یکسان اینجا ادغام نمیشن (migration بعدی و merge_duplicate_patients)
+    Patient = apps.get_model('section', 'Patient')
+    batch = []
+    for patient in Patient.objects.only('id', 'full_name').order_by('id').iterator(chunk_size=2000):
+        patient.identity_key, patient.name_key = patient_keys(patient.full_name)
+        batch.append(patient)
+        if len(batch) >= 2000:
+            Patient.objects.bulk_update(batch, ['identity_key', 'name_key'])
+            batch = []
+    if batch:
+        Patient.objects.bulk_update(batch, ['identity_key', 'name_key'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('section', '0008_composite_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='patient',
+            name='identity_key',
+            field=models.CharField(default='', editable=False, max_length=510, verbose_name='کلید هویت'),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='patient',
+            name='name_key',
+            field=models.CharField(default='', editable=False, max_length=500, verbose_name='نام نرمال شده'),
+            preserve_default=False,
+        ),
+        migrations.RunPython(fill_identity_keys, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='patient',
+            index=models.Index(fields=['group', 'name_key'], name='patient_group_name_key'),
+        ),
+    ]
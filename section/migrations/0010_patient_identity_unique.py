@@ -0,0 +1,42 @@
+# Generated by Django 5.2.2 on 2026-10-19 11:20
+
+from django.core.management.base import CommandError
+from django.db import migrations, models
+from django.db.models import Count
+
+MAX_LISTED = 20
+
+
+def check_identity_collisions(apps, schema_editor):
+    # ادغام بیماران داده بالینی رو تغییر میده و برگشت پذیر نیست، پس خود migration ادغام نمیکنه
+    # اگه تکراری باشه متوقف میشه تا اول merge_duplicate_patients (با --dry-run برای بررسی) اجرا بشه
+    Patient = apps.get_model('section', 'Patient')
+    collisions = list(
+        Patient.objects.values('group_id', 'identity_key')
+        .annotate(count=Count('id')).filter(count__gt=1).order_by('group_id', 'identity_key')
+    )
+    if not collisions:
+        return
+    lines = [f'group {row["group_id"]}: {row["identity_key"]} ({row["count"]})' for row in collisions[:MAX_LISTED]]
+    if len(collisions) > MAX_LISTED:
+        lines.append(f'... {len(collisions) - MAX_LISTED} more')
+    raise CommandError(
+        f'{len(collisions)} کلید هویت تکراری بین بیماران وجود دارد. '
+        'قبل از ادامه migrate تکراری ها را با python manage.py merge_duplicate_patients ادغام کنید:\n'
+        + '\n'.join(lines)
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('section', '0009_patient_identity'),
+    ]
+
+    operations = [
+        migrations.RunPython(check_identity_collisions, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='patient',
+            constraint=models.UniqueConstraint(fields=['group', 'identity_key'], name='patient_group_identity'),
+        ),
+    ]
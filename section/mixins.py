@@ -1,4 +1,7 @@
+import json
+from django.conf import settings
 from django.core.exceptions import PermissionDenied
+from django.db import connection
 
 class ManagerRequiredMixin:
     def dispatch(self, request, *args, **kwargs):
@@ -11,4 +14,103 @@ class UserIsOwnerMixin:
         obj = self.get_object()
         if obj.group != request.user.group:
             raise PermissionDenied("شما اجازه دسترسی به این محتوا را ندارید.")
-        return super().dispatch(request, *args, **kwargs)
\ No newline at end of file
+        return super().dispatch(request, *args, **kwargs)
+
+class DataVersionMixin:
+    def form_valid(self, form):
+        response = super().form_valid(form)
+        self.request.user.group.bump_data_version()
+        return response
+
+class KeysetPage:
+    # صفحه ای از نتایج در حالت صفحه بندی کلیدی (بر اساس آخرین شناسه دیده شده)
+    def __init__(self, object_list, has_previous, has_next, estimated_count=None):
+        self.object_list = object_list
+        self._has_previous = has_previous
+        self._has_next = has_next
+        self.estimated_count = estimated_count
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_previous(self):
+        return self._has_previous
+
+    def has_next(self):
+        return self._has_next
+
+    def has_other_pages(self):
+        return self._has_previous or self._has_next
+
+    @property
+    def previous_cursor(self):
+        return self.object_list[0].pk if self.object_list else None
+
+    @property
+    def next_cursor(self):
+        return self.object_list[-1].pk if self.object_list else None
+
+class KeysetPaginationMixin:
+    # صفحه بندی کلیدی: به جای OFFSET و COUNT، ردیف های بعد (after) یا قبل (before) از یک شناسه خونده میشن
+    # پس هزینه صفحه هزارم با صفحه اول یکیه. با KEYSET_PAGINATION یا پارامتر after/before فعال میشه
+    estimate_cap = 10000
+
+    def use_keyset(self):
+        params = self.request.GET
+        return settings.KEYSET_PAGINATION or 'after' in params or 'before' in params
+
+    def paginate_queryset(self, queryset, page_size):
+        if not self.use_keyset():
+            return super().paginate_queryset(queryset, page_size)
+
+        queryset = queryset.order_by('pk')
+        after = self.request.GET.get('after', '')
+        before = self.request.GET.get('before', '')
+
+        # یک ردیف بیشتر خونده میشه تا معلوم بشه صفحه بعدی (یا قبلی) وجود داره یا نه
+        if before.isdigit():
+            rows = list(queryset.filter(pk__lt=before).order_by('-pk')[:page_size + 1])
+            has_previous = len(rows) > page_size
+            has_next = queryset.filter(pk__gte=before).exists()
+            rows = rows[:page_size][::-1]
+        elif after.isdigit():
+            rows = list(queryset.filter(pk__gt=after)[:page_size + 1])
+            has_previous = queryset.filter(pk__lte=after).exists()
+            has_next = len(rows) > page_size
+            rows = rows[:page_size]
+        else:
+            rows = list(queryset[:page_size + 1])
+            has_previous, has_next = False, len(rows) > page_size
+            rows = rows[:page_size]
+
+        estimated_count = self.estimate_count(queryset) if self.request.GET.get('estimate') else None
+        page = KeysetPage(rows, has_previous, has_next, estimated_count)
+        return None, page, rows, page.has_other_pages()
+
+    def estimate_count(self, queryset):
+        # روی PostgreSQL تخمین برنامه ریز کوئری، در بقیه شمارش محدود (بیشتر از سقف فقط "+" نشون داده میشه)
+        if connection.vendor == 'postgresql':
+            sql, params = queryset.order_by().query.sql_with_params()
+            with connection.cursor() as cursor:
+                cursor.execute('EXPLAIN (FORMAT JSON) ' + sql, params)
+                plan = cursor.fetchone()[0]
+            if isinstance(plan, str):
+                plan = json.loads(plan)
+            return {'count': int(plan[0]['Plan']['Plan Rows']), 'exact': False}
+
+        count = queryset.order_by()[:self.estimate_cap + 1].count()
+        return {'count': min(count, self.estimate_cap), 'exact': count <= self.estimate_cap}
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        if self.use_keyset():
+            # پارامتر های فیلتر فعال برای لینک های قبلی و بعدی
+            params = self.request.GET.copy()
+            for name in ('after', 'before', 'page'):
+                params.pop(name, None)
+            context['keyset'] = True
+            context['keyset_query'] = params.urlencode()
+        return context
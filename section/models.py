@@ -1,9 +1,13 @@
 from multiselectfield import MultiSelectField
 from django.db import models
+from django.db.models import F
 from django.contrib.auth.models import AbstractUser
+from .jalali import to_gregorian
+from .text import patient_keys
 
 class Group(models.Model):
     name = models.CharField(verbose_name='نام گروه', max_length=100)
+    data_version = models.PositiveIntegerField(verbose_name='نسخه داده', default=0, editable=False)
 
     class Meta:
         verbose_name = 'گروه'
@@ -12,6 +16,13 @@ class Group(models.Model):
     def __str__(self):
         return self.name
 
+    # با هر ورود، ویرایش یا حذف داده نسخه گروه بالا میره تا کش های تحلیلی باطل بشن
+    def bump_data_version(self):
+        Group.objects.filter(pk=self.pk).update(data_version=F('data_version') + 1)
+
+    def current_data_version(self):
+        return Group.objects.filter(pk=self.pk).values_list('data_version', flat=True).first() or 0
+
 class CustomUser(AbstractUser):
     group = models.ForeignKey(Group, on_delete=models.CASCADE, related_name='custom_user_group', verbose_name='گروه', null=True, blank=True)
     is_manager = models.BooleanField(verbose_name='دسترسی مسئول', default=True)
@@ -64,6 +75,9 @@ class Section(models.Model):
     class Meta:
         verbose_name = 'بخش'
         verbose_name_plural = 'بخش ها'
+        indexes = [
+            models.Index(fields=['group', 'name'], name='section_group_name'),
+        ]
     
     def save(self, *args, **kwargs):
         if hasattr(self, '_user'):
@@ -82,6 +96,9 @@ class Room(models.Model):
     class Meta:
         verbose_name = 'اتاق عمل'
         verbose_name_plural = 'اتاق های عمل'
+        indexes = [
+            models.Index(fields=['group', 'name'], name='room_group_name'),
+        ]
     
     def save(self, *args, **kwargs):
         if hasattr(self, '_user'):
@@ -109,6 +126,9 @@ class Doctor(models.Model):
     class Meta:
         verbose_name = 'پزشک'
         verbose_name_plural = 'پزشکان'
+        indexes = [
+            models.Index(fields=['group', 'full_name'], name='doctor_group_name'),
+        ]
     
     def save(self, *args, **kwargs):
         if hasattr(self, '_user'):
@@ -120,6 +140,9 @@ class Patient(models.Model):
     full_name = models.CharField(verbose_name='نام و نام خانوادگی', max_length=500)
     sections = models.ManyToManyField(Section, related_name='patient_sections', verbose_name='بخش ها', blank=True)
     rooms = models.ManyToManyField(Room, related_name='patient_rooms', verbose_name='اتاق های عمل', blank=True)
+    # کلید هویت یکتای بیمار در گروه و نام نرمال شده برای پیدا کردن بیمار از شیت های مختلف
+    identity_key = models.CharField(verbose_name='کلید هویت', max_length=510, editable=False)
+    name_key = models.CharField(verbose_name='نام نرمال شده', max_length=500, editable=False)
 
     def __str__(self):
         return f'بیمار با نام {self.full_name}'
@@ -127,10 +150,19 @@ class Patient(models.Model):
     class Meta:
         verbose_name = 'بیمار'
         verbose_name_plural = 'بیماران'
+        indexes = [
+            models.Index(fields=['group', 'full_name'], name='patient_group_name'),
+            models.Index(fields=['group', 'name_key'], name='patient_group_name_key'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['group', 'identity_key'], name='patient_group_identity'),
+        ]
     
     def save(self, *args, **kwargs):
         if hasattr(self, '_user'):
             self.group = self._user.group
+        # کلید ها از نام ساخته میشن تا همه مسیر های ورود بیمار یکسان تطبیق داده بشن
+        self.identity_key, self.name_key = patient_keys(self.full_name)
         super().save(*args, **kwargs)
 
 class SectionCase(models.Model):
@@ -172,6 +204,7 @@ class SectionCase(models.Model):
     section = models.ForeignKey(Section, on_delete=models.CASCADE, related_name='section_case', verbose_name='بخش')
     doctor = models.ForeignKey(Doctor, on_delete=models.CASCADE, related_name='doctor_case', verbose_name='پزشک')
     admission_date = models.CharField(verbose_name='تاریخ پذیرش', max_length=10)
+    admission = models.DateField(verbose_name='تاریخ پذیرش (میلادی)', null=True, blank=True, editable=False, db_index=True)
     number = models.CharField(verbose_name='شماره پرونده', max_length=50)
     representative_doctor = models.ForeignKey(Doctor, on_delete=models.CASCADE, related_name='r_doctor_case', verbose_name='پزشک معرف')
     patient = models.ForeignKey(Patient, on_delete=models.CASCADE, related_name='patient_case', verbose_name='بیمار')
@@ -203,10 +236,18 @@ class SectionCase(models.Model):
     class Meta:
         verbose_name = 'پرونده بخش'
         verbose_name_plural = 'پرونده های بخش'
+        indexes = [
+            models.Index(fields=['group', 'section', 'admission'], name='sectioncase_group_section'),
+            models.Index(fields=['group', 'doctor', 'admission'], name='sectioncase_group_doctor'),
+            models.Index(fields=['group', 'number'], name='sectioncase_group_number'),
+            models.Index(fields=['group', 'admission'], name='sectioncase_group_admission'),
+        ]
     
     def save(self, *args, **kwargs):
         if hasattr(self, '_user'):
             self.group = self._user.group
+        # تاریخ میلادی برای فیلتر و گروه بندی در دیتابیس
+        self.admission = to_gregorian(self.admission_date)
         super().save(*args, **kwargs)
 
 class RoomCase(models.Model):
@@ -220,6 +261,7 @@ class RoomCase(models.Model):
     hospitalization_date = models.CharField(verbose_name='تاریخ بستری', max_length=10)
     discharge_date = models.CharField(verbose_name='تاریخ ترخیص', max_length=10, null=True, blank=True)
     operation_date = models.CharField(verbose_name='تاریخ عمل', max_length=10)
+    operation = models.DateField(verbose_name='تاریخ عمل (میلادی)', null=True, blank=True, editable=False, db_index=True)
     patient = models.ForeignKey(Patient, on_delete=models.CASCADE, related_name='patient_room_case', verbose_name='بیمار')
     number = models.CharField(verbose_name='شماره پرونده', max_length=50)
     room = models.ForeignKey(Room, on_delete=models.CASCADE, related_name='room_case', verbose_name='اتاق عمل')
@@ -234,10 +276,18 @@ class RoomCase(models.Model):
     class Meta:
         verbose_name = 'پرونده اتاق عمل'
         verbose_name_plural = 'پرونده های اتاق عمل'
+        indexes = [
+            models.Index(fields=['group', 'room', 'operation'], name='roomcase_group_room'),
+            models.Index(fields=['group', 'doctor', 'operation'], name='roomcase_group_doctor'),
+            models.Index(fields=['group', 'number'], name='roomcase_group_number'),
+            models.Index(fields=['group', 'operation'], name='roomcase_group_operation'),
+        ]
     
     def save(self, *args, **kwargs):
         if hasattr(self, '_user'):
             self.group = self._user.group
+        # تاریخ میلادی برای فیلتر و گروه بندی در دیتابیس
+        self.operation = to_gregorian(self.operation_date)
         super().save(*args, **kwargs)
 
 class DC(models.Model):
@@ -253,7 +303,9 @@ class DC(models.Model):
     location_of_death = models.CharField(verbose_name='بخش محل فوت', max_length=100, null=True, blank=True)
     hospitalization_section = models.ForeignKey(Section, on_delete=models.CASCADE, related_name='section_dc', verbose_name='بخش بستری')
     death_date = models.CharField(verbose_name='تاریخ فوت', max_length=10)
+    death = models.DateField(verbose_name='تاریخ فوت (میلادی)', null=True, blank=True, editable=False, db_index=True)
     admission_date = models.CharField(verbose_name='تاریخ پذیرش', max_length=10)
+    admission = models.DateField(verbose_name='تاریخ پذیرش (میلادی)', null=True, blank=True, editable=False, db_index=True)
     age = models.CharField(verbose_name='سن بیمار', max_length=3)
     gender = models.CharField(verbose_name='جنسیت', max_length=1, choices=gender_choices)
     patient = models.ForeignKey(Patient, on_delete=models.CASCADE, related_name='patient_dc', verbose_name='بیمار')
@@ -265,8 +317,49 @@ class DC(models.Model):
     class Meta:
         verbose_name = 'پرونده فوت'
         verbose_name_plural = 'پرونده های فوت'
+        indexes = [
+            models.Index(fields=['group', 'hospitalization_section', 'death'], name='dc_group_section'),
+            models.Index(fields=['group', 'doctor', 'death'], name='dc_group_doctor'),
+            models.Index(fields=['group', 'number'], name='dc_group_number'),
+            models.Index(fields=['group', 'death'], name='dc_group_death'),
+        ]
     
     def save(self, *args, **kwargs):
         if hasattr(self, '_user'):
             self.group = self._user.group
-        super().save(*args, **kwargs)
\ No newline at end of file
+        # تاریخ میلادی برای فیلتر و گروه بندی در دیتابیس
+        self.admission = to_gregorian(self.admission_date)
+        self.death = to_gregorian(self.death_date)
+        super().save(*args, **kwargs)
+
+class SearchEntry(models.Model):
+    group = models.ForeignKey(Group, on_delete=models.CASCADE, related_name='search_entry_group', verbose_name='گروه')
+    kind = models.CharField(verbose_name='نوع', max_length=20)
+    object_id = models.PositiveBigIntegerField(verbose_name='شناسه')
+    text = models.CharField(verbose_name='متن نرمال شده', max_length=500)
+
+    def __str__(self):
+        return self.text
+
+    class Meta:
+        verbose_name = 'ایندکس جستجو'
+        verbose_name_plural = 'ایندکس های جستجو'
+        constraints = [
+            models.UniqueConstraint(fields=['kind', 'object_id'], name='search_entry_unique_object'),
+        ]
+
+class SearchGram(models.Model):
+    entry = models.ForeignKey(SearchEntry, on_delete=models.CASCADE, related_name='grams', verbose_name='ایندکس')
+    group = models.ForeignKey(Group, on_delete=models.CASCADE, related_name='search_gram_group', verbose_name='گروه')
+    kind = models.CharField(verbose_name='نوع', max_length=20)
+    gram = models.CharField(verbose_name='سه حرفی', max_length=3)
+
+    def __str__(self):
+        return self.gram
+
+    class Meta:
+        verbose_name = 'سه حرفی جستجو'
+        verbose_name_plural = 'سه حرفی های جستجو'
+        indexes = [
+            models.Index(fields=['group', 'kind', 'gram'], name='search_gram_lookup'),
+        ]
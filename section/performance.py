@@ -0,0 +1,165 @@
+import contextvars
+import json
+import logging
+import random
+import threading
+import time
+import tracemalloc
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.template.backends.django import DjangoTemplates, Template, reraise
+from django.template.exceptions import TemplateDoesNotExist
+from . import metrics
+
+# اندازه گیری هر درخواست: زمان کل، تعداد و زمان کوئری ها، زمان رندر قالب و حافظه
+# نتیجه در هدر Server-Timing (قابل دیدن در تب Network مرورگر) و یک خط لاگ JSON میاد
+# همه درخواست ها اندازه گیری میشن و درخواست های کند همیشه با سطح WARNING لاگ میشن؛ هدر و خط لاگ INFO
+# فقط برای درصدی از درخواست ها (PERFORMANCE_SAMPLE_RATE) میاد. با METRICS_ENABLED نتیجه در section.metrics هم جمع میشه
+
+logger = logging.getLogger('section.performance')
+
+_current = contextvars.ContextVar('request_stats', default=None)
+
+class RequestStats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.queries = 0
+        self.query_time = 0.0
+        self.render_time = 0.0
+
+    def add_query(self, duration):
+        with self.lock:
+            self.queries += 1
+            self.query_time += duration
+
+    def add_render(self, duration):
+        with self.lock:
+            self.render_time += duration
+
+def record_query(execute, sql, params, many, context):
+    stats = _current.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.add_query(time.perf_counter() - started)
+
+def install_wrapper(sender, connection, **kwargs):
+    # روی همه اتصال ها، تا کوئری های thread های ویو های async هم شمرده بشن (contextvar همراه کار منتقل میشه)
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+def connect():
+    connection_created.connect(install_wrapper, dispatch_uid='performance_execute_wrapper')
+
+
+class TimedTemplate(Template):
+    def render(self, context=None, request=None):
+        stats = _current.get()
+        if stats is None:
+            return super().render(context, request)
+        started = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            stats.add_render(time.perf_counter() - started)
+
+class TimedDjangoTemplates(DjangoTemplates):
+    # بک اند قالب جنگو که زمان رندر قالب اصلی هر پاسخ رو ثبت میکنه (include ها جزو همون زمان هستن)
+    def from_string(self, template_code):
+        return TimedTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        try:
+            return TimedTemplate(self.engine.get_template(template_name), self)
+        except TemplateDoesNotExist as exc:
+            reraise(exc, self)
+
+
+class PerformanceMiddleware:
+    async_capable = True
+    sync_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+        if settings.PERFORMANCE_TRACE_MEMORY and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def sampled(self):
+        rate = settings.PERFORMANCE_SAMPLE_RATE
+        return rate >= 1 or (rate > 0 and random.random() < rate)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        sampled = self.sampled()
+        stats, token, started, memory = self.start()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, stats, started, memory, sampled)
+
+    async def __acall__(self, request):
+        sampled = self.sampled()
+        stats, token, started, memory = self.start()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, stats, started, memory, sampled)
+
+    def start(self):
+        stats = RequestStats()
+        token = _current.set(stats)
+        memory = None
+        if tracemalloc.is_tracing():
+            # پیک حافظه سراسریه، پس با درخواست های همزمان تقریبیه
+            tracemalloc.reset_peak()
+            memory = tracemalloc.get_traced_memory()[0]
+        return stats, token, time.perf_counter(), memory
+
+    def finish(self, request, response, stats, started, memory, sampled):
+        total = (time.perf_counter() - started) * 1000
+        match = getattr(request, 'resolver_match', None)
+        if settings.METRICS_ENABLED:
+            metrics.observe_request(
+                match.url_name if match else None, request.method, response.status_code,
+                total / 1000, stats.queries, stats.query_time,
+            )
+        slow = total >= settings.PERFORMANCE_SLOW_MS
+        if not (sampled or slow):
+            return response
+
+        db = stats.query_time * 1000
+        render = stats.render_time * 1000
+        memory_kb = round((tracemalloc.get_traced_memory()[1] - memory) / 1024) if memory is not None else None
+
+        timings = [
+            f'total;dur={total:.1f}',
+            f'db;dur={db:.1f};desc="{stats.queries} queries"',
+            f'render;dur={render:.1f}',
+        ]
+        if memory_kb is not None:
+            timings.append(f'mem;desc="{memory_kb} KB peak"')
+        if sampled:
+            response['Server-Timing'] = ', '.join(timings)
+
+        line = {
+            'method': request.method,
+            'path': request.path,
+            'view': match.url_name if match else None,
+            'status': response.status_code,
+            'total_ms': round(total, 1),
+            'db_queries': stats.queries,
+            'db_ms': round(db, 1),
+            'render_ms': round(render, 1),
+            'memory_kb': memory_kb,
+        }
+        logger.log(logging.WARNING if slow else logging.INFO, json.dumps(line, ensure_ascii=False))
+        return response
@@ -0,0 +1,193 @@
+import contextvars
+import logging
+import re
+import threading
+import time
+import traceback
+from collections import Counter
+from contextlib import contextmanager
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db.backends.signals import connection_created
+from django.test.runner import DiscoverRunner
+
+# پیدا کردن N+1 و کوئری های کند در توسعه و تست
+# کوئری های یک درخواست (یا یک تست) بر اساس شکل نرمال شده گروه میشن؛ اگه یک شکل بیشتر از QUERY_REPEAT_THRESHOLD بار
+# تکرار بشه، با خط کدی که اولین بار اجراش کرده گزارش میشه (QUERY_DETECTOR=warn) یا خطا میده (QUERY_DETECTOR=raise)
+# کوئری های کندتر از SLOW_QUERY_MS هم با همون خط کد لاگ میشن
+
+logger = logging.getLogger('section.querycheck')
+
+_current = contextvars.ContextVar('query_detector', default=None)
+
+STRING = re.compile(r"'(?:[^']|'')*'")
+NUMBER = re.compile(r'(?<![\w"])-?\d+(?:\.\d+)?\b')
+IN_LIST = re.compile(r'\bIN \((?:\s*(?:%s|\?)\s*,?)+\)', re.IGNORECASE)
+SPACE = re.compile(r'\s+')
+
+def normalize_sql(sql):
+    # مقدار ها حذف میشن تا کوئری هایی که فقط در پارامتر فرق دارن یک شکل بشن
+    sql = STRING.sub('?', sql)
+    sql = NUMBER.sub('?', sql)
+    sql = sql.replace('%s', '?')
+    sql = IN_LIST.sub('IN (...)', sql)
+    return SPACE.sub(' ', sql).strip()
+
+def origin():
+    # چند فریم آخر از کد خود پروژه (بدون جنگو و کتابخونه ها)
+    root = str(settings.BASE_DIR)
+    frames = [
+        frame for frame in traceback.extract_stack()[:-1]
+        if frame.filename.startswith(root) and 'site-packages' not in frame.filename
+        and frame.filename != __file__ and frame.name != 'record_query'
+    ]
+    return ''.join(traceback.format_list(frames[-settings.QUERY_STACK_DEPTH:]))
+
+
+class RepeatedQueries(AssertionError):
+    pass
+
+class QueryDetector:
+    # با propagate، داخل detector دیگه (درخواست داخل یک تست) گزارش به detector بیرونی اضافه میشه تا همون تست شکست بخوره
+    def __init__(self, label, threshold=None, slow_ms=None, propagate=False):
+        self.label = label
+        self.threshold = settings.QUERY_REPEAT_THRESHOLD if threshold is None else threshold
+        self.slow_ms = settings.SLOW_QUERY_MS if slow_ms is None else slow_ms
+        self.lock = threading.Lock()
+        self.shapes = Counter()
+        self.origins = {}
+        self.reports = []
+        self.propagate = propagate
+        self.parent = None
+        self.token = None
+
+    def __enter__(self):
+        self.parent = _current.get()
+        self.token = _current.set(self)
+        return self
+
+    def __exit__(self, *exc_info):
+        _current.reset(self.token)
+
+    def record(self, sql, duration):
+        shape = normalize_sql(sql)
+        with self.lock:
+            self.shapes[shape] += 1
+            first = shape not in self.origins
+            if first:
+                self.origins[shape] = None
+        # stack فقط برای اولین اجرا و کوئری های کند گرفته میشه، تا خود ابزار کد رو کند نکنه
+        if first:
+            self.origins[shape] = origin()
+        if duration * 1000 >= self.slow_ms:
+            logger.warning(
+                'slow query (%.1fms) in %s:\n%s\n%s', duration * 1000, self.label, sql, origin(),
+            )
+
+    def repeated(self):
+        # [(تعداد، شکل کوئری، خط کد)] برای شکل هایی که از حد مجاز بیشتر تکرار شدن
+        return [
+            (count, shape, self.origins[shape])
+            for shape, count in self.shapes.most_common()
+            if count > self.threshold
+        ]
+
+    def report(self):
+        reports = list(self.reports)
+        repeated = self.repeated()
+        if repeated:
+            lines = [f'{self.label}: {len(repeated)} repeated query shapes (threshold {self.threshold})']
+            for count, shape, stack in repeated:
+                lines.append(f'\n{count}x {shape}\n{stack}')
+            reports.append('\n'.join(lines))
+        return '\n\n'.join(reports)
+
+    def check(self, mode):
+        report = self.report()
+        if not report:
+            return
+        if self.propagate and self.parent is not None:
+            self.parent.reports.append(report)
+        elif mode == 'raise':
+            raise RepeatedQueries(report)
+        else:
+            logger.warning(report)
+
+@contextmanager
+def ignore():
+    # برای ساخت داده تست در حلقه، که تکرار کوئری هاش عمدیه
+    token = _current.set(None)
+    try:
+        yield
+    finally:
+        _current.reset(token)
+
+def record_query(execute, sql, params, many, context):
+    detector = _current.get()
+    if detector is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        detector.record(sql, time.perf_counter() - started)
+
+def install_wrapper(sender, connection, **kwargs):
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+def connect():
+    connection_created.connect(install_wrapper, dispatch_uid='querycheck_execute_wrapper')
+
+
+class QueryDetectorMiddleware:
+    # فقط با QUERY_DETECTOR فعاله
+    async_capable = True
+    sync_capable = True
+
+    def __init__(self, get_response):
+        if not settings.QUERY_DETECTOR:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        with QueryDetector(f'{request.method} {request.path}', propagate=True) as detector:
+            response = self.get_response(request)
+        detector.check(settings.QUERY_DETECTOR)
+        return response
+
+    async def __acall__(self, request):
+        with QueryDetector(f'{request.method} {request.path}', propagate=True) as detector:
+            response = await self.get_response(request)
+        detector.check(settings.QUERY_DETECTOR)
+        return response
+
+
+class DetectorTestRunner(DiscoverRunner):
+    # QUERY_DETECTOR=warn|raise python manage.py test: هر تست با detector خودش اجرا میشه (هر درخواست تست هم جدا)
+    # و در حالت raise تستی که N+1 داشته باشه شکست میخوره
+    def get_resultclass(self):
+        if not settings.QUERY_DETECTOR:
+            return super().get_resultclass()
+        return detector_result(super().get_resultclass() or self.test_runner.resultclass)
+
+def detector_result(base):
+    class DetectorResult(base):
+        def startTest(self, test):
+            super().startTest(test)
+            self.detector = QueryDetector(test.id())
+            self.detector.__enter__()
+
+        def stopTest(self, test):
+            self.detector.__exit__(None, None, None)
+            try:
+                self.detector.check(settings.QUERY_DETECTOR)
+            except RepeatedQueries as exc:
+                self.addFailure(test, (RepeatedQueries, exc, None))
+            super().stopTest(test)
+    return DetectorResult
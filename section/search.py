@@ -0,0 +1,169 @@
+import threading
+from functools import wraps
+from django.db import transaction
+from django.db.models import Case, Count, IntegerField, Value, When
+from django.db.models.functions import Length
+from .models import Group, Patient, Doctor, Section, Room, SectionCase, RoomCase, SearchEntry, SearchGram
+from .text import normalize
+
+# ایندکس جستجو: متن نرمال شده هر رکورد به سه حرفی ها (trigram) شکسته و در جدول ذخیره میشه
+# به جای LIKE '%q%' روی کل جدول، اول سه حرفی های عبارت از ایندکس پیدا میشن
+# عبارت های یک و دو حرفی سه حرفی ندارن و مستقیم روی متن نرمال شده (جدول کوچک تر ایندکس) با LIKE جستجو میشن
+
+SOURCES = {
+    'patient': (Patient, 'full_name'),
+    'doctor': (Doctor, 'full_name'),
+    'section': (Section, 'name'),
+    'room': (Room, 'name'),
+    'section_case': (SectionCase, 'number'),
+    'room_case': (RoomCase, 'number'),
+}
+
+def index_grams(text):
+    grams = set()
+    for word in text.split():
+        grams.update(query_grams(word))
+    return grams
+
+def query_grams(token):
+    return {token[i:i + 3] for i in range(len(token) - 2)}
+
+def matching_entries(group, kind, query):
+    query = normalize(query)
+    entries = SearchEntry.objects.filter(group=group, kind=kind)
+    if not query:
+        return entries.none()
+
+    for token in query.split():
+        # مثل icontains قبلی، '12' شماره '312' رو هم پیدا میکنه
+        if len(token) < 3:
+            entries = entries.filter(text__contains=token)
+            continue
+        grams = query_grams(token)
+        candidates = (
+            SearchGram.objects.filter(group=group, kind=kind, gram__in=grams)
+            .values('entry')
+            .annotate(matched=Count('gram', distinct=True))
+            .filter(matched=len(grams))
+            .values('entry')
+        )
+        entries = entries.filter(pk__in=candidates)
+        # سه حرفی ها ممکنه جدا جدا در متن باشن، پس زیررشته دوباره چک میشه
+        entries = entries.filter(text__contains=token)
+    return entries
+
+def matching_ids(group, kind, query):
+    # زیرکوئری lazy برای فیلتر pk__in در لیست ها
+    return matching_entries(group, kind, query).values('object_id')
+
+def search(group, kind, query, limit=10):
+    # نتایج رتبه بندی شده: تطابق کامل، شروع متن، شروع یک کلمه، بقیه؛ و در هر رتبه متن کوتاه تر جلوتر
+    normalized = normalize(query)
+    entries = matching_entries(group, kind, normalized).annotate(
+        rank=Case(
+            When(text=normalized, then=Value(0)),
+            When(text__startswith=normalized, then=Value(1)),
+            When(text__contains=f' {normalized}', then=Value(2)),
+            default=Value(3),
+            output_field=IntegerField(),
+        ),
+        length=Length('text'),
+    ).order_by('rank', 'length', 'object_id')
+    return list(entries.values_list('object_id', 'text')[:limit])
+
+def ranked_ids(group, kind, query, limit=10):
+    return [object_id for object_id, text in search(group, kind, query, limit)]
+
+def kind_of(model):
+    for kind, (source, field) in SOURCES.items():
+        if source is model:
+            return kind, field
+    return None, None
+
+def index_object(instance):
+    kind, field = kind_of(type(instance))
+    SearchEntry.objects.filter(kind=kind, object_id=instance.pk).delete()
+    text = normalize(getattr(instance, field))
+    if not text:
+        return
+    entry = SearchEntry.objects.create(group_id=instance.group_id, kind=kind, object_id=instance.pk, text=text)
+    SearchGram.objects.bulk_create([
+        SearchGram(entry=entry, group_id=instance.group_id, kind=kind, gram=gram)
+        for gram in index_grams(text)
+    ])
+
+def unindex_object(instance):
+    kind, field = kind_of(type(instance))
+    SearchEntry.objects.filter(kind=kind, object_id=instance.pk).delete()
+
+def rebuild_index(group=None, batch_size=2000):
+    # ساخت دوباره ایندکس یک گروه (یا همه گروه ها) با درج دسته ای
+    groups = [group] if group is not None else list(Group.objects.all())
+    for group in groups:
+        with transaction.atomic():
+            SearchGram.objects.filter(group=group).delete()
+            SearchEntry.objects.filter(group=group).delete()
+            for kind, (model, field) in SOURCES.items():
+                rows = model.objects.filter(group=group).values_list('pk', field).iterator(chunk_size=batch_size)
+                batch = []
+                for pk, value in rows:
+                    text = normalize(value)
+                    if text:
+                        batch.append(SearchEntry(group=group, kind=kind, object_id=pk, text=text))
+                    if len(batch) >= batch_size:
+                        _create_entries(batch, batch_size)
+                        batch = []
+                if batch:
+                    _create_entries(batch, batch_size)
+
+def _create_entries(entries, batch_size):
+    entries = SearchEntry.objects.bulk_create(entries, batch_size=batch_size)
+    SearchGram.objects.bulk_create([
+        SearchGram(entry_id=entry.pk, group_id=entry.group_id, kind=entry.kind, gram=gram)
+        for entry in entries
+        for gram in index_grams(entry.text)
+    ], batch_size=batch_size)
+
+
+# در ورود اکسل، به جای ایندکس ردیف به ردیف با سیگنال، شناسه رکورد های ساخته، تغییر یا حذف شده جمع میشه
+# و در پایان ویو فقط همون ها دسته ای ایندکس میشن
+_state = threading.local()
+
+def indexing_deferred():
+    return getattr(_state, 'dirty', None) is not None
+
+def mark_dirty(instance):
+    kind, field = kind_of(type(instance))
+    _state.dirty.setdefault(kind, set()).add(instance.pk)
+
+def index_objects(kind, ids, batch_size=500):
+    # رکورد هایی که دیگه وجود ندارن (حذف شده یا rollback شده) فقط از ایندکس پاک میشن
+    model, field = SOURCES[kind]
+    ids = sorted(ids)
+    for i in range(0, len(ids), batch_size):
+        chunk = ids[i:i + batch_size]
+        with transaction.atomic():
+            SearchGram.objects.filter(kind=kind, entry__object_id__in=chunk).delete()
+            SearchEntry.objects.filter(kind=kind, object_id__in=chunk).delete()
+            entries = []
+            for pk, group_id, value in model.objects.filter(pk__in=chunk).values_list('pk', 'group_id', field):
+                text = normalize(value)
+                if text:
+                    entries.append(SearchEntry(group_id=group_id, kind=kind, object_id=pk, text=text))
+            _create_entries(entries, batch_size)
+
+def deferred_indexing(view_func):
+    @wraps(view_func)
+    def _wrapped_view(request, *args, **kwargs):
+        if indexing_deferred():
+            return view_func(request, *args, **kwargs)
+
+        _state.dirty = {}
+        try:
+            return view_func(request, *args, **kwargs)
+        finally:
+            # رکورد هایی که قبل از خطای ویو ذخیره شدن هم باید ایندکس بشن
+            dirty, _state.dirty = _state.dirty, None
+            for kind, ids in dirty.items():
+                index_objects(kind, ids)
+    return _wrapped_view
@@ -0,0 +1,21 @@
+from django.db.models.signals import post_save, post_delete
+from . import search
+
+# همگام نگه داشتن ایندکس جستجو با ذخیره و حذف رکورد ها
+
+def update_search_index(sender, instance, **kwargs):
+    if search.indexing_deferred():
+        search.mark_dirty(instance)
+        return
+    search.index_object(instance)
+
+def remove_from_search_index(sender, instance, **kwargs):
+    if search.indexing_deferred():
+        search.mark_dirty(instance)
+        return
+    search.unindex_object(instance)
+
+def connect():
+    for model, field in search.SOURCES.values():
+        post_save.connect(update_search_index, sender=model, dispatch_uid=f'search_save_{model.__name__}')
+        post_delete.connect(remove_from_search_index, sender=model, dispatch_uid=f'search_delete_{model.__name__}')
@@ -0,0 +1,39 @@
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+# پروفایل کارایی SQLite برای استقرار تک سرور
+# در حالت WAL خواننده ها منتظر تراکنش نوشتن نمیمونن و نوشتن هم منتظر خواننده ها نیست
+
+def apply_pragmas(sender, connection, **kwargs):
+    if connection.vendor != 'sqlite' or not settings.SQLITE_TUNING:
+        return
+    with connection.cursor() as cursor:
+        for name, value in settings.SQLITE_PRAGMAS.items():
+            cursor.execute(f'PRAGMA {name} = {value}')
+        # برای اتصال های ماندگار (CONN_MAX_AGE)، آمار جدول ها در صورت نیاز و با سقف محدود به روز میشه
+        cursor.execute('PRAGMA optimize = 0x10002')
+
+def current_pragmas(using='default'):
+    with connections[using].cursor() as cursor:
+        values = {}
+        for name in settings.SQLITE_PRAGMAS:
+            cursor.execute(f'PRAGMA {name}')
+            values[name] = cursor.fetchone()[0]
+    return values
+
+def optimize(using='default', analyze=False):
+    # اجرای دوره ای (کرون یا بعد از ورود های بزرگ): ANALYZE کامل یا PRAGMA optimize سبک
+    connection = connections[using]
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        if analyze:
+            cursor.execute('ANALYZE')
+        cursor.execute('PRAGMA optimize')
+        if settings.SQLITE_TUNING:
+            # فایل WAL به دیتابیس اصلی برگردونده و کوتاه میشه
+            cursor.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+
+def connect():
+    connection_created.connect(apply_pragmas, dispatch_uid='sqlite_pragmas')
@@ -0,0 +1,157 @@
+import gzip
+import mimetypes
+import os
+import re
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseNotModified
+from django.utils._os import safe_join
+from django.utils.http import http_date
+
+# سرو فایل های استاتیک بدون django.views.static.serve
+# collectstatic نام های هش دار و نسخه .gz فایل های متنی رو میسازه و میدلور اون ها رو با کش بلندمدت میفرسته
+
+COMPRESSIBLE = ('.css', '.js', '.map', '.svg', '.json', '.txt', '.html', '.ttf', '.eot', '.otf')
+MIN_COMPRESS_SIZE = 256
+HASHED_NAME = re.compile(r'\.[0-9a-f]{12}\.\w+$')
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    # فایلی که در manifest نباشه (مثلا قبل از اولین collectstatic) با نام اصلی سرو میشه
+    manifest_strict = False
+
+    def stored_name(self, name):
+        if self.hash_key(self.clean_name(name)) not in self.hashed_files:
+            return name
+        return super().stored_name(name)
+
+    def url_converter(self, name, hashed_files, template=None):
+        # ارجاع به فایلی که وجود نداره (مثل .map جا افتاده یک کتابخونه) بدون تغییر میمونه
+        converter = super().url_converter(name, hashed_files, template)
+
+        def safe_converter(matchobj):
+            try:
+                return converter(matchobj)
+            except ValueError:
+                return matchobj['matched']
+        return safe_converter
+
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run, **options)
+        if dry_run:
+            return
+        for name in [*paths, *self.hashed_files.values()]:
+            if name.endswith(COMPRESSIBLE) and self.exists(name):
+                compress(self.path(name))
+
+def compress(path):
+    # نسخه .gz فقط وقتی ساخته میشه که کوچیک تر باشه و از فایل اصلی قدیمی تر نباشه
+    compressed = path + '.gz'
+    if os.path.exists(compressed) and os.path.getmtime(compressed) >= os.path.getmtime(path):
+        return
+    with open(path, 'rb') as source:
+        data = source.read()
+    if len(data) < MIN_COMPRESS_SIZE:
+        return
+    packed = gzip.compress(data, compresslevel=9, mtime=0)
+    if len(packed) < len(data):
+        with open(compressed, 'wb') as target:
+            target.write(packed)
+
+def file_etag(stat):
+    return f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+
+def static_response(request, path, root, max_age):
+    try:
+        full_path = safe_join(root, path)
+    except SuspiciousFileOperation:
+        raise Http404
+    if not os.path.isfile(full_path):
+        raise Http404
+
+    encoding = None
+    if 'gzip' in request.headers.get('Accept-Encoding', '') and os.path.isfile(full_path + '.gz'):
+        encoding, served_path = 'gzip', full_path + '.gz'
+    else:
+        served_path = full_path
+
+    stat = os.stat(served_path)
+    etag = file_etag(stat)
+    if etag in request.headers.get('If-None-Match', ''):
+        response = HttpResponseNotModified()
+    else:
+        content_type = mimetypes.guess_type(full_path)[0] or 'application/octet-stream'
+        response = FileResponse(open(served_path, 'rb'), content_type=content_type)
+        response['Content-Length'] = stat.st_size
+        response['Last-Modified'] = http_date(stat.st_mtime)
+        if encoding:
+            response['Content-Encoding'] = encoding
+    response['ETag'] = etag
+    response['Vary'] = 'Accept-Encoding'
+    # نام هش دار هیچوقت محتوای دیگه ای نمیگیره، پس تا یک سال بدون پرسیدن دوباره معتبره
+    if HASHED_NAME.search(path):
+        response['Cache-Control'] = 'public, max-age=31536000, immutable'
+    else:
+        response['Cache-Control'] = f'public, max-age={max_age}'
+    return response
+
+class StaticFilesMiddleware:
+    # قبل از سشن و احراز هویت، تا درخواست فایل استاتیک هیچ کار اضافه ای انجام نده
+    # زیر ASGI مستقیم async اجرا میشه تا بقیه درخواست ها بین همگام و async جابجا نشن
+    async_capable = True
+    sync_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.prefix = settings.STATIC_URL
+        self.root = getattr(settings, 'STATIC_ROOT', None) or settings.STATICFILES_DIRS[0]
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def is_static(self, request):
+        return request.method in ('GET', 'HEAD') and request.path.startswith(self.prefix)
+
+    def serve(self, request):
+        try:
+            return static_response(request, request.path[len(self.prefix):], self.root, settings.STATIC_MAX_AGE)
+        except Http404:
+            return None
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if self.is_static(request):
+            response = self.serve(request)
+            if response is not None:
+                return response
+        return self.get_response(request)
+
+    async def __acall__(self, request):
+        if self.is_static(request):
+            # خوندن فایل در thread، تا حلقه رویداد منتظر دیسک نمونه
+            response = await sync_to_async(self.serve)(request)
+            if response is not None:
+                return response
+        return await self.get_response(request)
+
+def serve_media(request, path):
+    # فایل های آپلود شده (مثل اکسل های media/excels)؛ در صورت تنظیم، ارسال فایل به وب سرور سپرده میشه
+    try:
+        full_path = safe_join(settings.MEDIA_ROOT, path)
+    except SuspiciousFileOperation:
+        raise Http404
+    if not os.path.isfile(full_path):
+        raise Http404
+
+    if settings.MEDIA_SENDFILE == 'x-sendfile':
+        response = HttpResponse(content_type=mimetypes.guess_type(full_path)[0] or 'application/octet-stream')
+        response['X-Sendfile'] = full_path
+        return response
+    if settings.MEDIA_SENDFILE == 'x-accel-redirect':
+        response = HttpResponse(content_type=mimetypes.guess_type(full_path)[0] or 'application/octet-stream')
+        response['X-Accel-Redirect'] = settings.MEDIA_ACCEL_PREFIX + path
+        return response
+    response = static_response(request, path, settings.MEDIA_ROOT, 0)
+    response['Cache-Control'] = 'private, no-cache'
+    return response
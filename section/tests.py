@@ -1,3 +1,874 @@
-from django.test import TestCase
+import json
+import logging
+import os
+import tempfile
+import time
+from io import StringIO
+from unittest import mock
+from asgiref.sync import async_to_sync
+from django import forms
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import IntegrityError, connection, transaction
+from django.db.migrations.executor import MigrationExecutor
+from django.db.migrations.loader import MigrationLoader
+from django.shortcuts import redirect
+from django.test import Client, RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils.module_loading import import_string
+from . import cache as group_cache
+from .static import compress
+from . import concurrency, frames, metrics, performance, querycheck, search, views
+from .forms import MultiDoctorForm, MultiSectionForm
+from .management.commands.explain_queries import Command as ExplainQueriesCommand
+from .identity import find_patient, resolve_patient, merge_duplicates
+from .models import (
+    Group, CustomUser, Excel, Expertise, Section, Room, Doctor, Patient, SectionCase, RoomCase, DC, SearchEntry
+)
 
-# Create your tests here.
+
+def seed_group(name='گروه تست', size=30):
+    # داده نمونه یک گروه: چند بخش و اتاق و پزشک، و size پرونده از هر نوع
+    group = Group.objects.create(name=name)
+    user = CustomUser.objects.create_user(username=f'manager-{group.pk}', password='pass', group=group)
+    Excel.objects.create(group=group, file='excels/test.xlsx')
+
+    expertises = [Expertise.objects.create(group=group, name=f'تخصص {i}') for i in range(3)]
+    sections = [Section.objects.create(group=group, name=f'بخش {i}') for i in range(3)]
+    rooms = [Room.objects.create(group=group, name=f'اتاق {i}') for i in range(3)]
+    for item in sections + rooms:
+        item.expertises.set(expertises)
+
+    doctors = []
+    for i in range(5):
+        doctor = Doctor.objects.create(group=group, full_name=f'دکتر {i}', grade='2', personnel_code=str(i))
+        doctor.sections.set(sections)
+        doctor.rooms.set(rooms)
+        doctor.expertises.set(expertises)
+        doctors.append(doctor)
+
+    patients = []
+    for i in range(size):
+        patient = Patient.objects.create(group=group, full_name=f'بیمار {i}')
+        patient.sections.set(sections)
+        patient.rooms.set(rooms)
+        patients.append(patient)
+
+    for i, patient in enumerate(patients):
+        month = i % 12 + 1
+        SectionCase.objects.create(
+            group=group, section=sections[i % 3], doctor=doctors[i % 5], representative_doctor=doctors[0],
+            patient=patient, number=str(i), insurance='تامین اجتماعی',
+            admission_date=f'1402/{month}/1', discharge_date=f'1402/{month}/4',
+            delivery_date='nan' if i % 4 == 0 else f'1402/{month}/10',
+            defect_sheet='2' if i % 3 == 0 else None, defect_type=['4'] if i % 3 == 0 else None,
+        )
+        RoomCase.objects.create(
+            group=group, room=rooms[i % 3], doctor=doctors[i % 5], patient=patient, number=str(i),
+            hospitalization_date=f'1402/{month}/1', operation_date=f'1402/{month}/2',
+            operation_type=str(i % 3 + 1), k='10',
+        )
+        DC.objects.create(
+            group=group, doctor=doctors[i % 5], hospitalization_section=sections[i % 3], patient=patient,
+            number=str(i), death_date=f'1402/{month}/5', admission_date=f'1402/{month}/1',
+            age='60', gender=str(i % 2 + 1),
+        )
+
+    return group, user
+
+
+class SeededTestCase(TestCase):
+    # یک گروه نمونه (seed_group) با کاربر مسئول وارد شده
+    @classmethod
+    def setUpTestData(cls):
+        cls.group, cls.user = seed_group()
+
+    def setUp(self):
+        # کش بین تست ها مشترکه و شناسه گروه ها در هر تست تکرار میشه
+        cache.clear()
+        frames.clear_frames()
+        self.client.force_login(self.user)
+
+
+class QueryBudgetTests(SeededTestCase):
+    # حداکثر تعداد کوئری هر صفحه، مستقل از تعداد ردیف ها
+    # اگه یه قالب برای هر ردیف کوئری جدا بزنه (N+1)، این تست ها شکست میخورن
+    budgets = {
+        'main': 32,
+        'section_list': 8,
+        'room_list': 8,
+        'doctor_list': 8,
+        'expertise_list': 6,
+        'patient_list': 9,
+        'section_case_list': 8,
+        'room_case_list': 8,
+        'dc_list': 6,
+        'dc_all_detail': 11,
+        'analyze_defect': 7,
+    }
+
+    def assertQueryBudget(self, url, budget):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertLessEqual(
+            len(context), budget,
+            f'{url} ran {len(context)} queries (budget {budget}):\n' +
+            '\n'.join(query['sql'] for query in context.captured_queries)
+        )
+
+    def test_list_views(self):
+        for name, budget in self.budgets.items():
+            with self.subTest(view=name):
+                self.assertQueryBudget(reverse(name), budget)
+
+    def test_keyset_pages(self):
+        for name in ('section_case_list', 'room_case_list', 'dc_list', 'patient_list'):
+            with self.subTest(view=name):
+                self.assertQueryBudget(reverse(name) + '?after=5&estimate=1', self.budgets[name] + 2)
+
+    def test_detail_pages(self):
+        # صفحه جزئیات یک پوسته سبکه و کارت ها، نمودار ها و هر تب جدا گرفته میشن
+        section = Section.objects.filter(group=self.group).first()
+        doctor = Doctor.objects.filter(group=self.group).first()
+        query = '?start=1402/1/1&end=1402/12/29'
+        for name, obj, shell_budget, stats_budget in (('section', section, 6, 9), ('doctor', doctor, 9, 13)):
+            with self.subTest(view=f'{name}_detail'):
+                self.assertQueryBudget(reverse(f'{name}_detail', args=[obj.pk]) + query, shell_budget)
+            with self.subTest(view=f'{name}_stats'):
+                self.assertQueryBudget(reverse(f'{name}_stats', args=[obj.pk]) + query, stats_budget)
+            with self.subTest(view=f'{name}_charts'):
+                self.assertQueryBudget(reverse(f'{name}_charts', args=[obj.pk]) + query, 9)
+            for tab in ('sc', 'dc', 'nc', 'defc'):
+                with self.subTest(view=f'{name}_tab', tab=tab):
+                    self.assertQueryBudget(reverse(f'{name}_tab', args=[obj.pk, tab]) + '?page=2', 8)
+
+    def test_room_analysis(self):
+        # تحلیل اتاق ها با جدول محوری ساخته میشه و تعداد کوئری به تعداد اتاق های انتخاب شده بستگی نداره
+        rooms = list(Room.objects.filter(group=self.group).order_by('id'))
+        counts = []
+        for selected in (rooms[:1], rooms):
+            with CaptureQueriesContext(connection) as context:
+                response = self.client.post(reverse('analyze_room'), {'rooms': [room.pk for room in selected]})
+            self.assertEqual(response.status_code, 200)
+            self.assertLessEqual(len(context), 9)
+            counts.append(len(context))
+        self.assertEqual(counts[0], counts[1])
+
+        results = response.context['results']
+        self.assertEqual(list(results), [room.name for room in rooms])
+        for operation_type, room in zip(('small', 'medium', 'big'), rooms):
+            data = results[room.name]
+            self.assertEqual(data['filtered_room_cases_count'], 10)
+            self.assertEqual(data[f'filtered_{operation_type}_room_cases_count'], 10)
+            self.assertEqual(data['patients_count'], 10)
+            self.assertEqual(data['doctors_count'], 5)
+            self.assertEqual(data['linked_doctors_count'], 5)
+            self.assertEqual(sorted(data['doctor_cases'].values()), [2] * 5)
+
+    def test_patient_detail_constant_queries(self):
+        # تعداد کوئری صفحه بیمار به تعداد پرونده هاش بستگی نداره
+        first, second = Patient.objects.filter(group=self.group).order_by('id')[:2]
+        with querycheck.ignore():
+            for i in range(10):
+                for model in (SectionCase, RoomCase, DC):
+                    case = model.objects.filter(patient=second).first()
+                    case.pk = None
+                    case.number = f'extra-{i}'
+                    case.doctor = Doctor.objects.filter(group=self.group)[i % 5]
+                    case.save()
+
+        counts = []
+        for patient in (first, second):
+            with CaptureQueriesContext(connection) as context:
+                response = self.client.get(reverse('patient_detail', args=[patient.pk]))
+            self.assertEqual(response.status_code, 200)
+            counts.append(len(context))
+        self.assertEqual(counts[0], counts[1])
+        self.assertEqual(len(response.context['doctors']), 5)
+
+        timeline = self.client.get(reverse('patient_timeline', args=[second.pk])).json()
+        self.assertEqual(len(timeline['events']), 33)
+        dates = [event['date'] for event in timeline['events']]
+        self.assertEqual(dates[0], '1402/2/1')
+
+
+class KeysetPaginationTests(SeededTestCase):
+    # با صفحه 7 تایی، 30 پرونده در 5 صفحه: رفت با after و برگشت با before
+    def page(self, params):
+        response = self.client.get(reverse('section_case_list'), params)
+        self.assertEqual(response.status_code, 200)
+        return response.context['page_obj']
+
+    @override_settings(KEYSET_PAGINATION=True)
+    def test_walk_pages(self):
+        ids = list(SectionCase.objects.filter(group=self.group).order_by('id').values_list('pk', flat=True))
+        with mock.patch.object(views.SectionCaseListView, 'paginate_by', 7):
+            forward = [self.page({})]
+            while forward[-1].has_next():
+                forward.append(self.page({'after': forward[-1].next_cursor}))
+            backward = [forward[-1]]
+            while backward[-1].has_previous():
+                backward.append(self.page({'before': backward[-1].previous_cursor}))
+
+        self.assertEqual([len(page) for page in forward], [7, 7, 7, 7, 2])
+        self.assertEqual([case.pk for page in forward for case in page], ids)
+        self.assertEqual([case.pk for page in reversed(backward) for case in page], ids)
+        self.assertEqual([len(page) for page in backward], [2, 7, 7, 7, 7])
+
+        for pages in (forward, backward[::-1]):
+            self.assertEqual([page.has_previous() for page in pages], [False, True, True, True, True])
+            self.assertEqual([page.has_next() for page in pages], [True, True, True, True, False])
+
+    def test_estimated_count(self):
+        # شمارش تا سقف estimate_cap، و بیشتر از اون فقط سقف با exact=False
+        for cap, expected in ((100, {'count': 30, 'exact': True}), (20, {'count': 20, 'exact': False})):
+            with self.subTest(cap=cap), mock.patch.object(views.SectionCaseListView, 'estimate_cap', cap):
+                self.assertEqual(self.page({'after': 0, 'estimate': 1}).estimated_count, expected)
+        self.assertIsNone(self.page({'after': 0}).estimated_count)
+
+
+class JsonEndpointTests(SeededTestCase):
+    # API های JSON نمودار ها: فیلتر با شناسه معتبر، و 404 برای شناسه گروه دیگه یا غیر عددی
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        other = Group.objects.create(name='گروه دیگر')
+        cls.other_room = Room.objects.create(group=other, name='اتاق دیگر')
+        cls.other_section = Section.objects.create(group=other, name='بخش دیگر')
+
+    def test_trend(self):
+        room = Room.objects.filter(group=self.group).order_by('id').first()
+        data = self.client.get(reverse('trend'), {'room': room.pk}).json()
+        self.assertEqual(sum(data['operations']), 10)
+        self.assertEqual(sum(data['operation_types']['1']), 10)
+        self.assertNotIn('admissions', data)
+
+        data = self.client.get(reverse('trend')).json()
+        self.assertEqual(sum(data['admissions']), 30)
+        self.assertEqual(sum(data['deaths']), 30)
+        self.assertEqual(len(data['months']), len(data['admissions']))
+
+        for name, value in (('room', self.other_room.pk), ('room', 'abc'), ('section', '1.5'), ('doctor', '-1')):
+            with self.subTest(name=name, value=value):
+                self.assertEqual(self.client.get(reverse('trend'), {name: value}).status_code, 404)
+
+    def test_leaderboard(self):
+        data = self.client.get(reverse('leaderboard')).json()
+        self.assertEqual(set(data), {'all', '1', '2', '3'})
+        self.assertEqual([row['count'] for row in data['all']], [6] * 5)
+
+        room = Room.objects.filter(group=self.group).order_by('id').first()
+        section = Section.objects.filter(group=self.group).first()
+        data = self.client.get(reverse('leaderboard'), {'room': room.pk, 'section': section.pk, 'limit': 2}).json()
+        self.assertEqual(len(data['all']), 2)
+        self.assertEqual([row['count'] for row in data['all']], [2, 2])
+        self.assertEqual(data['2'], [])
+
+        for name, value in (('room', self.other_room.pk), ('room', 'abc'), ('section', self.other_section.pk), ('section', 'abc')):
+            with self.subTest(name=name, value=value):
+                self.assertEqual(self.client.get(reverse('leaderboard'), {name: value}).status_code, 404)
+
+    def test_distribution(self):
+        # همه پرونده های بخش 3 روز بستری بودن و 22 تا (بدون nan) 6 روز بعد از ترخیص تحویل شدن
+        data = self.client.get(reverse('group_distribution')).json()
+        self.assertEqual(data['kind'], 'section')
+        self.assertEqual(data['cases_count'], 30)
+        stay, arrive = data['stay'], data['arrive']
+        self.assertEqual(stay['histogram']['labels'], ['<0', '0', '1', '2', '3', '4', '5-6', '7-9', '10-13', '14-20', '21-29', '30+'])
+        self.assertEqual(stay['histogram']['counts'], [0, 0, 0, 0, 30, 0, 0, 0, 0, 0, 0, 0])
+        self.assertEqual((stay['count'], stay['mean'], stay['median'], stay['p99']), (30, 3.0, 3.0, 3.0))
+        self.assertEqual(arrive['histogram']['labels'][:3], ['<0', '0-2', '3-6'])
+        self.assertEqual(arrive['histogram']['counts'][2], 22)
+        self.assertEqual(sum(arrive['histogram']['counts']), 22)
+        self.assertEqual((arrive['count'], arrive['median']), (22, 6.0))
+
+        # فوتی ها 4 روز بعد از پذیرش فوت کردن و تاریخ تحویل ندارن
+        data = self.client.get(reverse('group_distribution'), {'kind': 'dc', 'start': '1402/1/1', 'end': '1402/6/31'}).json()
+        self.assertEqual(data['kind'], 'dc')
+        self.assertEqual(data['cases_count'], 18)
+        self.assertEqual(data['stay']['histogram']['counts'][5], 18)
+        self.assertEqual(data['arrive']['count'], 0)
+        self.assertIsNone(data['arrive']['median'])
+        self.assertEqual(sum(data['arrive']['histogram']['counts']), 0)
+
+        doctor = Doctor.objects.filter(group=self.group).order_by('id').first()
+        data = self.client.get(reverse('doctor_distribution', args=[doctor.pk])).json()
+        self.assertEqual(data['cases_count'], 6)
+
+        # مدت بستری پرونده های یک بخش از 0 تا 9 روز
+        section = Section.objects.filter(group=self.group).order_by('id').first()
+        with querycheck.ignore():
+            for days, case in enumerate(SectionCase.objects.filter(section=section).order_by('id')):
+                year, month, day = case.admission_date.split('/')
+                case.discharge_date = f'{year}/{month}/{int(day) + days}'
+                case.save()
+        self.group.bump_data_version()
+        stay = self.client.get(reverse('section_distribution', args=[section.pk])).json()['stay']
+        self.assertEqual(stay['histogram']['counts'], [0, 1, 1, 1, 1, 1, 2, 3, 0, 0, 0, 0])
+        self.assertEqual(
+            {key: stay[key] for key in ('count', 'mean', 'median', 'p75', 'p90', 'p99')},
+            {'count': 10, 'mean': 4.5, 'median': 4.5, 'p75': 6.8, 'p90': 8.1, 'p99': 8.9},
+        )
+
+        self.assertEqual(self.client.get(reverse('section_distribution', args=[self.other_section.pk])).status_code, 403)
+
+    def test_autocomplete(self):
+        url = reverse('autocomplete', args=['patient'])
+        data = self.client.get(url, {'q': 'بیمار 2', 'limit': 3}).json()
+        self.assertEqual([row['text'] for row in data['results']], ['بیمار 2', 'بیمار 20', 'بیمار 21'])
+        self.assertEqual(self.client.get(reverse('autocomplete', args=['nurse'])).status_code, 404)
+
+        # کاربر غیر مسئول نام بیماران رو نمیبینه ولی پزشکان و بخش ها رو برای فیلتر لیست ها میبینه
+        staff = CustomUser.objects.create_user(username='staff', password='pass', group=self.group, is_manager=False)
+        self.client.force_login(staff)
+        self.assertEqual(self.client.get(url).status_code, 403)
+        self.assertEqual(len(self.client.get(reverse('autocomplete', args=['doctor'])).json()['results']), 5)
+
+        # کاربر بدون گروه نتیجه ای نمیگیره
+        self.client.force_login(CustomUser.objects.create_user(username='no-group', password='pass'))
+        self.assertEqual(self.client.get(url, {'q': 'بیمار'}).json(), {'results': []})
+
+
+class CaseListFilterTests(SeededTestCase):
+    # بازه تاریخ همراه با فیلتر شماره و پزشک در لیست پرونده ها (ماه های 1 تا 6 یعنی پرونده های i % 12 < 6)
+    def numbers(self, name, context_name, params):
+        response = self.client.get(reverse(name), params)
+        self.assertEqual(response.status_code, 200)
+        return {case.number for case in response.context[context_name]}
+
+    def test_range_with_filters(self):
+        doctors = list(Doctor.objects.filter(group=self.group).order_by('id'))
+        dates = {'start': '1402/1/1', 'end': '1402/6/31'}
+        in_range = {str(i) for i in range(30) if i % 12 < 6}
+        for name, context_name in (('section_case_list', 'section_cases'), ('room_case_list', 'room_cases')):
+            for params, expected in (
+                (dates, in_range),
+                ({'doctor': doctors[0].pk}, {'0', '5', '10', '15', '20', '25'}),
+                ({**dates, 'doctor': doctors[0].pk}, {'0', '5', '15', '25'}),
+                ({**dates, 'number': '1'}, {'1', '12', '13', '14', '15', '16', '17'}),
+                ({**dates, 'number': '1', 'doctor': doctors[2].pk}, {'12', '17'}),
+                ({**dates, 'number': '7'}, {'17', '27'}),
+                ({**dates, 'doctor': 'abc'}, in_range),
+            ):
+                with self.subTest(view=name, **params):
+                    self.assertEqual(self.numbers(name, context_name, params), expected)
+
+
+class GroupMultiFormTests(SeededTestCase):
+    def test_group_choices(self):
+        # شناسه گروه دیگه یا غیر عددی رد میشه و شناسه های معتبر بدون لود کل رکورد ها قبول میشن
+        own = list(Section.objects.filter(group=self.group).order_by('id').values_list('pk', flat=True))
+        other = Section.objects.create(group=Group.objects.create(name='گروه دیگر'), name='بخش دیگر')
+        form = MultiSectionForm({'sections': own[:2]}, group=self.group)
+        self.assertTrue(form.is_valid())
+        self.assertEqual(sorted(section.pk for section in form.cleaned_data['sections']), own[:2])
+
+        for value in ([own[0], other.pk], [other.pk], ['abc']):
+            with self.subTest(value=value):
+                form = MultiSectionForm({'sections': value}, group=self.group)
+                self.assertFalse(form.is_valid())
+                self.assertIn('sections', form.errors)
+
+    def test_incremental_widget(self):
+        # تا آستانه همه گزینه ها رندر میشن و بالاتر از اون فقط گزینه های انتخاب شده با autocomplete
+        doctors = list(Doctor.objects.filter(group=self.group).order_by('id'))
+        form = MultiDoctorForm(group=self.group)
+        self.assertFalse(form.incremental)
+        self.assertIsInstance(form.fields['doctors'].widget, forms.CheckboxSelectMultiple)
+
+        class SmallDoctorForm(MultiDoctorForm):
+            incremental_threshold = len(doctors) - 1
+
+        form = SmallDoctorForm(group=self.group)
+        self.assertTrue(form.incremental)
+        widget = form.fields['doctors'].widget
+        self.assertIs(type(widget), forms.SelectMultiple)
+        self.assertEqual(widget.attrs['data-autocomplete'], reverse('autocomplete', args=['doctor']))
+        self.assertEqual(list(widget.choices), [])
+
+        form = SmallDoctorForm({'doctors': [doctors[1].pk, 'abc']}, group=self.group)
+        self.assertEqual(list(form.fields['doctors'].widget.choices), [(doctors[1].pk, str(doctors[1]))])
+        self.assertFalse(form.is_valid())
+        form = SmallDoctorForm({'doctors': [doctors[1].pk]}, group=self.group)
+        self.assertTrue(form.is_valid())
+
+
+class SearchIndexTests(SeededTestCase):
+    def numbers(self, kind, query):
+        model = search.SOURCES[kind][0]
+        return set(model.objects.filter(pk__in=search.matching_ids(self.group, kind, query)).values_list('number', flat=True))
+
+    def test_number_substring(self):
+        # عبارت کوتاه هر جای شماره رو پیدا میکنه، نه فقط ابتداش
+        with querycheck.ignore():
+            for number in ('312', '1200'):
+                case = SectionCase.objects.filter(group=self.group).order_by('id').first()
+                case.pk, case.number = None, number
+                case.save()
+        self.assertEqual(self.numbers('section_case', '12'), {'12', '312', '1200'})
+        self.assertEqual(self.numbers('section_case', '3'), {'3', '13', '23', '312'})
+        self.assertEqual(self.numbers('section_case', '120'), {'1200'})
+        self.assertEqual(self.numbers('room_case', '9'), {'9', '19', '29'})
+        self.assertEqual(search.ranked_ids(self.group, 'doctor', 'تر 3'), list(
+            Doctor.objects.filter(group=self.group, full_name='دکتر 3').values_list('pk', flat=True)
+        ))
+
+    def test_deferred_indexing(self):
+        # در پایان ورود فقط رکورد های تغییر کرده دوباره ایندکس میشن، حتی اگه ویو خطا بده
+        cases = list(SectionCase.objects.filter(group=self.group).order_by('id')[:3])
+        untouched = dict(SearchEntry.objects.filter(group=self.group).exclude(
+            kind='section_case', object_id__in=[case.pk for case in cases],
+        ).values_list('pk', 'text'))
+
+        @search.deferred_indexing
+        def import_view(request):
+            cases[0].number = 'A-9001'
+            cases[0].save()
+            cases[1].delete()
+            cases[2].pk, cases[2].number = None, 'B-9002'
+            cases[2].save()
+            self.assertFalse(SearchEntry.objects.filter(text__in=['a-9001', 'b-9002']).exists())
+            raise ValueError
+
+        with self.assertRaises(ValueError):
+            import_view(RequestFactory().post('/'))
+
+        self.assertEqual(self.numbers('section_case', '900'), {'A-9001', 'B-9002'})
+        self.assertEqual(self.numbers('section_case', '1'), {'1', *(str(i) for i in range(10, 20)), '21', 'A-9001'} - {cases[1].number})
+        self.assertEqual(dict(SearchEntry.objects.filter(pk__in=untouched).values_list('pk', 'text')), untouched)
+
+
+class AnalyticsBackendTests(SeededTestCase):
+    # بک اند ORM و pandas (ANALYTICS_BACKEND) برای هر تحلیل دقیقا همون خروجی رو میدن
+    ranges = ({}, {'start': '1402/2/1', 'end': '1402/6/31'})
+
+    def contexts(self, method, url, data, keys):
+        contexts = {}
+        for backend in ('orm', 'pandas'):
+            with override_settings(ANALYTICS_BACKEND=backend):
+                response = getattr(self.client, method)(url, data)
+            self.assertEqual(response.status_code, 200)
+            contexts[backend] = {key: response.context[key] for key in keys}
+        return contexts['orm'], contexts['pandas']
+
+    def assertSameAnalysis(self, method, url, data, keys):
+        orm, pandas = self.contexts(method, url, data, keys)
+        self.assertEqual(orm, pandas)
+        return orm
+
+    def test_multi_analysis(self):
+        for name, field, model in (
+            ('analyze_section', 'sections', Section),
+            ('analyze_doctor', 'doctors', Doctor),
+            ('analyze_room', 'rooms', Room),
+        ):
+            ids = list(model.objects.filter(group=self.group).values_list('pk', flat=True))
+            for dates in self.ranges:
+                with self.subTest(view=name, **dates):
+                    orm = self.assertSameAnalysis('post', reverse(name), {field: ids, **dates}, ['results'])
+                    self.assertEqual(len(orm['results']), len(ids))
+
+    def test_dc_and_defect_pages(self):
+        section = Section.objects.filter(group=self.group).first()
+        keys = [
+            'dc_cases_count', 'dc_doctors_count', 'dc_patients_count',
+            'average_arrive_daies', 'average_stay_daies', 'age_counts', 'gender_counts',
+        ]
+        for dates in self.ranges:
+            with self.subTest(view='dc_all_detail', **dates):
+                self.assertSameAnalysis('get', reverse('dc_all_detail'), dates, keys)
+
+        keys = ['defect_counts', 'defect_type_counts', 'defect_percents', 'defect_type_percents']
+        for params in (*self.ranges, {'section': section.pk}):
+            with self.subTest(view='analyze_defect', **params):
+                orm = self.assertSameAnalysis('get', reverse('analyze_defect'), params, keys)
+        self.assertGreater(sum(orm['defect_counts'].values()), 0)
+
+
+class FragmentCacheTests(SeededTestCase):
+    def test_fragment_caching_headers(self):
+        # فرگمنت ها ETag وابسته به نسخه داده گروه دارن و تا تغییر داده، پاسخ 304 میگیرن
+        section = Section.objects.filter(group=self.group).first()
+        url = reverse('section_stats', args=[section.pk])
+        response = self.client.get(url)
+        self.assertIn('private', response['Cache-Control'])
+        self.assertIn('max-age', response['Cache-Control'])
+        etag = response['ETag']
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        self.group.bump_data_version()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_template_fragment_cache(self):
+        # بار دوم HTML آمار از کش خونده میشه و آمار دوباره محاسبه نمیشه
+        section = Section.objects.filter(group=self.group).first()
+        url = reverse('section_stats', args=[section.pk])
+        first = self.client.get(url)
+        with CaptureQueriesContext(connection) as context:
+            second = self.client.get(url)
+        self.assertLessEqual(len(context), 6)
+        self.assertEqual(first.content, second.content)
+
+        # بعد از تغییر داده و بالا رفتن نسخه، بلوک دوباره ساخته میشه
+        case = SectionCase.objects.filter(group=self.group, section=section).first()
+        case.pk = None
+        case.number = 'new'
+        case.save()
+        self.group.bump_data_version()
+        third = self.client.get(url)
+        self.assertNotEqual(first.content, third.content)
+
+        # همون HTML ای که یک بار از کش خونده شده فرستاده میشه؛ اگه در این فاصله از کش حذف بشه، آمار کامل دوباره ساخته میشه
+        request = RequestFactory().get(url)
+        request.user = CustomUser.objects.get(pk=self.user.pk)
+        key = views.stats_fragment_key(request, 'section_stats', section)
+        cache.set(key, 'cached fragment')
+        self.assertEqual(self.client.get(url).content, b'cached fragment')
+        cache.delete(key)
+        self.assertEqual(self.client.get(url).content, third.content)
+
+
+class PatientIdentityTests(SeededTestCase):
+    def test_patient_identity_resolution(self):
+        # نام با ی/ي متفاوت و نام همراه شناسه به همون بیمار میرسن
+        patient = Patient.objects.get(group=self.group, full_name='بیمار 3')
+        self.assertEqual(find_patient(self.group, 'بيمار 3'), patient)
+        self.assertEqual(resolve_patient(self.group, '1234567 بیمار 3'), (patient, False))
+        patient.refresh_from_db()
+        self.assertEqual(patient.identity_key, 'id:1234567')
+        self.assertEqual(find_patient(self.group, 'بیمار 3'), patient)
+
+        # تکراری های قدیمی با انتقال دسته ای پرونده ها ادغام میشن
+        keep = Patient.objects.create(group=self.group, full_name='7654321 بیمار تکراری')
+        duplicate = Patient.objects.create(group=self.group, full_name='بیمار تکراری')
+        case = SectionCase.objects.filter(group=self.group).first()
+        SectionCase.objects.filter(pk=case.pk).update(patient=duplicate)
+        duplicate.sections.add(case.section)
+
+        merged = merge_duplicates(self.group)
+        self.assertEqual([(patient.pk, count) for patient, count in merged], [(keep.pk, 1)])
+        self.assertFalse(Patient.objects.filter(pk=duplicate.pk).exists())
+        self.assertEqual(SectionCase.objects.get(pk=case.pk).patient_id, keep.pk)
+        self.assertIn(case.section, keep.sections.all())
+
+
+class PatientIdentityMigrationTests(TransactionTestCase):
+    # migration ایندکس یکتای هویت بیمار خودش ادغام نمیکنه؛ با تکراری متوقف میشه تا ادغام صریح انجام بشه
+    def migrate(self, target):
+        # کوئری های introspection خود migrate تکراری هستن
+        with querycheck.ignore():
+            executor = MigrationExecutor(connection)
+            executor.loader.build_graph()
+            executor.migrate([('section', target)])
+
+    def test_unique_identity_requires_explicit_merge(self):
+        latest = MigrationLoader(connection).graph.leaf_nodes('section')[0][1]
+        self.migrate('0009_patient_identity')
+        try:
+            group = Group.objects.create(name='گروه تست')
+            keep = Patient.objects.create(group=group, full_name='بیمار تکراری')
+            duplicate = Patient.objects.create(group=group, full_name='بيمار  تکراری')
+            self.assertEqual(keep.identity_key, duplicate.identity_key)
+
+            with self.assertRaisesMessage(CommandError, 'merge_duplicate_patients'):
+                self.migrate('0010_patient_identity_unique')
+            self.assertEqual(Patient.objects.filter(group=group).count(), 2)
+
+            call_command('merge_duplicate_patients', stdout=StringIO())
+            self.assertEqual(list(Patient.objects.filter(group=group)), [keep])
+            self.migrate('0010_patient_identity_unique')
+        finally:
+            self.migrate(latest)
+
+
+class DatabaseBackendTests(SeededTestCase):
+    def test_database_backend_compatibility(self):
+        # همین تست ها با DB_ENGINE=sqlite و DB_ENGINE=postgresql اجرا میشن
+        self.assertIn(connection.vendor, ('sqlite', 'postgresql'))
+        self.assertTrue(connection.settings_dict['CONN_HEALTH_CHECKS'])
+        self.assertEqual(connection.settings_dict['CONN_MAX_AGE'], settings.DB_CONN_MAX_AGE)
+
+        # ایندکس یکتای هویت بیمار در هر دو بک اند
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Patient.objects.create(group=self.group, full_name='بیمار 0')
+
+        # جستجو در فیلد چندانتخابی، بازه تاریخ میلادی و ترتیب متن فارسی
+        self.assertEqual(SectionCase.objects.filter(group=self.group, defect_type__contains='4').count(), 10)
+        self.assertEqual(
+            DC.objects.filter(group=self.group, death__range=('2023-03-21', '2023-04-20')).count(), 3
+        )
+        names = list(Doctor.objects.filter(group=self.group).order_by('full_name').values_list('full_name', flat=True))
+        self.assertEqual(names, sorted(names))
+
+
+class ExplainQueriesTests(SeededTestCase):
+    def explain(self, *args):
+        out = StringIO()
+        call_command('explain_queries', *args, stdout=out)
+        return out.getvalue()
+
+    def test_explain_queries(self):
+        # همه کوئری های پرتکرار گروه نمونه از ایندکس استفاده میکنن و کوئری روی ستون بدون ایندکس SCAN کامل گزارش میشه
+        if connection.vendor != 'sqlite':
+            self.skipTest('sqlite only')
+        output = self.explain('--group', str(self.group.pk))
+        self.assertNotIn('full table scan', output)
+        self.assertEqual(output.count('index used'), 16)
+
+        hot_queries = ExplainQueriesCommand.hot_queries
+        def with_unindexed(command, group, start, end):
+            return hot_queries(command, group, start, end) + [
+                ('section cases by insurance', SectionCase.objects.filter(insurance='آزاد')),
+            ]
+        with mock.patch.object(ExplainQueriesCommand, 'hot_queries', with_unindexed):
+            output = self.explain()
+        self.assertIn('section cases by insurance', output)
+        self.assertRegex(output, r'SCAN section_sectioncase\n')
+        self.assertEqual(output.count('full table scan'), 1)
+        self.assertIn('1 queries scan a whole table', output)
+
+    def test_missing_group(self):
+        with self.assertRaises(CommandError):
+            self.explain('--group', str(self.group.pk + 1000))
+        with querycheck.ignore():
+            Group.objects.all().delete()
+        with self.assertRaises(CommandError):
+            self.explain()
+
+
+class SqlitePragmaTests(TestCase):
+    def test_sqlite_pragmas(self):
+        # پروفایل همزمانی فقط با SQLITE_TUNING و روی اتصال تازه (سیگنال connection_created) اعمال میشه
+        if connection.vendor != 'sqlite':
+            self.skipTest('sqlite only')
+        with tempfile.TemporaryDirectory() as directory, override_settings(SQLITE_TUNING=True):
+            fresh = connection.copy()
+            fresh.settings_dict['NAME'] = os.path.join(directory, 'tuned.sqlite3')
+            try:
+                with fresh.cursor() as cursor:
+                    pragmas = {}
+                    for name in ('journal_mode', 'synchronous', 'temp_store', 'cache_size'):
+                        cursor.execute(f'PRAGMA {name}')
+                        pragmas[name] = cursor.fetchone()[0]
+            finally:
+                fresh.close()
+        self.assertEqual(pragmas, {'journal_mode': 'wal', 'synchronous': 1, 'temp_store': 2, 'cache_size': -64 * 1024})
+
+
+class GroupCacheTests(SeededTestCase):
+    def test_group_cache(self):
+        # کلید مستقل از ترتیب پارامتر ها و مقادیر خالی، و وابسته به نسخه داده گروه
+        self.assertEqual(
+            group_cache.make_key(self.group, 'trend', {'start': '1402/1/1', 'end': '1402/2/1', 'room': None}),
+            group_cache.make_key(self.group, 'trend', {'end': '1402/2/1', 'start': '1402/1/1'}),
+        )
+        group_cache.reset_stats()
+        url = reverse('autocomplete', args=['patient']) + '?q=بیمار'
+        first = self.client.get(url).json()
+        self.assertEqual(self.client.get(url).json(), first)
+        self.assertEqual(group_cache.stats()['autocomplete'], {'hits': 1, 'misses': 1})
+
+        self.group.bump_data_version()
+        self.client.get(url)
+        self.assertEqual(group_cache.stats()['autocomplete'], {'hits': 1, 'misses': 2})
+
+
+class StaticPipelineTests(TestCase):
+    def test_static_pipeline(self):
+        # فایل استاتیک بدون ویو، با نسخه gzip، ETag و کش بلندمدت برای نام های هش دار
+        with tempfile.TemporaryDirectory() as root, override_settings(STATIC_ROOT=root):
+            for name in ('app.css', 'app.0123456789ab.css'):
+                with open(os.path.join(root, name), 'w') as file:
+                    file.write('body { color: red; }\n' * 50)
+                compress(os.path.join(root, name))
+            client = Client()
+
+            response = client.get('/static/app.css', HTTP_ACCEPT_ENCODING='gzip, br')
+            self.assertEqual(response['Content-Encoding'], 'gzip')
+            self.assertEqual(response['Content-Type'], 'text/css')
+            self.assertIn('Accept-Encoding', response['Vary'])
+            self.assertNotIn('immutable', response['Cache-Control'])
+            response.close()
+
+            response = client.get('/static/app.0123456789ab.css')
+            self.assertNotIn('Content-Encoding', response)
+            self.assertEqual(response['Cache-Control'], 'public, max-age=31536000, immutable')
+            response.close()
+
+            response = client.get('/static/app.0123456789ab.css', HTTP_IF_NONE_MATCH=response['ETag'])
+            self.assertEqual(response.status_code, 304)
+            self.assertEqual(client.get('/static/../settings.py').status_code, 404)
+
+    def test_async_middleware(self):
+        # زیر ASGI هیچ میدلوری درخواست رو به همگام و برعکس تبدیل نمیکنه
+        for path in settings.MIDDLEWARE:
+            with self.subTest(middleware=path):
+                self.assertTrue(getattr(import_string(path), 'async_capable', False))
+
+    async def test_async_static_response(self):
+        with tempfile.TemporaryDirectory() as root, override_settings(STATIC_ROOT=root):
+            with open(os.path.join(root, 'app.css'), 'w') as file:
+                file.write('body { color: red; }\n')
+            response = await self.async_client.get('/static/app.css')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response['Content-Type'], 'text/css')
+            response.close()
+            response = await self.async_client.get('/static/missing.css')
+            self.assertEqual(response.status_code, 404)
+
+
+class ConcurrencyTests(TestCase):
+    def test_concurrent_gather(self):
+        # با CONCURRENT_QUERIES کار های مستقل همزمان اجرا میشن و زمان کل نزدیک کندترین کاره
+        def slow(value):
+            def run():
+                time.sleep(0.2)
+                return value
+            return run
+
+        with override_settings(CONCURRENT_QUERIES=True):
+            started = time.perf_counter()
+            results = async_to_sync(concurrency.gather)(a=slow(1), b=slow(2), c=slow(3))
+            elapsed = time.perf_counter() - started
+        self.assertEqual(results, {'a': 1, 'b': 2, 'c': 3})
+        self.assertLess(elapsed, 0.5)
+
+        # بدون اون همون نتیجه ها روی thread اصلی و با همین اتصال دیتابیس
+        group = Group.objects.create(name='گروه تست')
+        for i in range(3):
+            Patient.objects.create(group=group, full_name=f'بیمار {i}')
+        results = async_to_sync(concurrency.gather)(count=Patient.objects.filter(group=group).count)
+        self.assertEqual(results, {'count': 3})
+
+
+class PerformanceTests(SeededTestCase):
+    @override_settings(PERFORMANCE_SAMPLE_RATE=1)
+    def test_performance_instrumentation(self):
+        # هر پاسخ نمونه برداری شده هدر Server-Timing و یک خط لاگ JSON داره که تعداد کوئری هاش با واقعیت میخونه
+        url = reverse('section_list')
+        with self.assertLogs('section.performance', 'INFO') as logs, CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+        timing = response['Server-Timing']
+        self.assertIn('total;dur=', timing)
+        self.assertIn('db;dur=', timing)
+        self.assertIn('render;dur=', timing)
+        line = json.loads(logs.records[-1].getMessage())
+        self.assertEqual(line['view'], 'section_list')
+        self.assertEqual(line['db_queries'], len(context))
+        self.assertIn(f'desc="{len(context)} queries"', timing)
+        self.assertGreater(line['render_ms'], 0)
+
+        # ویو async با CONCURRENT_QUERIES: آمار درخواست همراه کار به thread ها میرسه
+        stats = performance.RequestStats()
+        token = performance._current.set(stats)
+        try:
+            with override_settings(CONCURRENT_QUERIES=True):
+                results = async_to_sync(concurrency.gather)(stats=performance._current.get)
+        finally:
+            performance._current.reset(token)
+        self.assertIs(results['stats'], stats)
+
+        with override_settings(PERFORMANCE_SLOW_MS=0), self.assertLogs('section.performance', 'WARNING'):
+            self.client.get(url)
+
+        # بدون نمونه برداری هدر و لاگ نیست ولی متریک های /metrics همچنان ثبت میشن
+        metrics.reset()
+        with override_settings(PERFORMANCE_SAMPLE_RATE=0), self.assertNoLogs('section.performance', 'INFO'):
+            self.assertNotIn('Server-Timing', self.client.get(url))
+        self.assertIn('clinic_http_requests_total{method="GET",status="200",view="section_list"} 1', metrics.render())
+
+        # درخواست کند بدون نمونه برداری هم لاگ میشه، بدون هدر Server-Timing
+        for enabled in (True, False):
+            with self.subTest(metrics=enabled), override_settings(PERFORMANCE_SAMPLE_RATE=0, PERFORMANCE_SLOW_MS=0, METRICS_ENABLED=enabled):
+                with self.assertLogs('section.performance', 'INFO') as logs:
+                    response = self.client.get(url)
+                self.assertNotIn('Server-Timing', response)
+                self.assertEqual([record.levelno for record in logs.records], [logging.WARNING])
+                self.assertEqual(json.loads(logs.records[0].getMessage())['view'], 'section_list')
+
+
+class MetricsTests(SeededTestCase):
+    def test_metrics_endpoint(self):
+        metrics.reset()
+        group_cache.reset_stats()
+        self.client.get(reverse('section_list'))
+        self.client.get(reverse('trend'))
+        self.client.get(reverse('trend'))
+
+        # ورود اکسل موفق: زمان و تعداد پرونده های ساخته شده
+        template = SectionCase.objects.filter(group=self.group).first()
+
+        @metrics.import_job('add_section_case')
+        def fake_import(request):
+            for i in range(3):
+                template.pk = None
+                template.save()
+            return redirect('main')
+        fake_import(RequestFactory().post('/'))
+
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 403)
+        with override_settings(METRICS_TOKEN='secret'):
+            response = Client().get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer secret')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        body = response.content.decode()
+        self.assertIn('# TYPE clinic_http_request_duration_seconds histogram', body)
+        self.assertIn('clinic_http_request_duration_seconds_count{view="section_list"} 1', body)
+        self.assertIn('clinic_http_requests_total{method="GET",status="200",view="trend"} 2', body)
+        self.assertIn('clinic_cache_hit_ratio{view="trend"} 0.5', body)
+        self.assertIn('clinic_import_rows_total{pipeline="add_section_case"} 3', body)
+        self.assertIn(f'clinic_rows{{group="{self.group.pk}",model="SectionCase"}} 33', body)
+
+        # چند پروسه: فایل worker های دیگه در METRICS_DIR با همین پروسه جمع میشه
+        with tempfile.TemporaryDirectory() as directory, override_settings(METRICS_DIR=directory):
+            with open(os.path.join(directory, 'metrics-1.json'), 'w') as file:
+                json.dump({
+                    'counters': [['clinic_db_queries_total', {'view': 'section_list'}, 1000]],
+                    'histograms': [], 'gauges': [],
+                }, file)
+            metrics.flush()
+            self.assertTrue(os.path.exists(metrics.process_file()))
+            body = metrics.render()
+        queries = int(body.split('clinic_db_queries_total{view="section_list"} ')[1].split()[0])
+        self.assertGreater(queries, 1000)
+
+
+class QueryDetectorTests(SeededTestCase):
+    def test_query_detector(self):
+        # کوئری هایی که فقط در پارامتر فرق دارن یک شکل حساب میشن و تکرار بیش از حد با خط کدش گزارش میشه
+        self.assertEqual(
+            querycheck.normalize_sql("SELECT * FROM t WHERE a = 12 AND b = 'x' AND c IN (%s, %s, %s) LIMIT 21"),
+            'SELECT * FROM t WHERE a = ? AND b = ? AND c IN (...) LIMIT ?',
+        )
+        sections = list(Section.objects.filter(group=self.group))
+        with querycheck.QueryDetector('n+1', threshold=2, slow_ms=10000) as detector:
+            for section in sections:
+                Section.objects.get(pk=section.pk)
+        [(count, shape, stack)] = detector.repeated()
+        self.assertEqual(count, 3)
+        self.assertIn('section_section', shape)
+        self.assertIn('test_query_detector', stack)
+        with self.assertRaises(querycheck.RepeatedQueries):
+            detector.check('raise')
+        with self.assertLogs('section.querycheck', 'WARNING'):
+            detector.check('warn')
+
+        with querycheck.QueryDetector('slow', slow_ms=0), self.assertLogs('section.querycheck', 'WARNING') as logs:
+            Section.objects.count()
+        self.assertIn('slow query', logs.output[0])
+
+        # با میدلور، N+1 یک درخواست داخل تست به گزارش همون تست اضافه میشه
+        with override_settings(QUERY_DETECTOR='raise', QUERY_REPEAT_THRESHOLD=0):
+            client = Client()
+            client.force_login(self.user)
+            with querycheck.QueryDetector('test') as detector:
+                self.assertEqual(client.get(reverse('section_list')).status_code, 200)
+        self.assertIn('GET /sections/', detector.report())
@@ -0,0 +1,32 @@
+import re
+
+CHARACTER_MAP = str.maketrans({
+    'ي': 'ی', 'ى': 'ی', 'ئ': 'ی',
+    'ك': 'ک',
+    'ة': 'ه', 'ۀ': 'ه',
+    'أ': 'ا', 'إ': 'ا', 'آ': 'ا', 'ٱ': 'ا',
+    'ؤ': 'و',
+    '‌': ' ', '‍': None, '‏': None, '‎': None,
+    'ـ': None,
+    **{chr(code): None for code in range(0x064B, 0x0660)},
+    'ٰ': None,
+    **{persian: str(digit) for digit, persian in enumerate('۰۱۲۳۴۵۶۷۸۹')},
+    **{arabic: str(digit) for digit, arabic in enumerate('٠١٢٣٤٥٦٧٨٩')},
+})
+
+def normalize(text):
+    # یکسان سازی ی/ي، ک/ك، نیم فاصله، اعراب و ارقام فارسی و عربی
+    if not text:
+        return ''
+    return ' '.join(str(text).translate(CHARACTER_MAP).lower().split())
+
+# شناسه بیمار (شماره P دار پرونده یا کد ملی) یک عدد حداقل چهار رقمیه که کنار نام میاد
+PATIENT_ID = re.compile(r'(?<!\w)p?(\d{4,})(?!\w)')
+
+def patient_keys(full_name):
+    # کلید هویت: شناسه بیمار اگه باشه، وگرنه نام نرمال شده؛ و نام نرمال شده بدون شناسه
+    text = normalize(full_name)
+    name_key = ' '.join(PATIENT_ID.sub(' ', text).split())
+    match = PATIENT_ID.search(text)
+    identity_key = f'id:{match.group(1)}' if match else f'name:{name_key}'
+    return identity_key, name_key
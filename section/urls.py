@@ -3,14 +3,15 @@ from django.contrib.auth.views import LogoutView
 
 from .views import (
     main, SignUpView, custom_login_view,
-    SectionListView, section_detail, SectionCreateView, SectionUpdateView, SectionDeleteView,
+    SectionListView, section_detail, section_stats, section_charts, section_tab, SectionCreateView, SectionUpdateView, SectionDeleteView,
     RoomListView, room_detail, RoomCreateView, RoomUpdateView, RoomDeleteView,
     ExpertiseCreateView, ExpertiseListView, ExpertiseUpdateView, ExpertiseDeleteView,
-    DoctorListView, doctor_detail, DoctorCreateView, DoctorUpdateView, DoctorDeleteView,
-    PatientListView, patient_detail, PatientDeleteView,
+    DoctorListView, doctor_detail, doctor_stats, doctor_charts, doctor_tab, DoctorCreateView, DoctorUpdateView, DoctorDeleteView,
+    PatientListView, patient_detail, patient_timeline_view, PatientDeleteView,
     SectionCaseListView, add_section_case, section_case_detail, SectionCaseUpdateView, SectionCaseDeleteView,
     RoomCaseListView, add_room_case, RoomCaseDetailView, RoomCaseDeleteView,
     DCListView, DCDetailView, DCDeleteView, dc_all_detail,
+    section_distribution, doctor_distribution, group_distribution, trend, leaderboard, autocomplete, metrics_view,
     all_delete,
     multi_section_analysis, multi_room_analysis, multi_doctor_analysis,
     analyze_defect,
@@ -26,6 +27,10 @@ urlpatterns = [
     path('sections/', SectionListView.as_view(), name='section_list'),
     path('sections/add/', SectionCreateView.as_view(), name='section_create'),
     path('sections/<int:pk>/', section_detail, name='section_detail'),
+    path('sections/<int:pk>/stats/', section_stats, name='section_stats'),
+    path('sections/<int:pk>/charts/', section_charts, name='section_charts'),
+    path('sections/<int:pk>/tabs/<str:tab>/', section_tab, name='section_tab'),
+    path('sections/<int:pk>/distribution/', section_distribution, name='section_distribution'),
     path('sections/<int:pk>/update/', SectionUpdateView.as_view(), name='section_update'),
     path('sections/<int:pk>/delete/', SectionDeleteView.as_view(), name='section_delete'),
 
@@ -43,11 +48,16 @@ urlpatterns = [
     path('doctors/', DoctorListView.as_view(), name='doctor_list'),
     path('doctors/add/', DoctorCreateView.as_view(), name='doctor_create'),
     path('doctors/<int:pk>/', doctor_detail, name='doctor_detail'),
+    path('doctors/<int:pk>/stats/', doctor_stats, name='doctor_stats'),
+    path('doctors/<int:pk>/charts/', doctor_charts, name='doctor_charts'),
+    path('doctors/<int:pk>/tabs/<str:tab>/', doctor_tab, name='doctor_tab'),
+    path('doctors/<int:pk>/distribution/', doctor_distribution, name='doctor_distribution'),
     path('doctors/<int:pk>/update/', DoctorUpdateView.as_view(), name='doctor_update'),
     path('doctors/<int:pk>/delete/', DoctorDeleteView.as_view(), name='doctor_delete'),
 
     path('patients/', PatientListView.as_view(), name='patient_list'),
     path('patients/<int:pk>/', patient_detail, name='patient_detail'),
+    path('patients/<int:pk>/timeline/', patient_timeline_view, name='patient_timeline'),
     path('patients/<int:pk>/delete/', PatientDeleteView.as_view(), name='patient_delete'),
 
     path('section-cases/', SectionCaseListView.as_view(), name='section_case_list'),
@@ -66,6 +76,12 @@ urlpatterns = [
     path('dcs/<int:pk>/delete/', DCDeleteView.as_view(), name='dc_delete'),
     path('dcs/all-detail/', dc_all_detail, name='dc_all_detail'),
 
+    path('distribution/', group_distribution, name='group_distribution'),
+    path('trend/', trend, name='trend'),
+    path('leaderboard/', leaderboard, name='leaderboard'),
+    path('autocomplete/<str:kind>/', autocomplete, name='autocomplete'),
+    path('metrics', metrics_view, name='metrics'),
+
     path('all-delete/', all_delete, name='all_delete'),
 
     path('analyze/sections/', multi_section_analysis, name='analyze_section'),
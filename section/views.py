@@ -1,15 +1,23 @@
+import hmac
 import pandas as pd
 from functools import wraps
-from collections import Counter, defaultdict
-from django.shortcuts import render, redirect, get_object_or_404
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from collections import defaultdict
+from django.conf import settings
+from django.http import Http404, HttpResponse, JsonResponse
+from django.template.loader import render_to_string
+from django.shortcuts import render, redirect, get_object_or_404, aget_object_or_404
 from django.urls import reverse, reverse_lazy
 from django.contrib.auth import authenticate, login
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.contrib import messages
 from django.core.exceptions import PermissionDenied
+from django.core.cache import cache
 from django.core.paginator import Paginator
-from django.db.models import Q
+from django.utils.cache import patch_cache_control
+from django.views.decorators.http import condition
+from django.db.models import Count, Q
 from django.views.generic import ListView, CreateView, DetailView, UpdateView, DeleteView
 from .models import Excel, Expertise, Section, Room, Doctor, Patient, SectionCase, RoomCase, DC
 from .forms import (
@@ -17,8 +25,15 @@ from .forms import (
     ExcelForm, ExpertiseForm, SectionForm, RoomForm, DoctorForm, SectionCaseForm, ConfirmDeleteForm,
     MultiSectionForm, MultiRoomForm, MultiDoctorForm
 )
-from .mixins import ManagerRequiredMixin, UserIsOwnerMixin
-from .jalali import Persian
+from .mixins import ManagerRequiredMixin, UserIsOwnerMixin, DataVersionMixin, KeysetPaginationMixin
+from .jalali import Persian, to_gregorian
+from .analytics import (
+    date_range, room_analysis, room_cases_in_range, monthly_trend, surgeon_leaderboards,
+    INSURANCES, detail_tabs, tab_counts, stay_averages, death_averages, defect_distribution, death_demographics,
+    patient_timeline, DEFECT_Q,
+)
+from . import cache as group_cache, concurrency, frames, metrics, search
+from .identity import find_patient, resolve_patient
 from .dictionary import defect_sheet_map, defect_type_map, operation_type_dict, gender_dict
 
 # در این ویو کامنت گذاری در توابع پیچیده تر انجام شده
@@ -58,6 +73,16 @@ defect_type_choices = [
 # میکسین های ویو تابع بیس
 
 def manager_required(view_func):
+    if iscoroutinefunction(view_func):
+        @wraps(view_func)
+        async def _async_view(request, *args, **kwargs):
+            # کاربر و گروهش یکبار در thread همگام بارگذاری میشن تا request.user.group در ادامه ویو async کوئری نزنه
+            user = await sync_to_async(load_user)(request)
+            if not user.is_manager:
+                raise PermissionDenied("دسترسی فقط برای مسئول درمانگاه مجاز است.")
+            return await view_func(request, *args, **kwargs)
+        return _async_view
+
     @wraps(view_func)
     def _wrapped_view(request, *args, **kwargs):
         if not request.user.is_manager:
@@ -65,8 +90,21 @@ def manager_required(view_func):
         return view_func(request, *args, **kwargs)
     return _wrapped_view
 
+def load_user(request):
+    request.user.group
+    return request.user
+
 def group_is_owner(model, lookup_field='pk', group_field='group'):
     def decorator(view_func):
+        if iscoroutinefunction(view_func):
+            @wraps(view_func)
+            async def _async_view(request, *args, **kwargs):
+                obj = await aget_object_or_404(model, **{lookup_field: kwargs.get(lookup_field)})
+                if getattr(obj, f'{group_field}_id') != request.user.group_id:
+                    raise PermissionDenied("شما اجازه دسترسی به این مورد را ندارید.")
+                return await view_func(request, *args, **kwargs)
+            return _async_view
+
         @wraps(view_func)
         def _wrapped_view(request, *args, **kwargs):
             obj = get_object_or_404(model, **{lookup_field: kwargs.get(lookup_field)})
@@ -105,183 +143,132 @@ def custom_login_view(request):
 
 @login_required
 @manager_required
-def main(request):
+async def main(request):
     group = request.user.group
+    if not await Excel.objects.filter(group=group).aexists():
+        # هنوز اکسلی وارد نشده: فرم و پردازش ورود اکسل
+        return await sync_to_async(import_excel)(request)
 
-    if Excel.objects.filter(group=group).exists():
-        # آمار اولیه
-        sections = Section.objects.filter(group=group)
-        rooms = Room.objects.filter(group=group)
-        sections_count = sections.count()
-        rooms_count = rooms.count()
+    # آمار اولیه
+    sections = Section.objects.filter(group=group)
+    rooms = Room.objects.filter(group=group)
 
-        year = request.GET.get("year")
+    year = request.GET.get("year")
 
-        if year:
-            section_cases = SectionCase.objects.filter(group=group, admission_date__icontains=year)
-            room_cases = RoomCase.objects.filter(group=group, operation_date__icontains=year)
-            dc_cases = DC.objects.filter(group=group, death_date__icontains=year)
-        else:
-            section_cases = SectionCase.objects.filter(group=group)
-            room_cases = RoomCase.objects.filter(group=group)
-            dc_cases = DC.objects.filter(group=group)
-
-        # استخراج doctor_id ها و patient_id ها
-        doctor_ids_section = set(section_cases.values_list('doctor_id', flat=True))
-        doctor_ids_room = set(room_cases.values_list('doctor_id', flat=True))
-        doctor_ids_dc = set(dc_cases.values_list('doctor_id', flat=True))
-
-        doctor_ids = doctor_ids_section.union(doctor_ids_room, doctor_ids_dc)
-        doctors_count = len(doctor_ids)
-
-        patient_ids_section = set(section_cases.values_list('patient_id', flat=True))
-        patient_ids_room = set(room_cases.values_list('patient_id', flat=True))
-        patient_ids_dc = set(dc_cases.values_list('patient_id', flat=True))
-
-        patient_ids = patient_ids_section.union(patient_ids_room, patient_ids_dc)
-        patients_count = len(patient_ids)
-
-        section_cases_count = section_cases.count()
-        room_cases_count = room_cases.count()
-        cases_count = section_cases_count + room_cases_count
-
-        defect_cases = section_cases.filter(
-            Q(defect_sheet__isnull=False) | Q(defect_sheet2__isnull=False) |
-            Q(defect_sheet3__isnull=False) | Q(defect_sheet4__isnull=False) |
-            Q(defect_sheet5__isnull=False) | Q(defect_sheet6__isnull=False) |
-            Q(defect_sheet7__isnull=False) | Q(defect_sheet8__isnull=False) |
-            Q(defect_sheet9__isnull=False) | Q(defect_sheet10__isnull=False)
+    if year:
+        section_cases = SectionCase.objects.filter(group=group, admission_date__icontains=year)
+        room_cases = RoomCase.objects.filter(group=group, operation_date__icontains=year)
+        dc_cases = DC.objects.filter(group=group, death_date__icontains=year)
+    else:
+        section_cases = SectionCase.objects.filter(group=group)
+        room_cases = RoomCase.objects.filter(group=group)
+        dc_cases = DC.objects.filter(group=group)
+
+    defect_cases = section_cases.filter(DEFECT_Q)
+
+    # استخراج doctor_id ها و patient_id ها
+    def distinct_ids(field):
+        return (
+            set(section_cases.values_list(field, flat=True)) |
+            set(room_cases.values_list(field, flat=True)) |
+            set(dc_cases.values_list(field, flat=True))
         )
-        defect_section_cases_count = defect_cases.count()
 
+    # آمار های مستقل داشبورد همزمان اجرا میشن
+    results = await concurrency.gather(
+        sections_count=sections.count,
+        rooms_count=rooms.count,
+        doctor_ids=lambda: distinct_ids('doctor_id'),
+        patient_ids=lambda: distinct_ids('patient_id'),
+        section_cases_count=section_cases.count,
+        room_cases_count=room_cases.count,
+        defect_section_cases_count=defect_cases.count,
         # آمار بیمه‌ها
-        def count_insurance(keyword):
-            return section_cases.filter(insurance__icontains=keyword).count()
+        insurances=lambda: section_cases.aggregate(**{
+            key: Count('id', filter=Q(insurance__icontains=keyword)) for key, keyword in INSURANCES.items()
+        }),
+        # آخرین اتاق‌ها و بخش‌ها
+        sections_recent=lambda: list(sections.prefetch_related('expertises').order_by('id')[:3]),
+        rooms_recent=lambda: list(rooms.prefetch_related('expertises').order_by('id')[:3]),
+        # تحلیل پزشکان اتاق عمل
+        leaderboards=lambda: surgeon_leaderboards(room_cases, limit=5),
+        defects=lambda: dashboard_defects(request, section_cases, defect_cases),
+    )
 
-        social_security_cases = count_insurance("تامین اجتماعی")
-        medical_services_cases = count_insurance("خدمات درمانی")
-        armed_forces_cases = count_insurance("نیرو های مسلح")
-        free_cases = count_insurance("آزاد")
+    def most_common_or_none(board):
+        return [(row['full_name'], row['count']) for row in board[:1]]
 
-        # آخرین اتاق‌ها و بخش‌ها
-        sections_recent = sections.order_by('id')[:3]
-        rooms_recent = rooms.order_by('id')[:3]
+    leaderboards = results['leaderboards']
+    insurances = results['insurances']
+    defect_counts, defect_percents, defect_type_counts, defect_type_percents = results['defects']
 
-        # تحلیل پزشکان اتاق عمل
-        doctor_room_list = []
-        doctor_bigroom_list = []
-        doctor_mediumroom_list = []
-        doctor_smallroom_list = []
-
-        for case in room_cases.select_related('doctor'):
-            full_name = case.doctor.full_name
-            doctor_room_list.append(full_name)
-            if case.operation_type == '1':
-                doctor_smallroom_list.append(full_name)
-            elif case.operation_type == '2':
-                doctor_mediumroom_list.append(full_name)
-            elif case.operation_type == '3':
-                doctor_bigroom_list.append(full_name)
-
-        def most_common_or_none(lst):
-            return Counter(lst).most_common(1)
-
-        # آماده‌سازی داده نقص
-        defect_counts = {}
-        defect_percents = {}
-        defect_type_counts = {}
-        defect_type_percents = {}
-
-        filtered_section_cases = []
-
-        if request.GET.get("start") and request.GET.get("end"):
-            try:
-                start = Persian(request.GET["start"]).gregorian_datetime()
-                end = Persian(request.GET["end"]).gregorian_datetime()
-                if start > end:
-                    start, end = end, start
-
-                for case in section_cases:
-                    if isinstance(case.admission_date, str):
-                        try:
-                            case_date = Persian(case.admission_date).gregorian_datetime()
-                            if start <= case_date <= end:
-                                filtered_section_cases.append(case)
-                        except:
-                            continue
-
-                # شمارش نقص‌ها در بازه زمانی
-                def count_defects(
-                        cases, 
-                        field1, field2, field3, field4, field5, field6, field7, field8, field9, field10,
-                        choices
-                ):
-                    counts, percents = {}, {}
-                    for code, name in choices:
-                        count = sum(1 for c in cases if getattr(c, field1) == code or getattr(c, field2) == code or getattr(c, field3) == code or getattr(c, field4) == code or getattr(c, field5) == code or getattr(c, field6) == code or getattr(c, field7) == code or getattr(c, field8) == code or getattr(c, field9) == code or getattr(c, field10) == code)
-                        total = sum(1 for c in cases if getattr(c, field1) or getattr(c, field2))
-                        counts[name] = count
-                        percents[name] = round((count * 100 / total), 0) if total else 0
-                    return counts, percents
-                
-                def count_multiselect_defects(cases, fields, choices):
-                    counts, percents = {}, {}
-                    total = sum(
-                        1 for c in cases if any(getattr(c, f, None) for f in fields)
-                    )
+    context = {
+        'doctors_count': len(results['doctor_ids']),
+        'patients_count': len(results['patient_ids']),
+        'sections_count': results['sections_count'],
+        'rooms_count': results['rooms_count'],
+        'cases_count': results['section_cases_count'] + results['room_cases_count'],
+        'section_cases_count': results['section_cases_count'],
+        'defect_section_cases_count': results['defect_section_cases_count'],
+        'social_security_cases': insurances['social_security'],
+        'medical_services_cases': insurances['medical_services'],
+        'armed_forces_cases': insurances['armed_forces'],
+        'free_cases': insurances['free'],
+        'room_cases_count': results['room_cases_count'],
+        'sections': results['sections_recent'],
+        'rooms': results['rooms_recent'],
+        'defect_counts': defect_counts,
+        'defect_type_counts': defect_type_counts,
+        'defect_percents': defect_percents,
+        'defect_type_percents': defect_type_percents,
+        'most_doctor_room_list': most_common_or_none(leaderboards['all']),
+        'most_doctor_bigroom_list': most_common_or_none(leaderboards['3']),
+        'most_doctor_mediumroom_list': most_common_or_none(leaderboards['2']),
+        'most_doctor_smallroom_list': most_common_or_none(leaderboards['1']),
+        'surgeon_leaderboard': leaderboards['all'],
+    }
 
-                    for code, name in choices:
-                        count = sum(
-                            1 for c in cases for f in fields
-                            if code in (getattr(c, f, []) or [])
-                        )
-                        counts[name] = count
-                        percents[name] = round((count * 100 / total), 0) if total else 0
+    return await sync_to_async(render)(request, 'main.html', context=context)
 
-                    return counts, percents
+def dashboard_defects(request, section_cases, defect_cases):
+    # آماده‌سازی داده نقص
+    defect_counts = {}
+    defect_percents = {}
+    defect_type_counts = {}
+    defect_type_percents = {}
 
-                defect_counts, defect_percents = count_defects(
-                    filtered_section_cases, 
-                    'defect_sheet', 'defect_sheet2', 'defect_sheet3', 'defect_sheet4', 'defect_sheet5', 'defect_sheet6', 'defect_sheet7', 'defect_sheet8', 'defect_sheet9', 'defect_sheet10', 
-                    defect_sheet_choices
-                )
+    filtered_section_cases = []
 
-                fields = [
-                    'defect_type', 'defect_type2', 'defect_type3',
-                    'defect_type4', 'defect_type5', 'defect_type6',
-                    'defect_type7', 'defect_type8', 'defect_type9', 'defect_type10'
-                ]
+    if request.GET.get("start") and request.GET.get("end"):
+        try:
+            start = Persian(request.GET["start"]).gregorian_datetime()
+            end = Persian(request.GET["end"]).gregorian_datetime()
+            if start > end:
+                start, end = end, start
 
-                defect_type_counts, defect_type_percents = count_multiselect_defects(
-                    filtered_section_cases,
-                    fields,
-                    defect_type_choices
-                )
+            for case in section_cases:
+                if isinstance(case.admission_date, str):
+                    try:
+                        case_date = Persian(case.admission_date).gregorian_datetime()
+                        if start <= case_date <= end:
+                            filtered_section_cases.append(case)
+                    except:
+                        continue
 
-            except:
-                pass
-        else:
-            def count_global_defects(
+            # شمارش نقص‌ها در بازه زمانی
+            def count_defects(
+                    cases, 
                     field1, field2, field3, field4, field5, field6, field7, field8, field9, field10,
-                    choices, filter_field
+                    choices
             ):
                 counts, percents = {}, {}
-                total = defect_cases.count()
                 for code, name in choices:
-                    count = section_cases.filter(**{field1: code}).count() + \
-                            section_cases.filter(**{field2: code}).count() + \
-                            section_cases.filter(**{field3: code}).count() + \
-                            section_cases.filter(**{field4: code}).count() + \
-                            section_cases.filter(**{field5: code}).count() + \
-                            section_cases.filter(**{field6: code}).count() + \
-                            section_cases.filter(**{field7: code}).count() + \
-                            section_cases.filter(**{field8: code}).count() + \
-                            section_cases.filter(**{field9: code}).count() + \
-                            section_cases.filter(**{field10: code}).count()
+                    count = sum(1 for c in cases if getattr(c, field1) == code or getattr(c, field2) == code or getattr(c, field3) == code or getattr(c, field4) == code or getattr(c, field5) == code or getattr(c, field6) == code or getattr(c, field7) == code or getattr(c, field8) == code or getattr(c, field9) == code or getattr(c, field10) == code)
+                    total = sum(1 for c in cases if getattr(c, field1) or getattr(c, field2))
                     counts[name] = count
                     percents[name] = round((count * 100 / total), 0) if total else 0
                 return counts, percents
-            
+
             def count_multiselect_defects(cases, fields, choices):
                 counts, percents = {}, {}
                 total = sum(
@@ -298,9 +285,10 @@ def main(request):
 
                 return counts, percents
 
-            defect_counts, defect_percents = count_global_defects(
+            defect_counts, defect_percents = count_defects(
+                filtered_section_cases, 
                 'defect_sheet', 'defect_sheet2', 'defect_sheet3', 'defect_sheet4', 'defect_sheet5', 'defect_sheet6', 'defect_sheet7', 'defect_sheet8', 'defect_sheet9', 'defect_sheet10', 
-                defect_sheet_choices, 'defect_sheet'
+                defect_sheet_choices
             )
 
             fields = [
@@ -310,974 +298,995 @@ def main(request):
             ]
 
             defect_type_counts, defect_type_percents = count_multiselect_defects(
-                section_cases,
+                filtered_section_cases,
                 fields,
                 defect_type_choices
             )
 
-        context = {
-            'doctors_count': doctors_count,
-            'patients_count': patients_count,
-            'sections_count': sections_count,
-            'rooms_count': rooms_count,
-            'cases_count': cases_count,
-            'section_cases_count': section_cases_count,
-            'defect_section_cases_count': defect_section_cases_count,
-            'social_security_cases': social_security_cases,
-            'medical_services_cases': medical_services_cases,
-            'armed_forces_cases': armed_forces_cases,
-            'free_cases': free_cases,
-            'room_cases_count': room_cases_count,
-            'sections': sections_recent,
-            'rooms': rooms_recent,
-            'defect_counts': defect_counts,
-            'defect_type_counts': defect_type_counts,
-            'defect_percents': defect_percents,
-            'defect_type_percents': defect_type_percents,
-            'most_doctor_room_list': most_common_or_none(doctor_room_list),
-            'most_doctor_bigroom_list': most_common_or_none(doctor_bigroom_list),
-            'most_doctor_mediumroom_list': most_common_or_none(doctor_mediumroom_list),
-            'most_doctor_smallroom_list': most_common_or_none(doctor_smallroom_list),
-        }
-
-        return render(request, 'main.html', context=context)
+        except:
+            pass
     else:
-        if request.method == 'POST':
-            form = ExcelForm(request.POST, request.FILES)
-            if form.is_valid():
-                excel_instance = form.save(commit=False)
-                excel_instance.group = request.user.group
-                excel_instance.save()
-
-                file_path = excel_instance.file.path
-                excel_file = pd.ExcelFile(file_path)
-
-                # دریافت نام همه شیت‌ها
-                sheet_names = excel_file.sheet_names
-
-                # جدا کردن شیت‌ها بر اساس کلمات کلیدی در اسم‌شون
-                section_sheets = [name for name in sheet_names if 'section' in name.lower()]
-                room_sheets = [name for name in sheet_names if 'room' in name.lower()]
-                DC_sheets = [name for name in sheet_names if 'dc' in name.lower()]
-
-                section_values = {}
-                room_values = {}
-                doctor_data = {}
-                patient_data = {}
-
-                for sheet in section_sheets:
-                    try:
-                        # پاک سازی و اصلاح جداول شیت
-                        df = pd.read_excel(file_path, sheet_name=sheet)
-                        df = df.loc[:, ~df.columns.str.contains("^Unnamed")]
-
-                        # ردیفی که ستون 9 آن دارای حرف P است به عنوان پرونده درنظر گرفته میشه
-                        if df.shape[1] >= 9:
-                            df = df[df.iloc[:, 8].astype(str).str.contains("P", na=False)]
-
-                        # استخراج نام بخش ها از ستون سوم هر شیت
-                        if df.shape[1] >= 3:
-                            third_col_values = df.iloc[:, 2].dropna().astype(str).str.strip()
-                            for value in third_col_values:
-                                if value in section_values:
-                                    section_values[value].add(sheet)
-                                else:
-                                    section_values[value] = {sheet}
-                        
-                        # استخراج نام پزشکان از ستون های 4 و 8
-                        for index, row in df.iterrows():
-                            if df.shape[1] >= 4 and df.shape[1] >= 9:
-                                doctor_name_4 = str(row.iloc[3]).strip() if pd.notna(row.iloc[3]) else None
-                                doctor_name_8 = str(row.iloc[7]).strip() if pd.notna(row.iloc[7]) else None
-                                related_value = str(row.iloc[2]).strip() if pd.notna(row.iloc[2]) else None
-
-                            for doctor_name in [doctor_name_4, doctor_name_8]:
-                                if doctor_name:
-                                    if doctor_name in doctor_data:
-                                        doctor_data[doctor_name].add(related_value)
-                                    else:
-                                        doctor_data[doctor_name] = {related_value}
-                        
-                        # استخراج نام بیماران از ستون نهم
-                        for index, row in df.iterrows():
-                            if df.shape[1] >= 9:
-                                col9_value = str(row.iloc[8]).strip() if pd.notna(row.iloc[8]) else None
-                                related_value = str(row.iloc[2]).strip() if pd.notna(row.iloc[2]) else None
-
-                                if col9_value:
-                                    if col9_value in patient_data:
-                                        patient_data[col9_value].add(related_value)
-                                    else:
-                                        patient_data[col9_value] = {related_value}
-
-                    except Exception as e:
-                        print(f"خطا در شیت '{sheet}': {e}")
-
-                # اعمال کار های مشابه در شیت های اتاق عمل
-                # نام اتاق از ستون 7
-                # نام پزشک از ستون 10
-                # نام بیمار از ترکیب ستون های نام بیمار و شناسه آن
-                for sheet in room_sheets:
-                    try:
-                        df = pd.read_excel(file_path, sheet_name=sheet)
-                        df = df.loc[:, ~df.columns.str.contains("^Unnamed")]
-
-                        if df.shape[1] >= 7:
-                            seventh_col_values = df.iloc[:, 6].dropna().astype(str).str.strip()
-                            for value in seventh_col_values:
-                                if value in room_values:
-                                    room_values[value].add(sheet)
-                                else:
-                                    room_values[value] = {sheet}
-                        
-                        for index, row in df.iterrows():
-                            if df.shape[1] >= 10:
-                                col10_value = str(row.iloc[9]).strip() if pd.notna(row.iloc[9]) else None
-                                related_value = str(row.iloc[6]).strip() if pd.notna(row.iloc[6]) else None
-
-                            if col10_value:
-                                if col10_value in doctor_data:
-                                    doctor_data[col10_value].add(related_value)
-                                else:
-                                    doctor_data[col10_value] = {related_value}
+        def count_global_defects(
+                field1, field2, field3, field4, field5, field6, field7, field8, field9, field10,
+                choices, filter_field
+        ):
+            counts, percents = {}, {}
+            total = defect_cases.count()
+            # همه شمارش ها (هر کد در هر ده فیلد) با یک کوئری aggregate
+            fields = [field1, field2, field3, field4, field5, field6, field7, field8, field9, field10]
+            totals = section_cases.aggregate(**{
+                f'defect_{code}_{index}': Count('id', filter=Q(**{field: code}))
+                for code, name in choices
+                for index, field in enumerate(fields)
+            })
+            for code, name in choices:
+                count = sum(totals[f'defect_{code}_{index}'] for index in range(len(fields)))
+                counts[name] = count
+                percents[name] = round((count * 100 / total), 0) if total else 0
+            return counts, percents
+
+        def count_multiselect_defects(cases, fields, choices):
+            counts, percents = {}, {}
+            total = sum(
+                1 for c in cases if any(getattr(c, f, None) for f in fields)
+            )
 
-                        if 'شناسه بیمار' in df.columns and 'نام بیمار' in df.columns:
-                            combined_values = df[['شناسه بیمار', 'نام بیمار', df.columns[2]]].dropna().astype(str).apply(
-                                lambda row: row['شناسه بیمار'].strip() + ' ' + row['نام بیمار'].strip(), axis=1)
-    
-                            related_values = df.iloc[:, 6].dropna().astype(str).str.strip()
-
-                            for index, value in enumerate(combined_values):
-                                related_value = related_values.iloc[index] if index < len(related_values) else None
-                                if value and related_value:
-                                    if value in patient_data:
-                                        patient_data[value].add(related_value)
-                                    else:
-                                        patient_data[value] = {related_value}
-                    except Exception as e:
-                        print(f"خطا در شیت '{sheet}': {e}")
-
-                # اتصال اتاق های به دست آمده به نام شیت آنها
-                for value, sheets in room_values.items():
-                    for sheet in sheets:
-                        room, created = Room.objects.get_or_create(group=request.user.group, name=value, sheet='')
-                
-                # اعمال کار های مشابه در شیت های فوت
-                # نام بخش از ستون 5
-                # نام پزشک از ستون 2
-                # نام بیمار از ترکیب ستون 12
-                for DC_sheet in DC_sheets:
-                    try:
-                        df = pd.read_excel(file_path, sheet_name=DC_sheet)
-                        df = df.loc[:, ~df.columns.str.contains("^Unnamed")]
+            for code, name in choices:
+                count = sum(
+                    1 for c in cases for f in fields
+                    if code in (getattr(c, f, []) or [])
+                )
+                counts[name] = count
+                percents[name] = round((count * 100 / total), 0) if total else 0
 
-                        # ردیفی که ستون 1 آن دارای حرف U است به عنوان پرونده درنظر گرفته میشه
-                        if df.shape[1] >= 1:
-                            df = df[df.iloc[:, 0].astype(str).str.contains("U", na=False)]
-                        
-                        if df.shape[1] >= 5:
-                            third_col_values = df.iloc[:, 4].dropna().astype(str).str.strip()
-                            for value in third_col_values:
-                                if value in section_values:
-                                    section_values[value].add(DC_sheet)
-                                else:
-                                    section_values[value] = {DC_sheet}
-                        
-                        for index, row in df.iterrows():
-                            if df.shape[1] >= 2:
-                                col10_value = str(row.iloc[1]).strip() if pd.notna(row.iloc[1]) else None
-                                related_value = str(row.iloc[4]).strip() if pd.notna(row.iloc[4]) else None
-
-                            if col10_value:
-                                if col10_value in doctor_data:
-                                    doctor_data[col10_value].add(related_value)
-                                else:
-                                    doctor_data[col10_value] = {related_value}
-                        
-                        for index, row in df.iterrows():
-                            if df.shape[1] >= 12:
-                                col9_value = str(row.iloc[11]).strip() if pd.notna(row.iloc[11]) else None
-                                related_value = str(row.iloc[4]).strip() if pd.notna(row.iloc[4]) else None
-
-                                if col9_value:
-                                    if col9_value in patient_data:
-                                        patient_data[col9_value].add(related_value)
-                                    else:
-                                        patient_data[col9_value] = {related_value}
-                    except Exception as e:
-                        print(f"خطا در شیت '{DC_sheet}': {e}")
-                
-                # اتصال بخش های به دست آمده به نام شیت آنها
-                for value, sheets in section_values.items():
-                    for sheet in sheets:
-                        section, created = Section.objects.get_or_create(group=request.user.group, name=value, sheet='')
-                
-                # اتصال پزشکان به بخش ها و اتاق های آنها
-                for full_name, sheets in doctor_data.items():
-                    doctor, created = Doctor.objects.get_or_create(group=request.user.group, full_name=full_name)
-
-                    for sheet in sheets:
-                        section = Section.objects.filter(group=request.user.group, name=sheet).first()
-                        if section:
-                            doctor.sections.add(section)
-                        
-                        room = Room.objects.filter(group=request.user.group, name=sheet).first()
-                        if room:
-                            doctor.rooms.add(room)
+            return counts, percents
 
-                        doctor.save()
-                
-                # اتصال بیماران به بخش ها و اتاق های آنها
-                for full_name, sheets in patient_data.items():
-                    patient, created = Patient.objects.get_or_create(group=request.user.group, full_name=full_name)
+        defect_counts, defect_percents = count_global_defects(
+            'defect_sheet', 'defect_sheet2', 'defect_sheet3', 'defect_sheet4', 'defect_sheet5', 'defect_sheet6', 'defect_sheet7', 'defect_sheet8', 'defect_sheet9', 'defect_sheet10', 
+            defect_sheet_choices, 'defect_sheet'
+        )
 
-                    for sheet in sheets:
-                        section = Section.objects.filter(group=request.user.group, name=sheet).first()
-                        if section:
-                            patient.sections.add(section)
+        fields = [
+            'defect_type', 'defect_type2', 'defect_type3',
+            'defect_type4', 'defect_type5', 'defect_type6',
+            'defect_type7', 'defect_type8', 'defect_type9', 'defect_type10'
+        ]
 
-                        room = Room.objects.filter(group=request.user.group, name=sheet).first()
-                        if room:
-                            patient.rooms.add(room)
+        defect_type_counts, defect_type_percents = count_multiselect_defects(
+            section_cases,
+            fields,
+            defect_type_choices
+        )
 
-                        patient.save()
-                
-                # برداشت ردیف های شیت های بخش به عنوان پرونده بخش
-                for sheet in section_sheets:
-                    try:
-                        df = pd.read_excel(file_path, sheet_name=sheet)
-                        df = df.loc[:, ~df.columns.str.contains("^Unnamed")]
 
-                        if df.shape[1] >= 9:
-                            df = df[df.iloc[:, 8].astype(str).str.contains("P", na=False)]
-
-                        if df.shape[1] >= 14:
-                            for i in range(len(df)):
-                                try:
-                                    insurance = str(df.iloc[i, 0]).strip()
-                                    discharge_date = str(df.iloc[i, 1]).strip()
-                                    section_name = str(df.iloc[i, 2]).strip()
-                                    doctor_name = str(df.iloc[i, 3]).strip()
-                                    admission_date = str(df.iloc[i, 4]).strip()
-                                    number = str(df.iloc[i, 6]).strip()
-                                    rep_doctor_name = str(df.iloc[i, 7]).strip()
-                                    patient_name = str(df.iloc[i, 8]).strip()
-                                    delivery_date = str(df.iloc[i, 9]).strip()
-                                    defect_sheet = str(df.iloc[i, 10]).strip()
-                                    defect_type_raw = df.iloc[i, 11]
-                                    defect_sheet2 = str(df.iloc[i, 12]).strip()
-                                    defect_type2_raw = df.iloc[i, 13]
-
-                                    section = Section.objects.filter(group=request.user.group, name=section_name).first()
-                                    doctor = Doctor.objects.filter(group=request.user.group, full_name=doctor_name).first()
-                                    rep_doctor = Doctor.objects.filter(group=request.user.group, full_name=rep_doctor_name).first()
-                                    patient = Patient.objects.filter(group=request.user.group, full_name=patient_name).first()
-                                    defect_sheet = defect_sheet_map.get(defect_sheet, None)
-                                    defect_sheet2 = defect_sheet_map.get(defect_sheet2, None)
-                                    defect_type_list = defect_type_raw if isinstance(defect_type_raw, list) else [defect_type_raw]
-                                    defect_type2_list = defect_type2_raw if isinstance(defect_type2_raw, list) else [defect_type2_raw]
-
-                                    defect_type_clean = [
-                                        defect_type_map.get(str(dt).strip(), None)
-                                        for dt in defect_type_list if dt is not None
-                                ]
+    return defect_counts, defect_percents, defect_type_counts, defect_type_percents
 
-                                    defect_type2_clean = [
-                                        defect_type_map.get(str(dt).strip(), None)
-                                        for dt in defect_type2_list if dt is not None
-                                    ]
-
-                                    if defect_type_clean:
-                                        defect_type_summary = ', '.join([str(dt) for dt in defect_type_clean if dt is not None])
-                                    else:
-                                        defect_type_summary = ''
-
-                                    if defect_type2_clean:
-                                        defect_type2_summary = ', '.join([str(dt) for dt in defect_type2_clean if dt is not None])
-                                    else:
-                                        defect_type2_summary = ''
-
-                                    SectionCase.objects.create(
-                                        group=request.user.group,
-                                        insurance=insurance,
-                                        discharge_date=discharge_date,
-                                        section=section,
-                                        doctor=doctor,
-                                        admission_date=admission_date,
-                                        number=number,
-                                        representative_doctor=rep_doctor,
-                                        patient=patient,
-                                        delivery_date=delivery_date,
-                                        defect_sheet=defect_sheet,
-                                        defect_type=defect_type_summary,
-                                        defect_sheet2=defect_sheet2,
-                                        defect_type2=defect_type2_summary
-                                    )
-                                except Exception as row_error:
-                                    print(f" خطا در ردیف {i} از شیت {sheet}: {row_error}")
-                    except Exception as e:
-                        print(f" خطا در شیت '{sheet}': {e}")
-
-                # برداشت ردیف های شیت های اتاق عمل به عنوان پرونده اتاق عمل
-                for sheet in room_sheets:
-                    try:
-                        df = pd.read_excel(file_path, sheet_name=sheet)
-                        df = df.loc[:, ~df.columns.str.contains("^Unnamed")]
-
-                        if df.shape[1] >= 11:
-                            for i in range(len(df)):
-                                try:
-                                    hospitalization_date = str(df.iloc[i, 0]).strip()
-                                    discharge_date = str(df.iloc[i, 1]).strip()
-                                    operation_date = str(df.iloc[i, 2]).strip()
-                                    patient_name = str(df.iloc[i, 3]).strip()
-                                    number = str(df.iloc[i, 5]).strip()
-                                    room_name = str(df.iloc[i, 6]).strip()
-                                    operation_type = str(df.iloc[i, 7]).strip()
-                                    k = str(df.iloc[i, 8]).strip()
-                                    doctor_name = str(df.iloc[i, 9]).strip()
-                                    anesthesia_type = str(df.iloc[i, 10]).strip()
-
-                                    patient = Patient.objects.filter(group=request.user.group, full_name__icontains=patient_name).first()
-                                    room = Room.objects.filter(group=request.user.group, name=room_name).first()
-                                    operation_type = operation_type_dict.get(operation_type, None)
-                                    doctor = Doctor.objects.filter(group=request.user.group, full_name=doctor_name).first()
-
-                                    RoomCase.objects.create(
-                                        group=request.user.group,
-                                        hospitalization_date=hospitalization_date,
-                                        discharge_date=discharge_date,
-                                        operation_date=operation_date,
-                                        patient=patient,
-                                        number=number,
-                                        room=room,
-                                        operation_type=operation_type,
-                                        k=k,
-                                        doctor=doctor,
-                                        anesthesia_type=anesthesia_type,
-                                    )
-                                except Exception as row_error:
-                                    print(f" خطا در ردیف {i} از شیت {sheet}: {row_error}")
-                    except Exception as e:
-                        print(f" خطا در شیت '{sheet}': {e}")
-                
-                # برداشت ردیف های شیت فوت به عنوان پرونده فوت
-                for DC_sheet in DC_sheets:
-                    try:
-                        df = pd.read_excel(file_path, sheet_name=DC_sheet)
-                        df = df.loc[:, ~df.columns.str.contains("^Unnamed")]
+@metrics.import_job('main')
+@search.deferred_indexing
+def import_excel(request):
+    if request.method == 'POST':
+        form = ExcelForm(request.POST, request.FILES)
+        if form.is_valid():
+            excel_instance = form.save(commit=False)
+            excel_instance.group = request.user.group
+            excel_instance.save()
 
-                        if df.shape[1] >= 1:
-                            df = df[df.iloc[:, 0].astype(str).str.contains("U", na=False)]
-                        
-                        if df.shape[1] >= 14:
-                            for i in range(len(df)):
-                                try:
-                                    number = str(df.iloc[i, 0]).strip()
-                                    doctor_full_name = str(df.iloc[i, 1]).strip()
-                                    cause_of_death = str(df.iloc[i, 2]).strip()
-                                    location_of_death = str(df.iloc[i, 3]).strip()
-                                    hospitalization_section = str(df.iloc[i, 4]).strip()
-                                    death_date = str(df.iloc[i, 5]).strip()
-                                    admission_date = str(df.iloc[i, 6]).strip()
-                                    age = str(df.iloc[i, 9]).strip()
-                                    gender = str(df.iloc[i, 10]).strip()
-                                    patient_name = str(df.iloc[i, 11]).strip()
-                                    delivery_date = str(df.iloc[i, 13]).strip()
-
-                                    doctor = Doctor.objects.filter(group=request.user.group, full_name=doctor_full_name).first()
-                                    section = Section.objects.filter(group=request.user.group, name=hospitalization_section).first()
-                                    gender = gender_dict.get(gender, None)
-                                    patient = Patient.objects.filter(group=request.user.group, full_name=patient_name).first()
-
-                                    DC.objects.create(
-                                        group=request.user.group,
-                                        number=number,
-                                        doctor=doctor,
-                                        cause_of_death=cause_of_death,
-                                        location_of_death=location_of_death,
-                                        hospitalization_section=section,
-                                        death_date=death_date,
-                                        admission_date=admission_date,
-                                        age=age,
-                                        gender=gender,
-                                        patient=patient,
-                                        delivery_date=delivery_date,
-                                    )
-                                except Exception as row_error:
-                                    print(f" خطا در ردیف {i} از شیت {sheet}: {row_error}")
-                    except Exception as e:
-                        print(f"خطا در شیت '{sheet}': {e}")
-                return redirect('main')
-        else:
-            form = ExcelForm()
-        
-        context = {
-            'form': form,
-        }
+            file_path = excel_instance.file.path
+            excel_file = pd.ExcelFile(file_path)
 
-        return render(request, 'create_excel.html', context=context)
+            # دریافت نام همه شیت‌ها
+            sheet_names = excel_file.sheet_names
 
-@login_required
-@manager_required
-@group_is_owner(Section, lookup_field='pk', group_field='group')
-def section_detail(request, pk):
-    section = get_object_or_404(Section, pk=pk)
-    user_group = request.user.group
-    section_cases_all = SectionCase.objects.filter(group=user_group, section=section)
-    dc_section_cases_all = DC.objects.filter(group=user_group, hospitalization_section=section)
-    doctors = section.doctor_sections.all()
+            # جدا کردن شیت‌ها بر اساس کلمات کلیدی در اسم‌شون
+            section_sheets = [name for name in sheet_names if 'section' in name.lower()]
+            room_sheets = [name for name in sheet_names if 'room' in name.lower()]
+            DC_sheets = [name for name in sheet_names if 'dc' in name.lower()]
 
-    def to_date(date_str):
-        try:
-            return Persian(date_str).gregorian_datetime() if isinstance(date_str, str) else None
-        except:
-            return None
+            section_values = {}
+            room_values = {}
+            doctor_data = {}
+            patient_data = {}
 
-    start, end = None, None
-    if request.GET.get("start") and request.GET.get("end"):
-        start = to_date(request.GET["start"])
-        end = to_date(request.GET["end"])
-        if start and end and start > end:
-            start, end = end, start
-
-    def in_range(date):
-        return start <= date <= end if start and end and date else not start and not end
-
-    # فیلتر کردن بر اساس تاریخ پذیرش
-    section_cases = [sc for sc in section_cases_all if in_range(to_date(sc.admission_date))]
-    dc_section_cases = [dc for dc in dc_section_cases_all if in_range(to_date(dc.admission_date))]
-    not_arrived_cases = [
-        sc for sc in section_cases_all
-        if sc.delivery_date == 'nan' and in_range(to_date(sc.admission_date))
-    ]
+            for sheet in section_sheets:
+                try:
+                    # پاک سازی و اصلاح جداول شیت
+                    df = pd.read_excel(file_path, sheet_name=sheet)
+                    df = df.loc[:, ~df.columns.str.contains("^Unnamed")]
 
-    defect_sheet_fields = ['defect_sheet'] + [f'defect_sheet{i}' for i in range(2, 11)]
-    defect_cases = [
-        sc for sc in section_cases
-        if any(getattr(sc, field) for field in defect_sheet_fields)
-    ]
+                    # ردیفی که ستون 9 آن دارای حرف P است به عنوان پرونده درنظر گرفته میشه
+                    if df.shape[1] >= 9:
+                        df = df[df.iloc[:, 8].astype(str).str.contains("P", na=False)]
 
-    # فیلتر بر اساس بیمه
-    def filter_insurance(keyword):
-        return [sc for sc in section_cases if keyword in (sc.insurance or '')]
+                    # استخراج نام بخش ها از ستون سوم هر شیت
+                    if df.shape[1] >= 3:
+                        third_col_values = df.iloc[:, 2].dropna().astype(str).str.strip()
+                        for value in third_col_values:
+                            if value in section_values:
+                                section_values[value].add(sheet)
+                            else:
+                                section_values[value] = {sheet}
 
-    insurance_filters = {
-        'filtered_social_security_cases': 'تامین اجتماعی',
-        'filtered_medical_services_cases': 'خدمات درمانی',
-        'filtered_armed_forces_cases': 'نیرو های مسلح',
-        'filtered_free_cases': 'آزاد'
-    }
-    insurance_results = {key: filter_insurance(val) for key, val in insurance_filters.items()}
+                    # استخراج نام پزشکان از ستون های 4 و 8
+                    for index, row in df.iterrows():
+                        if df.shape[1] >= 4 and df.shape[1] >= 9:
+                            doctor_name_4 = str(row.iloc[3]).strip() if pd.notna(row.iloc[3]) else None
+                            doctor_name_8 = str(row.iloc[7]).strip() if pd.notna(row.iloc[7]) else None
+                            related_value = str(row.iloc[2]).strip() if pd.notna(row.iloc[2]) else None
 
-    # آمار پزشکان
-    doctor_cases = defaultdict(int)
-    doctor_defects = defaultdict(int)
-    for doctor in doctors:
-        for sc in section_cases_all:
-            if sc.doctor == doctor and in_range(to_date(sc.admission_date)):
-                doctor_cases[doctor.full_name] += 1
-                if sc.defect_sheet or sc.defect_sheet2:
-                    doctor_defects[doctor.full_name] += 1
-
-    # محاسبه متوسط اقامت و تحویل
-    arrive_days, stay_days = [], []
-    for sc in section_cases:
-        discharge = to_date(sc.discharge_date)
-        delivery = to_date(sc.delivery_date)
-        admission = to_date(sc.admission_date)
-        if discharge and delivery:
-            arrive_days.append((delivery - discharge).days)
-        if discharge and admission:
-            stay_days.append((discharge - admission).days)
-
-    avg_arrive = round(sum(arrive_days) / len(arrive_days), 0) if arrive_days else '0'
-    avg_stay = round(sum(stay_days) / len(stay_days), 0) if stay_days else '0'
+                        for doctor_name in [doctor_name_4, doctor_name_8]:
+                            if doctor_name:
+                                if doctor_name in doctor_data:
+                                    doctor_data[doctor_name].add(related_value)
+                                else:
+                                    doctor_data[doctor_name] = {related_value}
 
-    # آمار نقص‌ها
-    defect_sheet_fields = ['defect_sheet'] + [f'defect_sheet{i}' for i in range(2, 11)]
-    defect_type_fields = ['defect_type'] + [f'defect_type{i}' for i in range(2, 11)]
+                    # استخراج نام بیماران از ستون نهم
+                    for index, row in df.iterrows():
+                        if df.shape[1] >= 9:
+                            col9_value = str(row.iloc[8]).strip() if pd.notna(row.iloc[8]) else None
+                            related_value = str(row.iloc[2]).strip() if pd.notna(row.iloc[2]) else None
 
-    defect_counts = {
-        name: sum([
-            1 for sc in section_cases
-            if any(getattr(sc, field) == code for field in defect_sheet_fields)
-        ]) for code, name in defect_sheet_choices
-    }
+                            if col9_value:
+                                if col9_value in patient_data:
+                                    patient_data[col9_value].add(related_value)
+                                else:
+                                    patient_data[col9_value] = {related_value}
 
-    defect_type_counts = {
-        name: sum([
-            1 for sc in section_cases
-            if any(
-                getattr(sc, field) and code in getattr(sc, field)
-                for field in defect_type_fields
-            )
-        ]) for code, name in defect_type_choices
-    }
+                except Exception as e:
+                    print(f"خطا در شیت '{sheet}': {e}")
 
-    # آمار سن و جنسیت فوتی‌ها
-    age_counts = {'less_20': 0, 'more_20_less_40': 0, 'more_40_less_60': 0, 'more_60_less_80': 0, 'more_80': 0}
-    gender_counts = {'men': 0, 'women': 0}
-    for dc in dc_section_cases:
-        age = int(''.join(filter(str.isdigit, dc.age or '0')))
-        if age < 20:
-            age_counts['less_20'] += 1
-        elif age < 40:
-            age_counts['more_20_less_40'] += 1
-        elif age < 60:
-            age_counts['more_40_less_60'] += 1
-        elif age < 80:
-            age_counts['more_60_less_80'] += 1
-        else:
-            age_counts['more_80'] += 1
-        gender_counts['men' if dc.gender == '1' else 'women'] += 1
+            # اعمال کار های مشابه در شیت های اتاق عمل
+            # نام اتاق از ستون 7
+            # نام پزشک از ستون 10
+            # نام بیمار از ترکیب ستون های نام بیمار و شناسه آن
+            for sheet in room_sheets:
+                try:
+                    df = pd.read_excel(file_path, sheet_name=sheet)
+                    df = df.loc[:, ~df.columns.str.contains("^Unnamed")]
 
-    # Pagination helper
-    def paginate(request, objects_list, per_page=100, name='page'):
-        paginator = Paginator(objects_list, per_page)
-        page_number = request.GET.get(name)
-        return paginator.get_page(page_number)
+                    if df.shape[1] >= 7:
+                        seventh_col_values = df.iloc[:, 6].dropna().astype(str).str.strip()
+                        for value in seventh_col_values:
+                            if value in room_values:
+                                room_values[value].add(sheet)
+                            else:
+                                room_values[value] = {sheet}
 
-    context = {
-        'section': section,
-        'doctors_count': len(set(sc.doctor for sc in section_cases if sc.doctor)),
-        'patients_count': len(set(sc.patient for sc in section_cases if sc.patient)),
-        'filtered_section_cases': paginate(request, section_cases, name='sc_page'),
-        'filtered_section_cases_count': len(section_cases),
-        'filtered_dc_section_cases': paginate(request, dc_section_cases, name='dc_page'),
-        'filtered_dc_section_cases_count': len(dc_section_cases),
-        'filtered_not_arrived_cases': paginate(request, not_arrived_cases, name='nc_page'),
-        'filtered_not_arrived_cases_count': len(not_arrived_cases),
-        'filtered_defect_cases': paginate(request, defect_cases, name='defc_page'),
-        'filtered_defect_cases_count': len(defect_cases),
-        **{key: val for key, val in insurance_results.items()},
-        **{f'{key}_count': len(val) for key, val in insurance_results.items()},
-        'average_arrive_daies': avg_arrive,
-        'average_stay_daies': avg_stay,
-        'defect_counts': defect_counts,
-        'defect_type_counts': defect_type_counts,
-        'doctor_cases': dict(doctor_cases),
-        'doctor_defects': dict(doctor_defects),
-        'age_counts': age_counts,
-        'gender_counts': gender_counts,
-    }
-    return render(request, 'section_detail.html', context)
+                    for index, row in df.iterrows():
+                        if df.shape[1] >= 10:
+                            col10_value = str(row.iloc[9]).strip() if pd.notna(row.iloc[9]) else None
+                            related_value = str(row.iloc[6]).strip() if pd.notna(row.iloc[6]) else None
 
-@login_required
-@manager_required
-@group_is_owner(Room, lookup_field='pk', group_field='group')
-def room_detail(request, pk):
-    room = get_object_or_404(Room, pk=pk)
-    group = request.user.group
+                        if col10_value:
+                            if col10_value in doctor_data:
+                                doctor_data[col10_value].add(related_value)
+                            else:
+                                doctor_data[col10_value] = {related_value}
 
-    room_cases = RoomCase.objects.filter(group=group, room=room)
-    doctors = room.doctor_rooms.all()
-    patients = set(room_cases.values_list('patient', flat=True))
-    doctors_count = doctors.count()
-    patients_count = len(patients)
+                    if 'شناسه بیمار' in df.columns and 'نام بیمار' in df.columns:
+                        combined_values = df[['شناسه بیمار', 'نام بیمار', df.columns[2]]].dropna().astype(str).apply(
+                            lambda row: row['شناسه بیمار'].strip() + ' ' + row['نام بیمار'].strip(), axis=1)
 
-    def to_gregorian(date_str):
-        try:
-            return Persian(date_str).gregorian_datetime()
-        except:
-            return None
+                        related_values = df.iloc[:, 6].dropna().astype(str).str.strip()
 
-    def filter_by_date(queryset):
-        return [
-            case for case in queryset
-            if isinstance(case.operation_date, str)
-            and (dt := to_gregorian(case.operation_date))
-            and start <= dt <= end
-        ]
+                        for index, value in enumerate(combined_values):
+                            related_value = related_values.iloc[index] if index < len(related_values) else None
+                            if value and related_value:
+                                if value in patient_data:
+                                    patient_data[value].add(related_value)
+                                else:
+                                    patient_data[value] = {related_value}
+                except Exception as e:
+                    print(f"خطا در شیت '{sheet}': {e}")
 
-    doctor_cases = {}
-    filtered_room_cases = list(room_cases)
-    filtered_big_room_cases = room_cases.filter(operation_type='3')
-    filtered_medium_room_cases = room_cases.filter(operation_type='2')
-    filtered_small_room_cases = room_cases.filter(operation_type='1')
+            # اتصال اتاق های به دست آمده به نام شیت آنها
+            for value, sheets in room_values.items():
+                for sheet in sheets:
+                    room, created = Room.objects.get_or_create(group=request.user.group, name=value, sheet='')
 
-    if request.GET.get("start") and request.GET.get("end"):
-        try:
-            start = to_gregorian(request.GET["start"])
-            end = to_gregorian(request.GET["end"])
-            if start and end and start > end:
-                start, end = end, start
+            # اعمال کار های مشابه در شیت های فوت
+            # نام بخش از ستون 5
+            # نام پزشک از ستون 2
+            # نام بیمار از ترکیب ستون 12
+            for DC_sheet in DC_sheets:
+                try:
+                    df = pd.read_excel(file_path, sheet_name=DC_sheet)
+                    df = df.loc[:, ~df.columns.str.contains("^Unnamed")]
 
-            filtered_room_cases = filter_by_date(room_cases)
-            filtered_big_room_cases = filter_by_date(filtered_big_room_cases)
-            filtered_medium_room_cases = filter_by_date(filtered_medium_room_cases)
-            filtered_small_room_cases = filter_by_date(filtered_small_room_cases)
+                    # ردیفی که ستون 1 آن دارای حرف U است به عنوان پرونده درنظر گرفته میشه
+                    if df.shape[1] >= 1:
+                        df = df[df.iloc[:, 0].astype(str).str.contains("U", na=False)]
 
-            doctors_count = len(set(c.doctor for c in filtered_room_cases))
-            patients_count = len(set(c.patient for c in filtered_room_cases))
+                    if df.shape[1] >= 5:
+                        third_col_values = df.iloc[:, 4].dropna().astype(str).str.strip()
+                        for value in third_col_values:
+                            if value in section_values:
+                                section_values[value].add(DC_sheet)
+                            else:
+                                section_values[value] = {DC_sheet}
 
-            for doctor in doctors:
-                doctor_cases[doctor.full_name] = len([
-                    c for c in filtered_room_cases if c.doctor == doctor
-                ])
-        except:
-            pass
-    else:
-        for doctor in doctors:
-            doctor_cases[doctor.full_name] = room_cases.filter(doctor=doctor).count()
-    
-    # Pagination helper
-    def paginate(request, objects_list, per_page=100, name='page'):
-        paginator = Paginator(objects_list, per_page)
-        page_number = request.GET.get(name)
-        return paginator.get_page(page_number)
+                    for index, row in df.iterrows():
+                        if df.shape[1] >= 2:
+                            col10_value = str(row.iloc[1]).strip() if pd.notna(row.iloc[1]) else None
+                            related_value = str(row.iloc[4]).strip() if pd.notna(row.iloc[4]) else None
 
-    context = {
-        'room': room,
-        'doctors_count': doctors_count,
-        'patients_count': patients_count,
-        'filtered_room_cases': paginate(request, filtered_room_cases, name='rc'),
-        'filtered_room_cases_count': len(filtered_room_cases),
-        'filtered_big_room_cases_count': len(filtered_big_room_cases),
-        'filtered_medium_room_cases_count': len(filtered_medium_room_cases),
-        'filtered_small_room_cases_count': len(filtered_small_room_cases),
-        'doctor_cases': doctor_cases,
+                        if col10_value:
+                            if col10_value in doctor_data:
+                                doctor_data[col10_value].add(related_value)
+                            else:
+                                doctor_data[col10_value] = {related_value}
+
+                    for index, row in df.iterrows():
+                        if df.shape[1] >= 12:
+                            col9_value = str(row.iloc[11]).strip() if pd.notna(row.iloc[11]) else None
+                            related_value = str(row.iloc[4]).strip() if pd.notna(row.iloc[4]) else None
+
+                            if col9_value:
+                                if col9_value in patient_data:
+                                    patient_data[col9_value].add(related_value)
+                                else:
+                                    patient_data[col9_value] = {related_value}
+                except Exception as e:
+                    print(f"خطا در شیت '{DC_sheet}': {e}")
+
+            # اتصال بخش های به دست آمده به نام شیت آنها
+            for value, sheets in section_values.items():
+                for sheet in sheets:
+                    section, created = Section.objects.get_or_create(group=request.user.group, name=value, sheet='')
+
+            # اتصال پزشکان به بخش ها و اتاق های آنها
+            for full_name, sheets in doctor_data.items():
+                doctor, created = Doctor.objects.get_or_create(group=request.user.group, full_name=full_name)
+
+                for sheet in sheets:
+                    section = Section.objects.filter(group=request.user.group, name=sheet).first()
+                    if section:
+                        doctor.sections.add(section)
+
+                    room = Room.objects.filter(group=request.user.group, name=sheet).first()
+                    if room:
+                        doctor.rooms.add(room)
+
+                    doctor.save()
+
+            # اتصال بیماران به بخش ها و اتاق های آنها
+            for full_name, sheets in patient_data.items():
+                patient, created = resolve_patient(request.user.group, full_name)
+
+                for sheet in sheets:
+                    section = Section.objects.filter(group=request.user.group, name=sheet).first()
+                    if section:
+                        patient.sections.add(section)
+
+                    room = Room.objects.filter(group=request.user.group, name=sheet).first()
+                    if room:
+                        patient.rooms.add(room)
+
+                    patient.save()
+
+            # برداشت ردیف های شیت های بخش به عنوان پرونده بخش
+            for sheet in section_sheets:
+                try:
+                    df = pd.read_excel(file_path, sheet_name=sheet)
+                    df = df.loc[:, ~df.columns.str.contains("^Unnamed")]
+
+                    if df.shape[1] >= 9:
+                        df = df[df.iloc[:, 8].astype(str).str.contains("P", na=False)]
+
+                    if df.shape[1] >= 14:
+                        for i in range(len(df)):
+                            try:
+                                insurance = str(df.iloc[i, 0]).strip()
+                                discharge_date = str(df.iloc[i, 1]).strip()
+                                section_name = str(df.iloc[i, 2]).strip()
+                                doctor_name = str(df.iloc[i, 3]).strip()
+                                admission_date = str(df.iloc[i, 4]).strip()
+                                number = str(df.iloc[i, 6]).strip()
+                                rep_doctor_name = str(df.iloc[i, 7]).strip()
+                                patient_name = str(df.iloc[i, 8]).strip()
+                                delivery_date = str(df.iloc[i, 9]).strip()
+                                defect_sheet = str(df.iloc[i, 10]).strip()
+                                defect_type_raw = df.iloc[i, 11]
+                                defect_sheet2 = str(df.iloc[i, 12]).strip()
+                                defect_type2_raw = df.iloc[i, 13]
+
+                                section = Section.objects.filter(group=request.user.group, name=section_name).first()
+                                doctor = Doctor.objects.filter(group=request.user.group, full_name=doctor_name).first()
+                                rep_doctor = Doctor.objects.filter(group=request.user.group, full_name=rep_doctor_name).first()
+                                patient = find_patient(request.user.group, patient_name)
+                                defect_sheet = defect_sheet_map.get(defect_sheet, None)
+                                defect_sheet2 = defect_sheet_map.get(defect_sheet2, None)
+                                defect_type_list = defect_type_raw if isinstance(defect_type_raw, list) else [defect_type_raw]
+                                defect_type2_list = defect_type2_raw if isinstance(defect_type2_raw, list) else [defect_type2_raw]
+
+                                defect_type_clean = [
+                                    defect_type_map.get(str(dt).strip(), None)
+                                    for dt in defect_type_list if dt is not None
+                            ]
+
+                                defect_type2_clean = [
+                                    defect_type_map.get(str(dt).strip(), None)
+                                    for dt in defect_type2_list if dt is not None
+                                ]
+
+                                if defect_type_clean:
+                                    defect_type_summary = ', '.join([str(dt) for dt in defect_type_clean if dt is not None])
+                                else:
+                                    defect_type_summary = ''
+
+                                if defect_type2_clean:
+                                    defect_type2_summary = ', '.join([str(dt) for dt in defect_type2_clean if dt is not None])
+                                else:
+                                    defect_type2_summary = ''
+
+                                SectionCase.objects.create(
+                                    group=request.user.group,
+                                    insurance=insurance,
+                                    discharge_date=discharge_date,
+                                    section=section,
+                                    doctor=doctor,
+                                    admission_date=admission_date,
+                                    number=number,
+                                    representative_doctor=rep_doctor,
+                                    patient=patient,
+                                    delivery_date=delivery_date,
+                                    defect_sheet=defect_sheet,
+                                    defect_type=defect_type_summary,
+                                    defect_sheet2=defect_sheet2,
+                                    defect_type2=defect_type2_summary
+                                )
+                            except Exception as row_error:
+                                print(f" خطا در ردیف {i} از شیت {sheet}: {row_error}")
+                except Exception as e:
+                    print(f" خطا در شیت '{sheet}': {e}")
+
+            # برداشت ردیف های شیت های اتاق عمل به عنوان پرونده اتاق عمل
+            for sheet in room_sheets:
+                try:
+                    df = pd.read_excel(file_path, sheet_name=sheet)
+                    df = df.loc[:, ~df.columns.str.contains("^Unnamed")]
+
+                    if df.shape[1] >= 11:
+                        for i in range(len(df)):
+                            try:
+                                hospitalization_date = str(df.iloc[i, 0]).strip()
+                                discharge_date = str(df.iloc[i, 1]).strip()
+                                operation_date = str(df.iloc[i, 2]).strip()
+                                patient_name = str(df.iloc[i, 3]).strip()
+                                number = str(df.iloc[i, 5]).strip()
+                                room_name = str(df.iloc[i, 6]).strip()
+                                operation_type = str(df.iloc[i, 7]).strip()
+                                k = str(df.iloc[i, 8]).strip()
+                                doctor_name = str(df.iloc[i, 9]).strip()
+                                anesthesia_type = str(df.iloc[i, 10]).strip()
+
+                                patient = find_patient(request.user.group, patient_name)
+                                room = Room.objects.filter(group=request.user.group, name=room_name).first()
+                                operation_type = operation_type_dict.get(operation_type, None)
+                                doctor = Doctor.objects.filter(group=request.user.group, full_name=doctor_name).first()
+
+                                RoomCase.objects.create(
+                                    group=request.user.group,
+                                    hospitalization_date=hospitalization_date,
+                                    discharge_date=discharge_date,
+                                    operation_date=operation_date,
+                                    patient=patient,
+                                    number=number,
+                                    room=room,
+                                    operation_type=operation_type,
+                                    k=k,
+                                    doctor=doctor,
+                                    anesthesia_type=anesthesia_type,
+                                )
+                            except Exception as row_error:
+                                print(f" خطا در ردیف {i} از شیت {sheet}: {row_error}")
+                except Exception as e:
+                    print(f" خطا در شیت '{sheet}': {e}")
+
+            # برداشت ردیف های شیت فوت به عنوان پرونده فوت
+            for DC_sheet in DC_sheets:
+                try:
+                    df = pd.read_excel(file_path, sheet_name=DC_sheet)
+                    df = df.loc[:, ~df.columns.str.contains("^Unnamed")]
+
+                    if df.shape[1] >= 1:
+                        df = df[df.iloc[:, 0].astype(str).str.contains("U", na=False)]
+
+                    if df.shape[1] >= 14:
+                        for i in range(len(df)):
+                            try:
+                                number = str(df.iloc[i, 0]).strip()
+                                doctor_full_name = str(df.iloc[i, 1]).strip()
+                                cause_of_death = str(df.iloc[i, 2]).strip()
+                                location_of_death = str(df.iloc[i, 3]).strip()
+                                hospitalization_section = str(df.iloc[i, 4]).strip()
+                                death_date = str(df.iloc[i, 5]).strip()
+                                admission_date = str(df.iloc[i, 6]).strip()
+                                age = str(df.iloc[i, 9]).strip()
+                                gender = str(df.iloc[i, 10]).strip()
+                                patient_name = str(df.iloc[i, 11]).strip()
+                                delivery_date = str(df.iloc[i, 13]).strip()
+
+                                doctor = Doctor.objects.filter(group=request.user.group, full_name=doctor_full_name).first()
+                                section = Section.objects.filter(group=request.user.group, name=hospitalization_section).first()
+                                gender = gender_dict.get(gender, None)
+                                patient = find_patient(request.user.group, patient_name)
+
+                                DC.objects.create(
+                                    group=request.user.group,
+                                    number=number,
+                                    doctor=doctor,
+                                    cause_of_death=cause_of_death,
+                                    location_of_death=location_of_death,
+                                    hospitalization_section=section,
+                                    death_date=death_date,
+                                    admission_date=admission_date,
+                                    age=age,
+                                    gender=gender,
+                                    patient=patient,
+                                    delivery_date=delivery_date,
+                                )
+                            except Exception as row_error:
+                                print(f" خطا در ردیف {i} از شیت {sheet}: {row_error}")
+                except Exception as e:
+                    print(f"خطا در شیت '{sheet}': {e}")
+
+            request.user.group.bump_data_version()
+            return redirect('main')
+    else:
+        form = ExcelForm()
+
+    context = {
+        'form': form,
     }
 
-    return render(request, 'room_detail.html', context)
+    return render(request, 'create_excel.html', context=context)
+
+FRAGMENT_MAX_AGE = 60
+
+def fragment_etag(request, *args, **kwargs):
+    # تا وقتی داده گروه (با ورود اکسل، ویرایش یا حذف) تغییر نکرده، نسخه قبلی فرگمنت در مرورگر معتبره
+    group = request.user.group
+    return '{}-{}-{}'.format(group.pk, group.data_version, request.get_full_path())
+
+def fragment(view_func):
+    # فرگمنت های صفحات جزئیات: کش خصوصی کوتاه مدت در مرورگر و پاسخ 304 با ETag
+    conditional_view = condition(etag_func=fragment_etag)(view_func)
+
+    if iscoroutinefunction(view_func):
+        @wraps(view_func)
+        async def _async_view(request, *args, **kwargs):
+            response = await conditional_view(request, *args, **kwargs)
+            patch_cache_control(response, private=True, max_age=FRAGMENT_MAX_AGE)
+            return response
+        return _async_view
+
+    @wraps(view_func)
+    def _wrapped_view(request, *args, **kwargs):
+        response = conditional_view(request, *args, **kwargs)
+        patch_cache_control(response, private=True, max_age=FRAGMENT_MAX_AGE)
+        return response
+    return _wrapped_view
+
+def stats_fragment_key(request, name, obj):
+    # کلید HTML آمار یک بخش یا پزشک: گروه، نسخه داده، بازه تاریخ و شناسه
+    params = {'start': request.GET.get("start"), 'end': request.GET.get("end")}
+    return group_cache.make_key(request.user.group, name, params=params, parts=[obj.pk])
+
+def cached_fragment(name, key):
+    # HTML فرگمنت فقط یک بار از کش خونده میشه؛ اگه بود همون فرستاده میشه و محاسبه context لازم نیست
+    html = cache.get(key)
+    group_cache.record(name, html is not None)
+    return html
+
+def render_fragment(request, key, template_name, context):
+    html = render_to_string(template_name, context, request)
+    cache.set(key, html, settings.FRAGMENT_CACHE_TIMEOUT)
+    return HttpResponse(html)
+
+def detail_range(request):
+    start = request.GET.get("start")
+    end = request.GET.get("end")
+    if not (start and end):
+        start = end = None
+    return start, end
 
 @login_required
 @manager_required
-@group_is_owner(Doctor, lookup_field='pk', group_field='group')
-def doctor_detail(request, pk):
-    doctor = get_object_or_404(Doctor, pk=pk)
-    group = request.user.group
+@group_is_owner(Section, lookup_field='pk', group_field='group')
+def section_detail(request, pk):
+    # پوسته سبک صفحه؛ کارت ها، نمودار ها و جدول ها هر کدوم از endpoint خودشون گرفته میشن
+    section = get_object_or_404(Section, pk=pk)
+    return render(request, 'section_detail.html', {'section': section})
 
-    def to_gregorian(date_str):
-        try:
-            return Persian(date_str).gregorian_datetime()
-        except:
-            return None
+@login_required
+@manager_required
+@group_is_owner(Section, lookup_field='pk', group_field='group')
+@fragment
+async def section_stats(request, pk):
+    section = await aget_object_or_404(Section, pk=pk)
+    group = request.user.group
+    key = stats_fragment_key(request, 'section_stats', section)
+    html = await sync_to_async(cached_fragment)('section_stats', key)
+    if html is not None:
+        return HttpResponse(html)
+
+    start, end = detail_range(request)
+    tabs = detail_tabs(group, section=section, start=start, end=end)
+    results = await concurrency.gather(
+        counts=lambda: tab_counts(tabs),
+        averages=lambda: stay_averages(tabs['sc']),
+    )
+    counts = results['counts']
+    avg_arrive, avg_stay = results['averages']
 
-    def filter_by_date(queryset, date_field):
-        result = []
-        for obj in queryset:
-            date_value = getattr(obj, date_field)
-            if isinstance(date_value, str):
-                case_date = to_gregorian(date_value)
-                if case_date and start <= case_date <= end:
-                    result.append(obj)
-        return result
-
-    section_cases = SectionCase.objects.filter(group=group, doctor=doctor)
-    dc_section_cases = DC.objects.filter(group=group, doctor=doctor)
-    room_cases = RoomCase.objects.filter(group=group, doctor=doctor)
-    big_room_cases = room_cases.filter(operation_type='3')
-    medium_room_cases = room_cases.filter(operation_type='2')
-    small_room_cases = room_cases.filter(operation_type='1')
+    context = {
+        'section': section,
+        'doctors_count': counts['doctors'],
+        'patients_count': counts['patients'],
+        'filtered_section_cases_count': counts['sc'],
+        'filtered_dc_section_cases_count': counts['dc'],
+        'filtered_not_arrived_cases_count': counts['nc'],
+        'filtered_defect_cases_count': counts['defc'],
+        **{f'filtered_{key}_cases_count': counts[key] for key in INSURANCES},
+        'average_arrive_daies': avg_arrive,
+        'average_stay_daies': avg_stay,
+    }
+    return await sync_to_async(render_fragment)(request, key, 'section_stats.html', context)
 
-    not_arrived_cases = section_cases.filter(delivery_date='nan')
+@login_required
+@manager_required
+@group_is_owner(Section, lookup_field='pk', group_field='group')
+@fragment
+def section_charts(request, pk):
+    section = get_object_or_404(Section, pk=pk)
+    group = request.user.group
+    start, end = detail_range(request)
 
-    defect_cases = section_cases.filter(
-        Q(defect_sheet__isnull=False) | Q(defect_sheet2__isnull=False)
+    data = group_cache.get_or_set(
+        group, 'section_charts', lambda: section_chart_data(group, section, start, end),
+        params={'start': start, 'end': end}, parts=[section.pk], timeout=settings.FRAGMENT_CACHE_TIMEOUT,
     )
-    all_defect_cases = SectionCase.objects.filter(group=group).filter(
-        Q(defect_sheet__isnull=False) | Q(defect_sheet2__isnull=False)
+    return JsonResponse(data)
+
+def section_chart_data(group, section, start, end):
+    tabs = detail_tabs(group, section=section, start=start, end=end)
+
+    # آمار پزشکان
+    doctor_rows = (
+        tabs['sc'].order_by()
+        .filter(doctor__in=section.doctor_sections.all())
+        .values('doctor__full_name')
+        .annotate(
+            cases=Count('id'),
+            defects=Count('id', filter=Q(defect_sheet__isnull=False) | Q(defect_sheet2__isnull=False)),
+        )
     )
+    doctor_cases, doctor_defects = {}, {}
+    for row in doctor_rows:
+        doctor_cases[row['doctor__full_name']] = row['cases']
+        if row['defects']:
+            doctor_defects[row['doctor__full_name']] = row['defects']
 
-    insurance_filter = lambda s: section_cases.filter(insurance__icontains=s)
-    social_security_cases = insurance_filter("تامین اجتماعی")
-    medical_services_cases = insurance_filter("خدمات درمانی")
-    armed_forces_cases = insurance_filter("نیرو های مسلح")
-    free_cases = insurance_filter("آزاد")
+    defect_counts, defect_type_counts = defect_distribution(tabs['sc'])
+    age_counts, gender_counts = death_demographics(tabs['dc'])
 
-    patients = set(section_cases.values_list('patient', flat=True)) | set(room_cases.values_list('patient', flat=True))
-    patients_count = len(patients)
-
-    # فیلتر زمانی
-    filtered_section_cases = section_cases
-    filtered_dc_section_cases = dc_section_cases
-    filtered_not_arrived_cases = not_arrived_cases
-    filtered_defect_cases = defect_cases
-    filtered_all_defect_cases = all_defect_cases
-    filtered_social_security_cases = social_security_cases
-    filtered_medical_services_cases = medical_services_cases
-    filtered_armed_forces_cases = armed_forces_cases
-    filtered_free_cases = free_cases
-    filtered_room_cases = room_cases
-    filtered_big_room_cases = big_room_cases
-    filtered_medium_room_cases = medium_room_cases
-    filtered_small_room_cases = small_room_cases
+    return {
+        'defect_counts': defect_counts,
+        'defect_type_counts': defect_type_counts,
+        'doctor_cases': doctor_cases,
+        'doctor_defects': doctor_defects,
+        'age_counts': age_counts,
+        'gender_counts': gender_counts,
+    }
 
-    if request.GET.get("start") and request.GET.get("end"):
-        try:
-            start = to_gregorian(request.GET["start"])
-            end = to_gregorian(request.GET["end"])
+DETAIL_TAB_TEMPLATES = {
+    'sc': 'section_case_tab.html',
+    'dc': 'dc_tab.html',
+    'nc': 'section_case_tab.html',
+    'defc': 'section_case_tab.html',
+}
 
-            if start and end and start > end:
-                start, end = end, start
+def render_tab(request, tabs, tab):
+    # یک صفحه از یک تب؛ LIMIT/OFFSET در خود دیتابیس اعمال میشه
+    if tab not in DETAIL_TAB_TEMPLATES:
+        raise Http404
+    page_obj = Paginator(tabs[tab], 100).get_page(request.GET.get('page'))
+    return render(request, DETAIL_TAB_TEMPLATES[tab], {'page_obj': page_obj})
 
-            filtered_section_cases = filter_by_date(section_cases, 'admission_date')
-            filtered_dc_section_cases = filter_by_date(dc_section_cases, 'admission_date')
-            filtered_not_arrived_cases = filter_by_date(not_arrived_cases, 'admission_date')
-            filtered_defect_cases = filter_by_date(defect_cases, 'admission_date')
-            filtered_all_defect_cases = filter_by_date(all_defect_cases, 'admission_date')
-            filtered_social_security_cases = filter_by_date(social_security_cases, 'admission_date')
-            filtered_medical_services_cases = filter_by_date(medical_services_cases, 'admission_date')
-            filtered_armed_forces_cases = filter_by_date(armed_forces_cases, 'admission_date')
-            filtered_free_cases = filter_by_date(free_cases, 'admission_date')
-            filtered_room_cases = filter_by_date(room_cases, 'operation_date')
-            filtered_big_room_cases = filter_by_date(big_room_cases, 'operation_date')
-            filtered_medium_room_cases = filter_by_date(medium_room_cases, 'operation_date')
-            filtered_small_room_cases = filter_by_date(small_room_cases, 'operation_date')
-
-            f_patients = set(c.patient for c in filtered_section_cases + filtered_room_cases)
-            patients_count = len(f_patients)
-
-        except Exception as e:
-            print("Error filtering by date range:", e)
+@login_required
+@manager_required
+@group_is_owner(Section, lookup_field='pk', group_field='group')
+@fragment
+def section_tab(request, pk, tab):
+    section = get_object_or_404(Section, pk=pk)
+    start, end = detail_range(request)
+    tabs = detail_tabs(request.user.group, section=section, start=start, end=end)
+    return render_tab(request, tabs, tab)
 
-    def calc_average_days(cases, start_field, end_field):
-        days = []
-        for case in cases:
-            start_date = getattr(case, start_field)
-            end_date = getattr(case, end_field)
-            if isinstance(start_date, str) and isinstance(end_date, str):
-                start_dt = to_gregorian(start_date)
-                end_dt = to_gregorian(end_date)
-                if start_dt and end_dt:
-                    days.append((end_dt - start_dt).days)
-        return round(sum(days) / len(days), 0) if days else '0'
+@login_required
+@manager_required
+@group_is_owner(Room, lookup_field='pk', group_field='group')
+def room_detail(request, pk):
+    room = get_object_or_404(Room, pk=pk)
+    group = request.user.group
 
-    average_arrive_daies = calc_average_days(filtered_section_cases, 'discharge_date', 'delivery_date')
-    average_stay_daies = calc_average_days(filtered_section_cases, 'admission_date', 'discharge_date')
+    start = request.GET.get("start")
+    end = request.GET.get("end")
+    if not (start and end):
+        start = end = None
 
-    # درصد نقص
-    percent_defect_cases = (
-        (len(filtered_defect_cases) * 100) // len(filtered_all_defect_cases)
-        if filtered_all_defect_cases else '0'
-    )
+    # آمار اتاق از جدول محوری (اتاق × پزشک × نوع عمل)
+    data = room_analysis(group, [room], start, end)[room.id]
+    filtered_room_cases = room_cases_in_range(group, [room], start, end).select_related(
+        'patient', 'room', 'doctor'
+    ).order_by('id')
 
-    # پراکندگی نقص
-    defect_sheet_fields = ['defect_sheet'] + [f'defect_sheet{i}' for i in range(2, 11)]
-    defect_type_fields = ['defect_type'] + [f'defect_type{i}' for i in range(2, 11)]
+    # بدون بازه زمانی، تعداد پزشکان از پزشکان متصل به اتاق شمرده میشه
+    doctors_count = data['doctors_count'] if start else data['linked_doctors_count']
 
-    defect_counts = {
-        name: sum([
-            1 for sc in section_cases
-            if any(getattr(sc, field) == code for field in defect_sheet_fields)
-        ]) for code, name in defect_sheet_choices
-    }
+    # Pagination helper
+    def paginate(request, objects_list, per_page=100, name='page'):
+        paginator = Paginator(objects_list, per_page)
+        page_number = request.GET.get(name)
+        return paginator.get_page(page_number)
 
-    defect_type_counts = {
-        name: sum([
-            1 for sc in section_cases
-            if any(
-                getattr(sc, field) and code in getattr(sc, field)
-                for field in defect_type_fields
-            )
-        ]) for code, name in defect_type_choices
+    context = {
+        'room': room,
+        'doctors_count': doctors_count,
+        'patients_count': data['patients_count'],
+        'filtered_room_cases': paginate(request, filtered_room_cases, name='rc'),
+        'filtered_room_cases_count': data['filtered_room_cases_count'],
+        'filtered_big_room_cases_count': data['filtered_big_room_cases_count'],
+        'filtered_medium_room_cases_count': data['filtered_medium_room_cases_count'],
+        'filtered_small_room_cases_count': data['filtered_small_room_cases_count'],
+        'doctor_cases': data['doctor_cases'],
     }
 
-    # آمار فوت‌شدگان
-    age_counts = {'less_20': 0, 'more_20_less_40': 0, 'more_40_less_60': 0, 'more_60_less_80': 0, 'more_80': 0}
-    gender_counts = {'men': 0, 'women': 0}
-
-    for case in filtered_dc_section_cases:
-        age = int(''.join(filter(str.isdigit, case.age or '0')))
-        gender = case.gender
+    return render(request, 'room_detail.html', context)
 
-        if age < 20:
-            age_counts['less_20'] += 1
-        elif age < 40:
-            age_counts['more_20_less_40'] += 1
-        elif age < 60:
-            age_counts['more_40_less_60'] += 1
-        elif age < 80:
-            age_counts['more_60_less_80'] += 1
-        else:
-            age_counts['more_80'] += 1
+@login_required
+@manager_required
+@group_is_owner(Doctor, lookup_field='pk', group_field='group')
+def doctor_detail(request, pk):
+    # پوسته سبک صفحه؛ کارت ها، نمودار ها و جدول ها هر کدوم از endpoint خودشون گرفته میشن
+    doctor = get_object_or_404(Doctor, pk=pk)
+    return render(request, 'doctor_detail.html', {'doctor': doctor})
 
-        if gender == '1':
-            gender_counts['men'] += 1
-        else:
-            gender_counts['women'] += 1
-    
-    # Pagination helper
-    def paginate(request, objects_list, per_page=100, name='page'):
-        paginator = Paginator(objects_list, per_page)
-        page_number = request.GET.get(name)
-        return paginator.get_page(page_number)
+@login_required
+@manager_required
+@group_is_owner(Doctor, lookup_field='pk', group_field='group')
+@fragment
+async def doctor_stats(request, pk):
+    doctor = await aget_object_or_404(Doctor, pk=pk)
+    group = request.user.group
+    key = stats_fragment_key(request, 'doctor_stats', doctor)
+    html = await sync_to_async(cached_fragment)('doctor_stats', key)
+    if html is not None:
+        return HttpResponse(html)
+
+    start, end = detail_range(request)
+
+    tabs = detail_tabs(group, doctor=doctor, start=start, end=end)
+    room_cases = room_cases_in_range(group, start=start, end=end).filter(doctor=doctor)
+
+    results = await concurrency.gather(
+        counts=lambda: tab_counts(tabs),
+        all_defect_cases_count=lambda: detail_tabs(group, start=start, end=end)['defc'].order_by().count(),
+        room_counts=lambda: room_cases.order_by().aggregate(
+            total=Count('id'),
+            **{f'type_{code}': Count('id', filter=Q(operation_type=code)) for code in ('1', '2', '3')},
+        ),
+        section_patients=lambda: set(tabs['sc'].order_by().values_list('patient', flat=True)),
+        room_patients=lambda: set(room_cases.order_by().values_list('patient', flat=True)),
+        averages=lambda: stay_averages(tabs['sc']),
+    )
+    counts = results['counts']
+    all_defect_cases_count = results['all_defect_cases_count']
+    room_counts = results['room_counts']
+    patients_count = len(results['section_patients'] | results['room_patients'])
+    average_arrive_daies, average_stay_daies = results['averages']
+
+    # درصد نقص
+    percent_defect_cases = (
+        (counts['defc'] * 100) // all_defect_cases_count
+        if all_defect_cases_count else '0'
+    )
 
     context = {
         'doctor': doctor,
         'patients_count': patients_count,
-        'filtered_section_cases': paginate(request, section_cases, name='sc_page'),
-        'filtered_dc_section_cases': paginate(request, dc_section_cases, name='dc_page'),
-        'filtered_not_arrived_cases': paginate(request, not_arrived_cases, name='nc_page'),
-        'filtered_defect_cases': paginate(request, defect_cases, name='defc_page'),
-        'filtered_dc_section_cases_count': len(filtered_dc_section_cases),
-        'filtered_section_cases_count': len(filtered_section_cases),
-        'filtered_not_arrived_cases_count': len(filtered_not_arrived_cases),
-        'filtered_defect_cases_count': len(filtered_defect_cases),
-        'filtered_social_security_cases_count': len(filtered_social_security_cases),
-        'filtered_medical_services_cases_count': len(filtered_medical_services_cases),
-        'filtered_armed_forces_cases_count': len(filtered_armed_forces_cases),
-        'filtered_free_cases_count': len(filtered_free_cases),
-        'filtered_room_cases_count': len(filtered_room_cases),
-        'filtered_big_room_cases_count': len(filtered_big_room_cases),
-        'filtered_medium_room_cases_count': len(filtered_medium_room_cases),
-        'filtered_small_room_cases_count': len(filtered_small_room_cases),
+        'filtered_dc_section_cases_count': counts['dc'],
+        'filtered_section_cases_count': counts['sc'],
+        'filtered_not_arrived_cases_count': counts['nc'],
+        'filtered_defect_cases_count': counts['defc'],
+        **{f'filtered_{key}_cases_count': counts[key] for key in INSURANCES},
+        'filtered_room_cases_count': room_counts['total'],
+        'filtered_big_room_cases_count': room_counts['type_3'],
+        'filtered_medium_room_cases_count': room_counts['type_2'],
+        'filtered_small_room_cases_count': room_counts['type_1'],
         'average_arrive_daies': average_arrive_daies,
         'average_stay_daies': average_stay_daies,
+        'percent_defect_cases': percent_defect_cases,
+    }
+    return await sync_to_async(render_fragment)(request, key, 'doctor_stats.html', context)
+
+@login_required
+@manager_required
+@group_is_owner(Doctor, lookup_field='pk', group_field='group')
+@fragment
+def doctor_charts(request, pk):
+    doctor = get_object_or_404(Doctor, pk=pk)
+    group = request.user.group
+    start, end = detail_range(request)
+
+    data = group_cache.get_or_set(
+        group, 'doctor_charts', lambda: doctor_chart_data(group, doctor, start, end),
+        params={'start': start, 'end': end}, parts=[doctor.pk], timeout=settings.FRAGMENT_CACHE_TIMEOUT,
+    )
+    return JsonResponse(data)
+
+def doctor_chart_data(group, doctor, start, end):
+    tabs = detail_tabs(group, doctor=doctor, start=start, end=end)
+
+    # پراکندگی نقص و آمار فوت‌شدگان
+    defect_counts, defect_type_counts = defect_distribution(tabs['sc'])
+    age_counts, gender_counts = death_demographics(tabs['dc'])
+
+    return {
         'defect_counts': defect_counts,
         'defect_type_counts': defect_type_counts,
-        'percent_defect_cases': percent_defect_cases,
         'age_counts': age_counts,
         'gender_counts': gender_counts,
     }
 
-    return render(request, 'doctor_detail.html', context)
+@login_required
+@manager_required
+@group_is_owner(Doctor, lookup_field='pk', group_field='group')
+@fragment
+def doctor_tab(request, pk, tab):
+    doctor = get_object_or_404(Doctor, pk=pk)
+    start, end = detail_range(request)
+    tabs = detail_tabs(request.user.group, doctor=doctor, start=start, end=end)
+    return render_tab(request, tabs, tab)
 
 @login_required
 @manager_required
 @group_is_owner(Patient, lookup_field='pk', group_field='group')
 def patient_detail(request, pk):
-    patient = get_object_or_404(Patient, pk=pk)
-    section_cases = SectionCase.objects.filter(group=request.user.group, patient=patient)
-    room_cases = RoomCase.objects.filter(group=request.user.group, patient=patient)
-    dc_cases = DC.objects.filter(group=request.user.group, patient=patient)
-    doctors = []
-
-    for section_case in section_cases:
-        doctor = section_case.doctor
-        if doctor in doctors:
-            pass
-        else:
-            doctors.append(doctor)
-    
-    for room_case in room_cases:
-        doctor = room_case.doctor
-        if doctor in doctors:
-            pass
-        else:
-            doctors.append(doctor)
-    
-    for dc_case in dc_cases:
-        doctor = dc_case.doctor
-        if doctor in doctors:
-            pass
-        else:
-            doctors.append(doctor)
+    patient = get_object_or_404(Patient.objects.prefetch_related('sections', 'rooms'), pk=pk)
+    timeline = patient_timeline(request.user.group, patient)
 
     context = {
         'patient': patient,
-        'section_cases': section_cases,
-        'room_cases': room_cases,
-        'dc_cases': dc_cases,
-        'doctors': doctors,
+        'section_cases': timeline['section_cases'],
+        'room_cases': timeline['room_cases'],
+        'dc_cases': timeline['dc_cases'],
+        'events': timeline['events'],
+        'doctors': timeline['doctors'],
     }
 
     return render(request, 'patient_detail.html', context=context)
 
+TIMELINE_URLS = {
+    'admission': 'section_case_detail',
+    'operation': 'room_case_detail',
+    'death': 'dc_detail',
+}
+
 @login_required
 @manager_required
-def dc_all_detail(request):
-    dc_cases = DC.objects.filter(group=request.user.group)
-    dc_doctors = []
-    dc_patients = []
+@group_is_owner(Patient, lookup_field='pk', group_field='group')
+def patient_timeline_view(request, pk):
+    patient = get_object_or_404(Patient, pk=pk)
+    timeline = patient_timeline(request.user.group, patient)
+
+    events = []
+    for event in timeline['events']:
+        case = event['case']
+        events.append({
+            'kind': event['kind'],
+            'date': event['jalali_date'],
+            'number': case.number,
+            'doctor': case.doctor.full_name,
+            'place': event['place'].name,
+            'url': reverse(TIMELINE_URLS[event['kind']], args=[case.pk]),
+        })
+    return JsonResponse({'events': events, 'doctors': timeline['doctors']})
 
-    def to_gregorian(date_str):
-        try:
-            return Persian(date_str).gregorian_datetime()
-        except:
-            return None
-    
-    def filter_by_date(queryset, date_field):
-        result = []
-        for obj in queryset:
-            date_value = getattr(obj, date_field)
-            if isinstance(date_value, str):
-                case_date = to_gregorian(date_value)
-                if case_date and start <= case_date <= end:
-                    result.append(obj)
-        return result
+@login_required
+@manager_required
+async def dc_all_detail(request):
+    group = request.user.group
+    dc_cases = DC.objects.filter(group=group)
 
-    if request.GET.get("start") and request.GET.get("end"):
-        try:
-            start = to_gregorian(request.GET["start"])
-            end = to_gregorian(request.GET["end"])
+    # بازه روی تاریخ پذیرش (ستون میلادی ایندکس دار)
+    start, end = request.GET.get("start"), request.GET.get("end")
+    start_date, end_date = date_range(start, end)
+    if start_date and end_date:
+        dc_cases = dc_cases.filter(admission__range=(start_date, end_date))
 
-            if start and end and start > end:
-                start, end = end, start
-            
-            dc_cases = filter_by_date(dc_cases, 'admission_date')
+    if use_frames():
+        stats = await sync_to_async(lambda: frames.dc_metrics(frames.load_frames(group), start, end))()
+    else:
+        # شمارش ها، میانگین ها و آمار فوت‌شدگان مستقل از هم و همزمان
+        results = await concurrency.gather(
+            dc_cases_count=dc_cases.order_by().count,
+            doctor_ids=lambda: set(dc_cases.order_by().values_list('doctor', flat=True)),
+            patient_ids=lambda: set(dc_cases.order_by().values_list('patient', flat=True)),
+            averages=lambda: death_averages(dc_cases),
+            demographics=lambda: death_demographics(dc_cases),
+        )
+        average_arrive_daies, average_stay_daies = results['averages']
+        age_counts, gender_counts = results['demographics']
+        stats = {
+            'dc_cases_count': results['dc_cases_count'],
+            'dc_doctors_count': len(results['doctor_ids']),
+            'dc_patients_count': len(results['patient_ids']),
+            'average_arrive_daies': average_arrive_daies,
+            'average_stay_daies': average_stay_daies,
+            'age_counts': age_counts,
+            'gender_counts': gender_counts,
+        }
 
-        except:
-            pass
+    paginator = Paginator(dc_cases.select_related('doctor', 'hospitalization_section', 'patient').order_by('id'), 100)
+    context = {
+        'filtered_dc_section_cases': await sync_to_async(paginator.get_page)(request.GET.get('dc_page')),
+        **stats,
+    }
 
-    def calc_average_days(cases, start_field, end_field):
-        days = []
-        for case in cases:
-            start_date = getattr(case, start_field)
-            end_date = getattr(case, end_field)
-            if isinstance(start_date, str) and isinstance(end_date, str):
-                start_dt = to_gregorian(start_date)
-                end_dt = to_gregorian(end_date)
-                if start_dt and end_dt:
-                    days.append((end_dt - start_dt).days)
-        return round(sum(days) / len(days), 0) if days else '0'
+    return await sync_to_async(render)(request, 'dc_all_detail.html', context)
 
-    for dc_case in dc_cases:
-        dc_doctor = dc_case.doctor
-        dc_patient = dc_case.patient
+# توزیع مدت اقامت و تاخیر تحویل پرونده ها به صورت JSON برای نمودار ها
+def distribution_response(request, **filters):
+    start = request.GET.get("start")
+    end = request.GET.get("end")
+    if not (start and end):
+        start = end = None
 
-        if dc_doctor not in dc_doctors:
-            dc_doctors.append(dc_doctor)
+    data = frames.day_distributions(
+        frames.load_frames(request.user.group),
+        kind=request.GET.get("kind", "section"),
+        start=start,
+        end=end,
+        **filters,
+    )
+    return JsonResponse(data)
 
-        if dc_patient not in dc_patients:
-            dc_patients.append(dc_patient)
+@login_required
+@manager_required
+@group_is_owner(Section, lookup_field='pk', group_field='group')
+def section_distribution(request, pk):
+    section = get_object_or_404(Section, pk=pk)
+    return distribution_response(request, section=section.id)
 
-    average_arrive_daies = calc_average_days(dc_cases, 'death_date', 'delivery_date')
-    average_stay_daies = calc_average_days(dc_cases, 'admission_date', 'death_date')
+@login_required
+@manager_required
+@group_is_owner(Doctor, lookup_field='pk', group_field='group')
+def doctor_distribution(request, pk):
+    doctor = get_object_or_404(Doctor, pk=pk)
+    return distribution_response(request, doctor=doctor.id)
 
-    # آمار فوت‌شدگان
-    age_counts = {'less_20': 0, 'more_20_less_40': 0, 'more_40_less_60': 0, 'more_60_less_80': 0, 'more_80': 0}
-    gender_counts = {'men': 0, 'women': 0}
+@login_required
+@manager_required
+def group_distribution(request):
+    return distribution_response(request)
 
-    for case in dc_cases:
-        age = int(''.join(filter(str.isdigit, case.age or '0')))
-        gender = case.gender
+def group_object_or_404(model, group, pk):
+    # شناسه از پارامتر GET میاد؛ مقدار غیر عددی مثل شناسه گروه دیگه 404 میگیره، نه خطای 500
+    if not str(pk).isdigit():
+        raise Http404
+    return get_object_or_404(model, pk=pk, group=group)
 
-        if age < 20:
-            age_counts['less_20'] += 1
-        elif age < 40:
-            age_counts['more_20_less_40'] += 1
-        elif age < 60:
-            age_counts['more_40_less_60'] += 1
-        elif age < 80:
-            age_counts['more_60_less_80'] += 1
-        else:
-            age_counts['more_80'] += 1
+@login_required
+@manager_required
+def leaderboard(request):
+    group = request.user.group
 
-        if gender == '1':
-            gender_counts['men'] += 1
-        else:
-            gender_counts['women'] += 1
-    
-    # Pagination helper
-    def paginate(request, objects_list, per_page=100, name='page'):
-        paginator = Paginator(objects_list, per_page)
-        page_number = request.GET.get(name)
-        return paginator.get_page(page_number)
+    start = request.GET.get("start")
+    end = request.GET.get("end")
+    if not (start and end):
+        start = end = None
 
-    context = {
-        'filtered_dc_section_cases': paginate(request, dc_cases, name='sc_page'),
-        'dc_cases_count': len(dc_cases),
-        'dc_doctors_count': len(dc_doctors),
-        'dc_patients_count': len(dc_patients),
-        'average_arrive_daies': average_arrive_daies,
-        'average_stay_daies': average_stay_daies,
-        'age_counts': age_counts,
-        'gender_counts': gender_counts,
-    }
+    room = request.GET.get("room")
+    room = group_object_or_404(Room, group, room) if room else None
+    cases = room_cases_in_range(group, [room] if room else None, start, end)
+
+    # جراحان یک بخش: پزشکانی که به اون بخش متصل هستن
+    section = request.GET.get("section")
+    if section:
+        section = group_object_or_404(Section, group, section)
+        cases = cases.filter(doctor__sections=section)
+
+    try:
+        limit = min(max(int(request.GET.get("limit", 10)), 1), 100)
+    except ValueError:
+        limit = 10
+
+    return JsonResponse(surgeon_leaderboards(cases, limit=limit))
+
+TREND_CACHE_TIMEOUT = 60 * 60
 
-    return render(request, 'dc_all_detail.html', context)
+@login_required
+@manager_required
+def trend(request):
+    group = request.user.group
+    filters = {}
+    for name, model in (('section', Section), ('room', Room), ('doctor', Doctor)):
+        value = request.GET.get(name)
+        if value:
+            filters[name] = group_object_or_404(model, group, value).id
+
+    start = request.GET.get("start")
+    end = request.GET.get("end")
+    if not (start and end):
+        start = end = None
+
+    # نسخه داده گروه جزو کلید کش هست، پس بعد از هر ورود یا ویرایش، کش قبلی خودبخود کنار میره
+    data = group_cache.get_or_set(
+        group, 'trend', lambda: monthly_trend(group, start=start, end=end, **filters),
+        params={**filters, 'start': start, 'end': end}, timeout=TREND_CACHE_TIMEOUT,
+    )
+    return JsonResponse(data)
+
+AUTOCOMPLETE_MODELS = {
+    'patient': (Patient, 'full_name'),
+    'doctor': (Doctor, 'full_name'),
+    'section': (Section, 'name'),
+    'room': (Room, 'name'),
+}
+AUTOCOMPLETE_CACHE_TIMEOUT = 30
+
+@login_required
+def autocomplete(request, kind):
+    if kind not in AUTOCOMPLETE_MODELS:
+        raise Http404
+    # لیست بیماران فقط برای مسئول باز میشه، پس نام بیماران هم همینطور
+    if kind == 'patient' and not request.user.is_manager:
+        raise PermissionDenied("دسترسی فقط برای مسئول درمانگاه مجاز است.")
+    model, field = AUTOCOMPLETE_MODELS[kind]
+    group = request.user.group
+    if group is None:
+        return JsonResponse({'results': []})
+    query = search.normalize(request.GET.get("q", ""))
+    try:
+        limit = min(max(int(request.GET.get("limit", 10)), 1), 50)
+    except ValueError:
+        limit = 10
+
+    def compute():
+        if query:
+            ids = search.ranked_ids(group, kind, query, limit)
+            names = dict(model.objects.filter(pk__in=ids).values_list('pk', field))
+            return [{'id': pk, 'text': names[pk]} for pk in ids if pk in names]
+        rows = model.objects.filter(group=group).order_by('id').values_list('pk', field)[:limit]
+        return [{'id': pk, 'text': text} for pk, text in rows]
+
+    results = group_cache.get_or_set(
+        group, 'autocomplete', compute,
+        params={'q': query, 'limit': limit}, parts=[kind], timeout=AUTOCOMPLETE_CACHE_TIMEOUT,
+    )
+
+    response = JsonResponse({'results': results})
+    patch_cache_control(response, private=True, max_age=AUTOCOMPLETE_CACHE_TIMEOUT)
+    return response
+
+def metrics_view(request):
+    # برای Prometheus: با توکن METRICS_TOKEN در هدر Authorization، یا برای کاربر staff
+    token = settings.METRICS_TOKEN
+    authorization = request.headers.get('Authorization', '')
+    allowed = bool(token) and hmac.compare_digest(authorization, f'Bearer {token}')
+    if not allowed and not request.user.is_staff:
+        raise PermissionDenied("دسترسی به متریک ها مجاز نیست.")
+    response = HttpResponse(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+    patch_cache_control(response, no_store=True)
+    return response
+
+def selected_choices(model, group, value):
+    # فیلتر ها دیگه همه گزینه ها رو رندر نمیکنن؛ فقط گزینه انتخاب شده، بقیه با autocomplete گرفته میشن
+    if value and str(value).isdigit():
+        return model.objects.filter(group=group, pk=value)
+    return model.objects.none()
 
 class SectionListView(LoginRequiredMixin, ManagerRequiredMixin, ListView):
     model = Section
@@ -1288,14 +1297,14 @@ class SectionListView(LoginRequiredMixin, ManagerRequiredMixin, ListView):
 
     def get_queryset(self):
         user_group = self.request.user.group
-        queryset = super().get_queryset().filter(group=user_group).distinct()
+        queryset = super().get_queryset().filter(group=user_group).prefetch_related('expertises').distinct()
 
         search_query = self.request.GET.get('q')
         id = self.request.GET.get('id')
         expertise_filter = self.request.GET.getlist('expertise')
 
         if search_query:
-            queryset = queryset.filter(Q(name__icontains=search_query))
+            queryset = queryset.filter(pk__in=search.matching_ids(user_group, 'section', search_query))
         if id:
             queryset = queryset.filter(id=id)
         if expertise_filter:
@@ -1309,7 +1318,7 @@ class SectionListView(LoginRequiredMixin, ManagerRequiredMixin, ListView):
         context['selected_expertises'] = [int(e) for e in self.request.GET.getlist('expertise')]
         return context
 
-class SectionCreateView(LoginRequiredMixin, ManagerRequiredMixin, CreateView):
+class SectionCreateView(LoginRequiredMixin, ManagerRequiredMixin, DataVersionMixin, CreateView):
     model = Section
     form_class = SectionForm
     template_name = 'section_create.html'
@@ -1326,7 +1335,7 @@ class SectionCreateView(LoginRequiredMixin, ManagerRequiredMixin, CreateView):
         form.instance.group = self.request.user.group
         return super().form_valid(form)
 
-class SectionUpdateView(LoginRequiredMixin, ManagerRequiredMixin, UserIsOwnerMixin, UpdateView):
+class SectionUpdateView(LoginRequiredMixin, ManagerRequiredMixin, UserIsOwnerMixin, DataVersionMixin, UpdateView):
     model = Section
     form_class = SectionForm
     template_name = 'section_update.html'
@@ -1340,7 +1349,7 @@ class SectionUpdateView(LoginRequiredMixin, ManagerRequiredMixin, UserIsOwnerMix
 
         return context
 
-class SectionDeleteView(LoginRequiredMixin, ManagerRequiredMixin, UserIsOwnerMixin, DeleteView):
+class SectionDeleteView(LoginRequiredMixin, ManagerRequiredMixin, UserIsOwnerMixin, DataVersionMixin, DeleteView):
     model = Section
     template_name = 'section_confirm_delete.html'
     success_url = reverse_lazy('section_list')
@@ -1354,13 +1363,13 @@ class RoomListView(LoginRequiredMixin, ManagerRequiredMixin, ListView):
 
     def get_queryset(self):
         user_group = self.request.user.group
-        queryset = super().get_queryset().filter(group=user_group).distinct()
+        queryset = super().get_queryset().filter(group=user_group).prefetch_related('expertises').distinct()
         search_query = self.request.GET.get('q')
         id = self.request.GET.get('id')
         expertise_filter = self.request.GET.getlist('expertise')
 
         if search_query:
-            queryset = queryset.filter(Q(name__icontains=search_query))
+            queryset = queryset.filter(pk__in=search.matching_ids(user_group, 'room', search_query))
         if id:
             queryset = queryset.filter(id=id)
         if expertise_filter:
@@ -1374,7 +1383,7 @@ class RoomListView(LoginRequiredMixin, ManagerRequiredMixin, ListView):
         context['selected_expertises'] = [int(e) for e in self.request.GET.getlist('expertise')]
         return context
 
-class RoomCreateView(LoginRequiredMixin, ManagerRequiredMixin, CreateView):
+class RoomCreateView(LoginRequiredMixin, ManagerRequiredMixin, DataVersionMixin, CreateView):
     model = Room
     form_class = RoomForm
     template_name = 'room_create.html'
@@ -1391,7 +1400,7 @@ class RoomCreateView(LoginRequiredMixin, ManagerRequiredMixin, CreateView):
         form.instance.group = self.request.user.group
         return super().form_valid(form)
 
-class RoomUpdateView(LoginRequiredMixin, ManagerRequiredMixin, UserIsOwnerMixin, UpdateView):
+class RoomUpdateView(LoginRequiredMixin, ManagerRequiredMixin, UserIsOwnerMixin, DataVersionMixin, UpdateView):
     model = Room
     form_class = RoomForm
     template_name = 'room_update.html'
@@ -1404,7 +1413,7 @@ class RoomUpdateView(LoginRequiredMixin, ManagerRequiredMixin, UserIsOwnerMixin,
         context['expertise_list'] = Expertise.objects.filter(group=self.request.user.group)
         return context
 
-class RoomDeleteView(LoginRequiredMixin, ManagerRequiredMixin, UserIsOwnerMixin, DeleteView):
+class RoomDeleteView(LoginRequiredMixin, ManagerRequiredMixin, UserIsOwnerMixin, DataVersionMixin, DeleteView):
     model = Room
     template_name = 'room_confirm_delete.html'
     success_url = reverse_lazy('room_list')
@@ -1455,13 +1464,13 @@ class DoctorListView(LoginRequiredMixin, ManagerRequiredMixin, ListView):
 
     def get_queryset(self):
         user_group = self.request.user.group
-        queryset = super().get_queryset().filter(group=user_group).distinct()
+        queryset = super().get_queryset().filter(group=user_group).prefetch_related('expertises').distinct()
         search_query = self.request.GET.get('q')
         personnel_code = self.request.GET.get('personnel_code')
         expertise_filter = self.request.GET.getlist('expertise')
 
         if search_query:
-            queryset = queryset.filter(Q(full_name__icontains=search_query))
+            queryset = queryset.filter(pk__in=search.matching_ids(user_group, 'doctor', search_query))
         if personnel_code:
             queryset = queryset.filter(personnel_code=personnel_code)
         if expertise_filter:
@@ -1475,7 +1484,7 @@ class DoctorListView(LoginRequiredMixin, ManagerRequiredMixin, ListView):
         context['selected_expertises'] = [int(e) for e in self.request.GET.getlist('expertise')]
         return context
 
-class DoctorCreateView(LoginRequiredMixin, ManagerRequiredMixin, CreateView):
+class DoctorCreateView(LoginRequiredMixin, ManagerRequiredMixin, DataVersionMixin, CreateView):
     model = Doctor
     form_class = DoctorForm
     template_name = 'doctor_create.html'
@@ -1494,7 +1503,7 @@ class DoctorCreateView(LoginRequiredMixin, ManagerRequiredMixin, CreateView):
         form.instance.group = self.request.user.group
         return super().form_valid(form)
 
-class DoctorUpdateView(LoginRequiredMixin, ManagerRequiredMixin, UserIsOwnerMixin, UpdateView):
+class DoctorUpdateView(LoginRequiredMixin, ManagerRequiredMixin, UserIsOwnerMixin, DataVersionMixin, UpdateView):
     model = Doctor
     form_class = DoctorForm
     template_name = 'doctor_update.html'
@@ -1509,12 +1518,12 @@ class DoctorUpdateView(LoginRequiredMixin, ManagerRequiredMixin, UserIsOwnerMixi
         context['expertise_list'] = Expertise.objects.filter(group=self.request.user.group)
         return context
 
-class DoctorDeleteView(LoginRequiredMixin, ManagerRequiredMixin, UserIsOwnerMixin, DeleteView):
+class DoctorDeleteView(LoginRequiredMixin, ManagerRequiredMixin, UserIsOwnerMixin, DataVersionMixin, DeleteView):
     model = Doctor
     template_name = 'doctor_confirm_delete.html'
     success_url = reverse_lazy('doctor_list')
 
-class PatientListView(LoginRequiredMixin, ManagerRequiredMixin, ListView):
+class PatientListView(LoginRequiredMixin, ManagerRequiredMixin, KeysetPaginationMixin, ListView):
     model = Patient
     template_name = 'patient_list.html'
     context_object_name = 'patients'
@@ -1523,17 +1532,18 @@ class PatientListView(LoginRequiredMixin, ManagerRequiredMixin, ListView):
 
     def get_queryset(self):
         user_group = self.request.user.group
-        queryset = super().get_queryset().filter(group=user_group).distinct()
+        queryset = super().get_queryset().filter(group=user_group).prefetch_related('sections', 'rooms')
         search_query = self.request.GET.get('q')
         section_filter = self.request.GET.get('section')
         room_filter = self.request.GET.get('room')
 
         if search_query:
-            queryset = queryset.filter(Q(full_name__icontains=search_query))
+            queryset = queryset.filter(pk__in=search.matching_ids(user_group, 'patient', search_query))
+        # distinct فقط وقتی لازمه که join روی جدول های چند به چند ردیف تکراری بسازه
         if section_filter:
-            queryset = queryset.filter(sections__in=section_filter)
+            queryset = queryset.filter(sections__in=section_filter).distinct()
         if room_filter:
-            queryset = queryset.filter(rooms__in=room_filter)
+            queryset = queryset.filter(rooms__in=room_filter).distinct()
         
         return queryset
 
@@ -1541,18 +1551,25 @@ class PatientListView(LoginRequiredMixin, ManagerRequiredMixin, ListView):
         context = super().get_context_data(**kwargs)
         selected_section = self.request.GET.get('section')
         selected_room = self.request.GET.get('room')
-        context['section_list'] = Section.objects.filter(group=self.request.user.group)
-        context['room_list'] = Room.objects.filter(group=self.request.user.group)
+        context['section_list'] = selected_choices(Section, self.request.user.group, selected_section)
+        context['room_list'] = selected_choices(Room, self.request.user.group, selected_room)
         context['selected_section'] = int(selected_section) if selected_section and selected_section.isdigit() else None
         context['selected_room'] = int(selected_room) if selected_room and selected_room.isdigit() else None
         return context
 
-class PatientDeleteView(LoginRequiredMixin, ManagerRequiredMixin, UserIsOwnerMixin ,DeleteView):
+class PatientDeleteView(LoginRequiredMixin, ManagerRequiredMixin, UserIsOwnerMixin, DataVersionMixin, DeleteView):
     model = Patient
     template_name = 'patient_confirm_delete.html'
     success_url = reverse_lazy('patient_list')
 
-class SectionCaseListView(LoginRequiredMixin, ListView):
+def filter_by_jalali_date(queryset, raw_field, date_field, value):
+    # تاریخ وارد شده ممکنه با صفر (1402/01/05) یا بدون صفر (1402/1/5) باشه، پس روی ستون میلادی مقایسه میشه
+    date = to_gregorian(value)
+    if date:
+        return queryset.filter(**{date_field: date})
+    return queryset.filter(**{raw_field: value})
+
+class SectionCaseListView(LoginRequiredMixin, KeysetPaginationMixin, ListView):
     model = SectionCase
     template_name = 'section_case_list.html'
     context_object_name = 'section_cases'
@@ -1561,7 +1578,7 @@ class SectionCaseListView(LoginRequiredMixin, ListView):
 
     def get_queryset(self):
         user_group = self.request.user.group
-        queryset = super().get_queryset().filter(group=user_group).distinct()
+        queryset = super().get_queryset().filter(group=user_group).select_related('doctor', 'section')
         start = self.request.GET.get('start')
         end = self.request.GET.get('end')
         number = self.request.GET.get('number')
@@ -1570,28 +1587,17 @@ class SectionCaseListView(LoginRequiredMixin, ListView):
         search_query_section = self.request.GET.get('section')
         search_query_patient = self.request.GET.get('patient')
 
-        if start and end:
-            start = Persian(start).gregorian_datetime()
-            end = Persian(end).gregorian_datetime()
-
-            filtered_queryset = []
-            for section_case in queryset:
-                if isinstance(section_case.admission_date, str):
-                    try:
-                        case_date = Persian(section_case.admission_date).gregorian_datetime()
-                        if start <= case_date <= end:
-                            filtered_queryset.append(section_case)
-                    except:
-                        continue
-
-            queryset = filtered_queryset
+        # فیلتر بازه و تاریخ روی ستون میلادی ایندکس دار انجام میشه و کوئری تا صفحه بندی lazy میمونه
+        start_date, end_date = date_range(start, end)
+        if start_date and end_date:
+            queryset = queryset.filter(admission__range=(start_date, end_date))
         if number:
-            queryset = queryset.filter(Q(number__icontains=number))
+            queryset = queryset.filter(pk__in=search.matching_ids(user_group, 'section_case', number))
         if search_query_admission_date:
-            queryset = queryset.filter(admission_date=search_query_admission_date)
-        if search_query_doctor:
+            queryset = filter_by_jalali_date(queryset, 'admission_date', 'admission', search_query_admission_date)
+        if search_query_doctor and search_query_doctor.isdigit():
             queryset = queryset.filter(doctor=search_query_doctor)
-        if search_query_section:
+        if search_query_section and search_query_section.isdigit():
             queryset = queryset.filter(section=search_query_section)
         if search_query_patient:
             queryset = queryset.filter(patient__full_name=search_query_patient)
@@ -1602,8 +1608,8 @@ class SectionCaseListView(LoginRequiredMixin, ListView):
         context = super().get_context_data(**kwargs)
         selected_section = self.request.GET.get('section')
         selected_doctor = self.request.GET.get('doctor')
-        context['section_list'] = Section.objects.filter(group=self.request.user.group)
-        context['doctor_list'] = Doctor.objects.filter(group=self.request.user.group)
+        context['section_list'] = selected_choices(Section, self.request.user.group, selected_section)
+        context['doctor_list'] = selected_choices(Doctor, self.request.user.group, selected_doctor)
         context['selected_section'] = int(selected_section) if selected_section and selected_section.isdigit() else None
         context['selected_doctor'] = int(selected_doctor) if selected_doctor and selected_doctor.isdigit() else None
         return context
@@ -1644,7 +1650,7 @@ def section_case_detail(request, pk):
 
     return render(request, 'section_case_detail.html', context=context)
 
-class SectionCaseUpdateView(LoginRequiredMixin, ManagerRequiredMixin, UserIsOwnerMixin, UpdateView):
+class SectionCaseUpdateView(LoginRequiredMixin, ManagerRequiredMixin, UserIsOwnerMixin, DataVersionMixin, UpdateView):
     model = SectionCase
     form_class = SectionCaseForm
     template_name = 'section_case_update.html'
@@ -1658,12 +1664,12 @@ class SectionCaseUpdateView(LoginRequiredMixin, ManagerRequiredMixin, UserIsOwne
         context['defect_type_choices'] = defect_type_choices
         return context
 
-class SectionCaseDeleteView(LoginRequiredMixin, ManagerRequiredMixin, UserIsOwnerMixin, DeleteView):
+class SectionCaseDeleteView(LoginRequiredMixin, ManagerRequiredMixin, UserIsOwnerMixin, DataVersionMixin, DeleteView):
     model = SectionCase
     template_name = 'section_case_confirm_delete.html'
     success_url = reverse_lazy('section_case_list')
 
-class RoomCaseListView(LoginRequiredMixin, ListView):
+class RoomCaseListView(LoginRequiredMixin, KeysetPaginationMixin, ListView):
     model = RoomCase
     template_name = 'room_case_list.html'
     context_object_name = 'room_cases'
@@ -1672,37 +1678,25 @@ class RoomCaseListView(LoginRequiredMixin, ListView):
 
     def get_queryset(self):
         user_group = self.request.user.group
-        queryset = super().get_queryset().filter(group=user_group).distinct()
+        queryset = super().get_queryset().filter(group=user_group).select_related('doctor', 'room')
         start = self.request.GET.get('start')
         end = self.request.GET.get('end')
         number = self.request.GET.get('number')
-        search_query_admission_date = self.request.GET.get('operation_date')
+        search_query_operation_date = self.request.GET.get('operation_date')
         search_query_doctor = self.request.GET.get('doctor')
-        search_query_section = self.request.GET.get('room')
-
-        if start and end:
-            start = Persian(start).gregorian_datetime()
-            end = Persian(end).gregorian_datetime()
-
-            filtered_queryset = []
-            for section_case in queryset:
-                if isinstance(section_case.operation_date, str):
-                    try:
-                        case_date = Persian(section_case.operation_date).gregorian_datetime()
-                        if start <= case_date <= end:
-                            filtered_queryset.append(section_case)
-                    except:
-                        continue
+        search_query_room = self.request.GET.get('room')
 
-            queryset = filtered_queryset
+        start_date, end_date = date_range(start, end)
+        if start_date and end_date:
+            queryset = queryset.filter(operation__range=(start_date, end_date))
         if number:
-            queryset = queryset.filter(Q(number__icontains=number))
-        if search_query_admission_date:
-            queryset = queryset.filter(admission_date=search_query_admission_date)
-        if search_query_doctor:
+            queryset = queryset.filter(pk__in=search.matching_ids(user_group, 'room_case', number))
+        if search_query_operation_date:
+            queryset = filter_by_jalali_date(queryset, 'operation_date', 'operation', search_query_operation_date)
+        if search_query_doctor and search_query_doctor.isdigit():
             queryset = queryset.filter(doctor=search_query_doctor)
-        if search_query_section:
-            queryset = queryset.filter(room=search_query_section)
+        if search_query_room and search_query_room.isdigit():
+            queryset = queryset.filter(room=search_query_room)
         
         return queryset
     
@@ -1710,8 +1704,8 @@ class RoomCaseListView(LoginRequiredMixin, ListView):
         context = super().get_context_data(**kwargs)
         selected_room = self.request.GET.get('room')
         selected_doctor = self.request.GET.get('doctor')
-        context['room_list'] = Room.objects.filter(group=self.request.user.group)
-        context['doctor_list'] = Doctor.objects.filter(group=self.request.user.group)
+        context['room_list'] = selected_choices(Room, self.request.user.group, selected_room)
+        context['doctor_list'] = selected_choices(Doctor, self.request.user.group, selected_doctor)
         context['selected_room'] = int(selected_room) if selected_room and selected_room.isdigit() else None
         context['selected_doctor'] = int(selected_doctor) if selected_doctor and selected_doctor.isdigit() else None
         return context
@@ -1721,12 +1715,12 @@ class RoomCaseDetailView(LoginRequiredMixin, UserIsOwnerMixin, DetailView):
     template_name = 'room_case_detail.html'
     context_object_name = 'room_case'
 
-class RoomCaseDeleteView(LoginRequiredMixin, ManagerRequiredMixin, UserIsOwnerMixin, DeleteView):
+class RoomCaseDeleteView(LoginRequiredMixin, ManagerRequiredMixin, UserIsOwnerMixin, DataVersionMixin, DeleteView):
     model = RoomCase
     template_name = 'room_case_confirm_delete.html'
     success_url = reverse_lazy('room_case_list')
 
-class DCListView(LoginRequiredMixin, ListView):
+class DCListView(LoginRequiredMixin, KeysetPaginationMixin, ListView):
     model = DC
     template_name = 'dc_list.html'
     context_object_name = 'dc_cases'
@@ -1735,7 +1729,7 @@ class DCListView(LoginRequiredMixin, ListView):
 
     def get_queryset(self):
         user_group = self.request.user.group
-        queryset = super().get_queryset().filter(group=user_group).distinct()
+        queryset = super().get_queryset().filter(group=user_group).select_related('doctor', 'hospitalization_section', 'patient')
         return queryset
 
 class DCDetailView(LoginRequiredMixin, UserIsOwnerMixin, DetailView):
@@ -1743,13 +1737,15 @@ class DCDetailView(LoginRequiredMixin, UserIsOwnerMixin, DetailView):
     template_name = 'dc_detail.html'
     context_object_name = 'dc'
 
-class DCDeleteView(LoginRequiredMixin, ManagerRequiredMixin, UserIsOwnerMixin, DeleteView):
+class DCDeleteView(LoginRequiredMixin, ManagerRequiredMixin, UserIsOwnerMixin, DataVersionMixin, DeleteView):
     model = DC
     template_name = 'dc_confirm_delete.html'
     success_url = reverse_lazy('dc_list')
 
 @login_required
 @manager_required
+@metrics.import_job('add_section_case')
+@search.deferred_indexing
 def add_section_case(request):
     if request.method == 'POST':
         form = ExcelForm(request.POST, request.FILES)
@@ -1830,7 +1826,7 @@ def add_section_case(request):
 
             # اتصال بیماران به بخش ها و اتاق های آنها
             for full_name, sheets in patient_data.items():
-                patient, created = Patient.objects.get_or_create(group=request.user.group, full_name=full_name)
+                patient, created = resolve_patient(request.user.group, full_name)
 
                 for sheet in sheets:
                     section = Section.objects.filter(group=request.user.group, name=sheet).first()
@@ -1866,7 +1862,7 @@ def add_section_case(request):
                                 section = Section.objects.filter(group=request.user.group, name=section_name).first()
                                 doctor = Doctor.objects.filter(group=request.user.group, full_name=doctor_name).first()
                                 rep_doctor = Doctor.objects.filter(group=request.user.group, full_name=rep_doctor_name).first()
-                                patient = Patient.objects.filter(group=request.user.group, full_name=patient_name).first()
+                                patient = find_patient(request.user.group, patient_name)
                                 defect_sheet = defect_sheet_map.get(defect_sheet, None)
                                 defect_sheet2 = defect_sheet_map.get(defect_sheet2, None)
                                 defect_type_list = defect_type_raw if isinstance(defect_type_raw, list) else [defect_type_raw]
@@ -1913,6 +1909,7 @@ def add_section_case(request):
                 except Exception as e:
                     print(f" خطا در شیت '{sheet}': {e}")
 
+            request.user.group.bump_data_version()
             return redirect('main')
     else:
         form = ExcelForm()
@@ -1925,6 +1922,8 @@ def add_section_case(request):
 
 @login_required
 @manager_required
+@metrics.import_job('add_room_case')
+@search.deferred_indexing
 def add_room_case(request):
     if request.method == 'POST':
         form = ExcelForm(request.POST, request.FILES)
@@ -2002,7 +2001,7 @@ def add_room_case(request):
 
             # اتصال بیماران به بخش ها و اتاق های آنها
             for full_name, sheets in patient_data.items():
-                patient, created = Patient.objects.get_or_create(group=request.user.group, full_name=full_name)
+                patient, created = resolve_patient(request.user.group, full_name)
 
                 for sheet in sheets:
                     room = Room.objects.filter(group=request.user.group, name=sheet).first()
@@ -2030,7 +2029,7 @@ def add_room_case(request):
                                 doctor_name = str(df.iloc[i, 9]).strip()
                                 anesthesia_type = str(df.iloc[i, 10]).strip()
 
-                                patient = Patient.objects.filter(group=request.user.group, full_name__icontains=patient_name).first()
+                                patient = find_patient(request.user.group, patient_name)
                                 room = Room.objects.filter(group=request.user.group, name=room_name).first()
                                 operation_type = operation_type_dict.get(operation_type, None)
                                 doctor = Doctor.objects.filter(group=request.user.group, full_name=doctor_name).first()
@@ -2053,6 +2052,7 @@ def add_room_case(request):
                 except Exception as e:
                     print(f" خطا در شیت '{sheet}': {e}")
             
+            request.user.group.bump_data_version()
             return redirect('main')
     else:
         form = ExcelForm()
@@ -2065,6 +2065,7 @@ def add_room_case(request):
 
 @login_required
 @manager_required
+@search.deferred_indexing
 def all_delete(request):
     form = ConfirmDeleteForm(request.POST or None)
 
@@ -2077,11 +2078,19 @@ def all_delete(request):
             for model in models:
                 model.objects.filter(group=group).delete()
 
+            group.bump_data_version()
             return redirect('main')
 
     return render(request, 'all_delete_confirm.html', {'form': form})
 
+# انتخاب بک اند تحلیل ها از تنظیمات: 'orm' یا 'pandas'
+def use_frames():
+    return getattr(settings, 'ANALYTICS_BACKEND', 'orm') == 'pandas'
+
 def analyze_section(section, group, start=None, end=None):
+    if use_frames():
+        return frames.section_metrics(frames.load_frames(group), section, start, end)
+
     # اگه start و end وجود دارن، به میلادی تبدیل کن
     try:
         start_date = Persian(start).gregorian_datetime() if start else None
@@ -2109,11 +2118,12 @@ def analyze_section(section, group, start=None, end=None):
         Q(defect_sheet9__isnull=False) | Q(defect_sheet10__isnull=False)
     )
 
-    insurance_filters = {
-        'social_security': Q(insurance__icontains="تامین اجتماعی"),
-        'medical_services': Q(insurance__icontains="خدمات درمانی"),
-        'armed_forces': Q(insurance__icontains="نیرو های مسلح"),
-        'free': Q(insurance__icontains="آزاد"),
+    # بیمه ها از همون پرونده های فیلتر شده شمرده میشن، نه یک کوئری برای هر بیمه
+    insurance_names = {
+        'social_security': "تامین اجتماعی",
+        'medical_services': "خدمات درمانی",
+        'armed_forces': "نیرو های مسلح",
+        'free': "آزاد",
     }
 
     filtered = lambda qs: [obj for obj in qs if in_range(obj.admission_date)] if start_date and end_date else list(qs)
@@ -2124,13 +2134,14 @@ def analyze_section(section, group, start=None, end=None):
     f_defects = filtered(defect_cases)
 
     insurance_counts = {
-        key: len(filtered(all_cases.filter(q)))
-        for key, q in insurance_filters.items()
+        key: sum(1 for c in f_cases if name in (c.insurance or ''))
+        for key, name in insurance_names.items()
     }
 
+    # شمارش با شناسه ها، بدون خوندن پزشک و بیمار هر پرونده
     doctors = section.doctor_sections.all()
-    f_doctors = {c.doctor for c in f_cases if c.doctor}
-    f_patients = {c.patient for c in f_cases if c.patient}
+    f_doctors = {c.doctor_id for c in f_cases if c.doctor_id}
+    f_patients = {c.patient_id for c in f_cases if c.patient_id}
     doctors_count = len(f_doctors)
     patients_count = len(f_patients)
 
@@ -2173,11 +2184,11 @@ def analyze_section(section, group, start=None, end=None):
         ]) for code, name in defect_type_choices
     }
 
+    # پرونده های هر پزشک از همون پرونده های فیلتر شده بخش شمرده میشن، نه یک کوئری برای هر پزشک
     doctor_cases = {}
     doctor_defects = {}
     for doc in doctors:
-        cases = SectionCase.objects.filter(group=group, section=section, doctor=doc)
-        cases = filtered(cases)
+        cases = [c for c in f_cases if c.doctor_id == doc.pk]
         doctor_cases[doc.full_name] = len(cases)
 
         defects = [c for c in cases if c.defect_sheet or c.defect_sheet2]
@@ -2228,55 +2239,10 @@ def analyze_section(section, group, start=None, end=None):
         'gender_counts': gender_counts,
     }
 
-def analyze_room(room, group, start=None, end=None):
-    try:
-        start_date = Persian(start).gregorian_datetime() if start else None
-        end_date = Persian(end).gregorian_datetime() if end else None
-    except:
-        start_date = end_date = None
-
-    def in_range(date_str):
-        try:
-            date = Persian(date_str).gregorian_datetime()
-            if start_date and end_date:
-                return start_date <= date <= end_date
-            return True
-        except:
-            return False
-
-    all_cases = RoomCase.objects.filter(group=group, room=room)
-    big_cases = all_cases.filter(operation_type='3')
-    medium_cases = all_cases.filter(operation_type='2')
-    small_cases = all_cases.filter(operation_type='1')
-
-    filtered = lambda qs: [obj for obj in qs if in_range(obj.operation_date)] if start_date and end_date else list(qs)
-
-    f_cases = filtered(all_cases)
-    f_big = filtered(big_cases)
-    f_medium = filtered(medium_cases)
-    f_small = filtered(small_cases)
-
-    f_doctors = {c.doctor for c in f_cases if c.doctor}
-    f_patients = {c.patient for c in f_cases if c.patient}
-
-    doctor_cases = {}
-    for doctor in room.doctor_rooms.all():
-        cases = RoomCase.objects.filter(group=group, room=room, doctor=doctor)
-        cases = filtered(cases)
-        doctor_cases[doctor.full_name] = len(cases)
-
-    return {
-        'room': room,
-        'doctors_count': len(f_doctors),
-        'patients_count': len(f_patients),
-        'filtered_room_cases_count': len(f_cases),
-        'filtered_big_room_cases_count': len(f_big),
-        'filtered_medium_room_cases_count': len(f_medium),
-        'filtered_small_room_cases_count': len(f_small),
-        'doctor_cases': doctor_cases,
-    }
-
 def analyze_doctor(doctor, group, start=None, end=None):
+    if use_frames():
+        return frames.doctor_metrics(frames.load_frames(group), doctor, start, end)
+
     try:
         start = Persian(start).gregorian_datetime() if start else None
         end = Persian(end).gregorian_datetime() if end else None
@@ -2310,22 +2276,24 @@ def analyze_doctor(doctor, group, start=None, end=None):
                     days.append((end_dt - start_dt).days)
         return round(sum(days) / len(days), 0) if days else 0
 
-    section_cases = SectionCase.objects.filter(group=group, doctor=doctor)
+    defect_sheet_fields = ['defect_sheet'] + [f'defect_sheet{i}' for i in range(2, 11)]
+    defect_type_fields = ['defect_type'] + [f'defect_type{i}' for i in range(2, 11)]
+
+    # پرونده های پزشک یکبار خونده میشن و زیرمجموعه ها (نوع عمل، بیمه، نقص) از همون ها جدا میشن
+    # تا تحلیل چند پزشک برای هر پزشک همون کوئری ها رو تکرار نکنه
+    section_cases = list(SectionCase.objects.filter(group=group, doctor=doctor))
     dc_section_cases = DC.objects.filter(group=group, doctor=doctor)
-    room_cases = RoomCase.objects.filter(group=group, doctor=doctor)
-    big_room_cases = room_cases.filter(operation_type='3')
-    medium_room_cases = room_cases.filter(operation_type='2')
-    small_room_cases = room_cases.filter(operation_type='1')
+    room_cases = list(RoomCase.objects.filter(group=group, doctor=doctor))
+    big_room_cases = [c for c in room_cases if c.operation_type == '3']
+    medium_room_cases = [c for c in room_cases if c.operation_type == '2']
+    small_room_cases = [c for c in room_cases if c.operation_type == '1']
 
-    not_arrived_cases = section_cases.filter(delivery_date='nan')
+    not_arrived_cases = [c for c in section_cases if c.delivery_date == 'nan']
 
-    defect_cases = section_cases.filter(
-        Q(defect_sheet__isnull=False) | Q(defect_sheet2__isnull=False) |
-        Q(defect_sheet3__isnull=False) | Q(defect_sheet4__isnull=False) |
-        Q(defect_sheet5__isnull=False) | Q(defect_sheet6__isnull=False) |
-        Q(defect_sheet7__isnull=False) | Q(defect_sheet8__isnull=False) |
-        Q(defect_sheet9__isnull=False) | Q(defect_sheet10__isnull=False)
-    )
+    defect_cases = [
+        c for c in section_cases
+        if any(getattr(c, field) is not None for field in defect_sheet_fields)
+    ]
     all_defect_cases = SectionCase.objects.filter(group=group).filter(
         Q(defect_sheet__isnull=False) | Q(defect_sheet2__isnull=False) |
         Q(defect_sheet3__isnull=False) | Q(defect_sheet4__isnull=False) |
@@ -2334,7 +2302,7 @@ def analyze_doctor(doctor, group, start=None, end=None):
         Q(defect_sheet9__isnull=False) | Q(defect_sheet10__isnull=False)
     )
 
-    insurance_filter = lambda s: section_cases.filter(insurance__icontains=s)
+    insurance_filter = lambda s: [c for c in section_cases if s in (c.insurance or '')]
     social_security_cases = insurance_filter("تامین اجتماعی")
     medical_services_cases = insurance_filter("خدمات درمانی")
     armed_forces_cases = insurance_filter("نیرو های مسلح")
@@ -2358,7 +2326,7 @@ def analyze_doctor(doctor, group, start=None, end=None):
     filtered_medium_room_cases = filter_by_date(medium_room_cases, 'operation_date')
     filtered_small_room_cases = filter_by_date(small_room_cases, 'operation_date')
 
-    f_patients = set(c.patient for c in filtered_section_cases + filtered_room_cases)
+    f_patients = set(c.patient_id for c in filtered_section_cases + filtered_room_cases)
     patients_count = len(f_patients)
 
     # نقص
@@ -2368,9 +2336,6 @@ def analyze_doctor(doctor, group, start=None, end=None):
     )
 
     # پراکندگی نقص
-    defect_sheet_fields = ['defect_sheet'] + [f'defect_sheet{i}' for i in range(2, 11)]
-    defect_type_fields = ['defect_type'] + [f'defect_type{i}' for i in range(2, 11)]
-
     defect_counts = {
         name: sum([
             1 for sc in section_cases
@@ -2438,7 +2403,7 @@ def analyze_doctor(doctor, group, start=None, end=None):
 @manager_required
 def multi_section_analysis(request):
     if request.method == 'POST':
-        form = MultiSectionForm(request.POST)
+        form = MultiSectionForm(request.POST, group=request.user.group)
         if form.is_valid():
             sections = form.cleaned_data['sections']
             start = form.cleaned_data['start']
@@ -2455,7 +2420,7 @@ def multi_section_analysis(request):
             }
             return render(request, 'multi_section_results.html', context)
     else:
-        form = MultiSectionForm()
+        form = MultiSectionForm(group=request.user.group)
 
     return render(request, 'multi_section_form.html', {'form': form})
 
@@ -2463,16 +2428,18 @@ def multi_section_analysis(request):
 @manager_required
 def multi_room_analysis(request):
     if request.method == 'POST':
-        form = MultiRoomForm(request.POST)
+        form = MultiRoomForm(request.POST, group=request.user.group)
         if form.is_valid():
             rooms = form.cleaned_data['rooms']
             start = form.cleaned_data['start']
             end = form.cleaned_data['end']
             
-            results = {}
-            for room in rooms:
-                data = analyze_room(room, request.user.group, start, end)
-                results[room.name] = data
+            # همه اتاق ها با یک کوئری تجمیعی تحلیل میشن
+            if use_frames():
+                analysis = frames.room_metrics(frames.load_frames(request.user.group), rooms, start, end)
+            else:
+                analysis = room_analysis(request.user.group, rooms, start, end)
+            results = {data['room'].name: data for data in analysis.values()}
             
             context = {
                 'form': form,
@@ -2480,7 +2447,7 @@ def multi_room_analysis(request):
             }
             return render(request, 'multi_room_results.html', context)
     else:
-        form = MultiRoomForm()
+        form = MultiRoomForm(group=request.user.group)
 
     return render(request, 'multi_room_form.html', {'form': form})
 
@@ -2488,7 +2455,7 @@ def multi_room_analysis(request):
 @manager_required
 def multi_doctor_analysis(request):
     if request.method == 'POST':
-        form = MultiDoctorForm(request.POST)
+        form = MultiDoctorForm(request.POST, group=request.user.group)
         if form.is_valid():
             doctors = form.cleaned_data['doctors']
             start = form.cleaned_data['start']
@@ -2505,106 +2472,69 @@ def multi_doctor_analysis(request):
             }
             return render(request, 'multi_doctor_results.html', context)
     else:
-        form = MultiDoctorForm()
+        form = MultiDoctorForm(group=request.user.group)
 
     return render(request, 'multi_doctor_form.html', {'form': form})
 
+def defect_percentages(section_cases):
+    # پراکندگی نقص ها و درصد هر کدوم از پرونده های نقص دار
+    defect_counts, defect_type_counts = defect_distribution(section_cases)
+    total_cases = section_cases.filter(DEFECT_Q).count() or 1
+    return {
+        'defect_counts': defect_counts,
+        'defect_type_counts': defect_type_counts,
+        'defect_percents': {
+            name: round((count / total_cases) * 100, 0)
+            for name, count in defect_counts.items()
+        },
+        'defect_type_percents': {
+            name: round((count / total_cases) * 100, 0)
+            for name, count in defect_type_counts.items()
+        },
+    }
+
 @login_required
 @manager_required
-def analyze_defect(request):
+async def analyze_defect(request):
     group = request.user.group
 
-    if Excel.objects.filter(group=group).exists():
-        section_cases = SectionCase.objects.filter(group=group)
+    if not await Excel.objects.filter(group=group).aexists():
+        return await sync_to_async(render)(request, 'main.html', context={})
 
-        # فیلتر بر اساس بخش اگر موجود باشد
-        section_param = request.GET.get("section")
-        if section_param:
-            section_cases = section_cases.filter(section=section_param)
-
-        # فیلتر بر اساس پزشک اگر موجود باشد
-        doctor_param = request.GET.get("doctor")
-        if doctor_param:
-            section_cases = section_cases.filter(doctor=doctor_param)
-
-        # آماده‌سازی داده نقص
-        defect_counts = {}
-        defect_percents = {}
-        defect_type_counts = {}
-        defect_type_percents = {}
-
-        filtered_section_cases = section_cases
-
-        if request.GET.get("start") and request.GET.get("end"):
-            try:
-                start = Persian(request.GET["start"]).gregorian_datetime()
-                end = Persian(request.GET["end"]).gregorian_datetime()
-                if start > end:
-                    start, end = end, start
-
-                filtered_section_cases = []
-                for case in section_cases:
-                    if isinstance(case.admission_date, str):
-                        try:
-                            case_date = Persian(case.admission_date).gregorian_datetime()
-                            if start <= case_date <= end:
-                                filtered_section_cases.append(case)
-                        except:
-                            continue
-            except:
-                pass
-        
-        defect_cases = filtered_section_cases.filter(
-            Q(defect_sheet__isnull=False) | Q(defect_sheet2__isnull=False) |
-            Q(defect_sheet3__isnull=False) | Q(defect_sheet4__isnull=False) |
-            Q(defect_sheet5__isnull=False) | Q(defect_sheet6__isnull=False) |
-            Q(defect_sheet7__isnull=False) | Q(defect_sheet8__isnull=False) |
-            Q(defect_sheet9__isnull=False) | Q(defect_sheet10__isnull=False)
-        )
-        
-        defect_sheet_fields = ['defect_sheet'] + [f'defect_sheet{i}' for i in range(2, 11)]
-        defect_type_fields = ['defect_type'] + [f'defect_type{i}' for i in range(2, 11)]
-
-        defect_counts = {
-            name: sum([
-                1 for sc in filtered_section_cases
-                if any(getattr(sc, field) == code for field in defect_sheet_fields)
-            ]) for code, name in defect_sheet_choices
-        }
+    section_cases = SectionCase.objects.filter(group=group)
 
-        defect_type_counts = {
-            name: sum([
-                1 for sc in filtered_section_cases
-                if any(
-                    getattr(sc, field) and code in getattr(sc, field)
-                    for field in defect_type_fields
-                )
-            ]) for code, name in defect_type_choices
-        }
+    # فیلتر بر اساس بخش اگر موجود باشد
+    section_param = request.GET.get("section")
+    if section_param:
+        section_cases = section_cases.filter(section=section_param)
 
-        total_cases = len(defect_cases) or 1
+    # فیلتر بر اساس پزشک اگر موجود باشد
+    doctor_param = request.GET.get("doctor")
+    if doctor_param:
+        section_cases = section_cases.filter(doctor=doctor_param)
 
-        defect_percents = {
-            name: round((count / total_cases) * 100, 0)
-            for name, count in defect_counts.items()
-        }
+    # بازه روی تاریخ پذیرش (ستون میلادی ایندکس دار)
+    start, end = request.GET.get("start"), request.GET.get("end")
+    start_date, end_date = date_range(start, end)
+    if start_date and end_date:
+        section_cases = section_cases.filter(admission__range=(start_date, end_date))
 
-        defect_type_percents = {
-            name: round((count / total_cases) * 100, 0)
-            for name, count in defect_type_counts.items()
-        }
+    if use_frames():
+        distribution = lambda: frames.defect_metrics(frames.load_frames(group), section_param, doctor_param, start, end)
+    else:
+        distribution = lambda: defect_percentages(section_cases)
+    results = await concurrency.gather(
+        distribution=distribution,
+        section_list=lambda: list(selected_choices(Section, group, section_param)),
+        doctor_list=lambda: list(selected_choices(Doctor, group, doctor_param)),
+    )
 
-        context = {
-            'defect_counts': defect_counts,
-            'defect_type_counts': defect_type_counts,
-            'defect_percents': defect_percents,
-            'defect_type_percents': defect_type_percents,
-            'section_list': Section.objects.filter(group=group),
-            'doctor_list': Doctor.objects.filter(group=group),
-            'selected_section': int(section_param) if section_param and section_param.isdigit() else None,
-            'selected_doctor': int(doctor_param) if doctor_param and doctor_param.isdigit() else None,
-        }
+    context = {
+        **results['distribution'],
+        'section_list': results['section_list'],
+        'doctor_list': results['doctor_list'],
+        'selected_section': int(section_param) if section_param and section_param.isdigit() else None,
+        'selected_doctor': int(doctor_param) if doctor_param and doctor_param.isdigit() else None,
+    }
 
-        return render(request, 'analyze_defect.html', context=context)
-    else:
-        return render(request, 'main.html', context={})
+    return await sync_to_async(render)(request, 'analyze_defect.html', context=context)